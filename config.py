@@ -29,6 +29,18 @@ class Settings(BaseSettings):
         "sqlite:///./cuadrante.db"
     )
     
+    # Pool de conexiones (solo PostgreSQL) y threadpool de endpoints síncronos
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "20"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "30"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    # Sin definir = DB_POOL_SIZE + DB_MAX_OVERFLOW (un hilo por conexión)
+    THREADPOOL_MAX_WORKERS: Optional[int] = (
+        int(os.getenv("THREADPOOL_MAX_WORKERS")) if os.getenv("THREADPOOL_MAX_WORKERS") else None
+    )
+    # Conexiones con las que se aplican los meses de una sincronización (solo
+    # PostgreSQL). 1 = una sola transacción; > 1 es más rápido pero no atómico
+    SYNC_WORKERS: int = int(os.getenv("SYNC_WORKERS", "1"))
+    
     # Corregir URLs postgres antiguas
     def __init__(self, **data):
         super().__init__(**data)
@@ -105,6 +117,11 @@ class Settings(BaseSettings):
         """¿Está en desarrollo?"""
         return self.ENVIRONMENT == "development"
     
+    @property
+    def threadpool_max_workers(self) -> int:
+        """Hilos del threadpool: por defecto, tantos como conexiones del pool"""
+        return self.THREADPOOL_MAX_WORKERS or self.DB_POOL_SIZE + self.DB_MAX_OVERFLOW
+    
     @property
     def database_is_postgresql(self) -> bool:
         """¿Usa PostgreSQL?"""
@@ -7,8 +7,11 @@ Permite acceso móvil a turnos, permutas y datos de empleados
 """
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+from sqlalchemy.orm import Session
+from typing import Optional
 import uvicorn
 import os
 import sys
@@ -45,6 +48,10 @@ log_info(f"Iniciando API - Ambiente: {settings.ENVIRONMENT}")
 
 # Importar routers (después de logging)
 from routers import auth, turnos, permutas, empleados, sync, vacaciones
+from models.database import get_db
+from services import cache_service
+from routers.dependencias import Identidad, get_identidad, get_empleado_db, verificar_acceso_empleado
+from utils.http_cache import CacheVersion, ValidadoresCache, pide_formato_compacto, respuesta_documento
 
 # --- MIGRACIÓN AUTOMÁTICA DE BASE DE DATOS ---
 def run_auto_migrations():
@@ -62,11 +69,18 @@ def run_auto_migrations():
             ("horas_trabajadas", "FLOAT DEFAULT 0.0"),
             ("horas_nocturnas", "FLOAT DEFAULT 0.0"),
             ("horas_festivas", "FLOAT DEFAULT 0.0"),
-            ("es_festivo", "BOOLEAN DEFAULT FALSE")
+            ("es_festivo", "BOOLEAN DEFAULT FALSE"),
+            ("fecha", "DATE")
         ],
         "config_turnos": [
             ("horas_total", "FLOAT DEFAULT 0.0"),
             ("horas_nocturnas", "FLOAT DEFAULT 0.0")
+        ],
+        "empleados": [
+            ("nombre_normalizado", "VARCHAR")
+        ],
+        "users": [
+            ("empleado_id", "INTEGER REFERENCES empleados(id)")
         ]
     }
     
@@ -87,17 +101,165 @@ def run_auto_migrations():
                 else:
                     # debug - log_info(f"La columna {col_name} ya existe en {table_name}.")
                     pass
+
+        # Índices únicos (se eliminan duplicados antes de crearlos)
+        unique_indexes = {
+            "turnos": [
+                (
+                    "uq_turnos_empleado_dia",
+                    "empleado_id, anio, mes, dia",
+                    "DELETE FROM turnos WHERE id NOT IN "
+                    "(SELECT MAX(id) FROM turnos GROUP BY empleado_id, anio, mes, dia)"
+                )
+            ]
+        }
+        for table_name, indexes in unique_indexes.items():
+            existing_indexes = [i["name"] for i in inspector.get_indexes(table_name)]
+            for index_name, index_cols, dedupe_sql in indexes:
+                if index_name in existing_indexes:
+                    continue
+                try:
+                    log_info(f"Creando índice único {index_name} en {table_name}...")
+                    conn.execute(text(dedupe_sql))
+                    conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {table_name} ({index_cols});"))
+                    conn.commit()
+                    log_info(f"Índice {index_name} creado con éxito.")
+                except Exception as e:
+                    conn.rollback()
+                    log_info(f"Error al crear índice {index_name}: {e}")
+
+    # Rellenar turnos.fecha en filas anteriores a la columna
+    from models.database import SessionLocal
+    from models.sql_models import Turno, TurnoResumen
+    from services import empleados_service, turnos_service
+    db = SessionLocal()
+    try:
+        rellenadas = turnos_service.rellenar_fechas(db)
+        if rellenadas:
+            db.commit()
+            log_info(f"Columna fecha rellenada en {rellenadas} turnos.")
+    except Exception as e:
+        db.rollback()
+        log_info(f"Error al rellenar turnos.fecha: {e}")
+    finally:
+        db.close()
+
+    # Rellenar empleados.nombre_normalizado (búsqueda por nombre)
+    db = SessionLocal()
+    try:
+        rellenados = empleados_service.rellenar_nombres_normalizados(db)
+        if rellenados:
+            db.commit()
+            log_info(f"Nombre normalizado rellenado en {rellenados} empleados.")
+    except Exception as e:
+        db.rollback()
+        log_info(f"Error al rellenar empleados.nombre_normalizado: {e}")
+    finally:
+        db.close()
+
+    # Vincular usuarios existentes con su empleado (por nombre o, si no, por email)
+    with engine.connect() as conn:
+        try:
+            resultado = conn.execute(text(
+                "UPDATE users SET empleado_id = COALESCE("
+                "(SELECT MIN(e.id) FROM empleados e WHERE e.nombre_completo = users.full_name), "
+                "(SELECT MIN(e.id) FROM empleados e WHERE lower(e.email) = lower(users.email))) "
+                "WHERE empleado_id IS NULL AND EXISTS ("
+                "SELECT 1 FROM empleados e WHERE e.nombre_completo = users.full_name "
+                "OR lower(e.email) = lower(users.email))"
+            ))
+            conn.commit()
+            if resultado.rowcount:
+                log_info(f"Vinculados {resultado.rowcount} usuarios con su empleado.")
+        except Exception as e:
+            conn.rollback()
+            log_info(f"Error al vincular usuarios con empleados: {e}")
+
+    # Índices simples que create_all no añade a tablas existentes
+    indexes = {
+        "turnos": [
+            ("ix_turnos_empleado_fecha", "empleado_id, fecha"),
+            ("ix_turnos_fecha_codigo", "fecha, codigo_turno"),
+        ],
+        "empleados": [
+            ("ix_empleados_nombre_normalizado", "nombre_normalizado, id"),
+        ],
+        "users": [
+            ("ix_users_empleado_id", "empleado_id"),
+        ],
+        "permutas": [
+            ("ix_permutas_fecha_id", "fecha_solicitud, id"),
+            ("ix_permutas_estado_fecha_id", "estado, fecha_solicitud, id"),
+            ("ix_permutas_solicitante", "solicitante_id"),
+            ("ix_permutas_receptor", "receptor_id"),
+        ],
+        "vacaciones": [
+            ("ix_vacaciones_fecha_id", "fecha_solicitud, id"),
+            ("ix_vacaciones_estado_fecha_id", "estado, fecha_solicitud, id"),
+            ("ix_vacaciones_solicitante_fecha", "solicitante_id, fecha_solicitud"),
+        ]
+    }
+    with engine.connect() as conn:
+        for table_name, table_indexes in indexes.items():
+            existing_indexes = [i["name"] for i in inspect(engine).get_indexes(table_name)]
+            for index_name, index_cols in table_indexes:
+                if index_name in existing_indexes:
+                    continue
+                try:
+                    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({index_cols});"))
+                    conn.commit()
+                    log_info(f"Índice {index_name} creado con éxito.")
+                except Exception as e:
+                    conn.rollback()
+                    log_info(f"Error al crear índice {index_name}: {e}")
+
+    # Rellenar agregados de balances si la tabla es nueva y ya hay turnos
+    db = SessionLocal()
+    try:
+        if db.query(TurnoResumen).first() is None and db.query(Turno).first() is not None:
+            log_info("Calculando turnos_resumen a partir de turnos...")
+            empleados_service.reconstruir_resumenes(db)
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        log_info(f"Error al calcular turnos_resumen: {e}")
+    finally:
+        db.close()
                     
     log_info("Migraciones finalizadas.")
 
 # Ejecutar antes de crear la APP
 run_auto_migrations()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arranque/parada de la aplicación"""
+    # Los endpoints síncronos (acceso a BD) se ejecutan en el threadpool de
+    # AnyIO; su tamaño limita cuántas peticiones concurrentes atiende un worker.
+    # Más hilos que conexiones solo harían esperar DB_POOL_TIMEOUT y fallar
+    import anyio.to_thread
+    hilos = settings.threadpool_max_workers
+    anyio.to_thread.current_default_thread_limiter().total_tokens = hilos
+    log_info(f"Threadpool configurado con {hilos} hilos")
+    if hilos > settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW:
+        log_info("Aviso: THREADPOOL_MAX_WORKERS supera DB_POOL_SIZE + DB_MAX_OVERFLOW")
+
+    # Trabajos de sincronización que dejó a medias un reinicio, y los pendientes
+    from models.database import SessionLocal
+    from services import sync_jobs_service
+    try:
+        sync_jobs_service.recuperar(SessionLocal)
+    except Exception as e:
+        log_info(f"Error al recuperar los trabajos de sincronización: {e}")
+    yield
+
+
 # Crear app FastAPI
 app = FastAPI(
     title=settings.API_TITLE,
     description="API REST para gestión de turnos y cuadrantes de vigilantes",
-    version=settings.API_VERSION
+    version=settings.API_VERSION,
+    lifespan=lifespan
 )
 
 # Configurar manejadores de error (antes de middlewares)
@@ -112,6 +274,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
@@ -146,142 +309,131 @@ async def root():
     }
 
 
+# ?format=compact (o Accept: application/vnd.cuadrante.compact+json) devuelve
+# los turnos en columnas; sin él, el formato de siempre (un objeto por día)
+PARAM_FORMATO = Query(None, alias="format", pattern="^(compact|json)$")
+
+
+def _schedule_vacio(anio: int, mes: int, compacto: bool, empleado=None) -> dict:
+    """
+    Mes sin datos con las mismas claves que los documentos cacheados del
+    formato pedido (incluido "formato": "compact")
+    """
+    if empleado is not None:
+        construir = cache_service.construir_schedule_compacto if compacto else cache_service.construir_schedule
+        return construir(empleado.id, empleado.nombre_completo, anio, mes, [])
+    if compacto:
+        return {"anio": anio, "mes": mes, "formato": "compact", "shifts": cache_service.construir_columnas([])}
+    return {"anio": anio, "mes": mes, "shifts": {}}
+
+
 @app.get("/api/schedule/{year}/{month}")
-async def get_schedule(
+def get_schedule(
     year: int, 
     month: int,
-    current_user: dict = Depends(auth.get_current_user)
+    request: Request,
+    formato: Optional[str] = PARAM_FORMATO,
+    empleado=Depends(get_empleado_db),
+    db: Session = Depends(get_db)
 ):
     """
     Obtiene el cuadrante de turnos para un mes específico
     Retorna los turnos solo para el usuario autenticado
     """
-    from models.database import SessionLocal
-    from models.sql_models import Turno, Empleado
-    
-    db = SessionLocal()
-    try:
-        # Obtener el empleado asociado al usuario actual
-        nombre_usuario = current_user.get("nombre")
-        empleado = db.query(Empleado).filter(Empleado.nombre_completo == nombre_usuario).first()
-        
-        if not empleado:
-            return {"anio": year, "mes": month, "shifts": {}}
-
-        # Obtener turnos del mes para este empleado
-        turnos = db.query(Turno).filter(
-            Turno.empleado_id == empleado.id,
-            Turno.anio == year,
-            Turno.mes == month
-        ).all()
-        
-        # Formatear como diccionario día -> objeto detallado
-        shifts = {
-            str(t.dia): {
-                "codigo": t.codigo_turno,
-                "t": t.horas_trabajadas,
-                "n": t.horas_nocturnas,
-                "f": t.horas_festivas,
-                "es_festivo": t.es_festivo
-            } 
-            for t in turnos
-        }
-        
-        return {
-            "anio": year,
-            "mes": month,
-            "shifts": shifts
-        }
-    finally:
-        db.close()
+    compacto = pide_formato_compacto(request, formato)
+    tipo = cache_service.TIPO_SCHEDULE_COMPACTO if compacto else cache_service.TIPO_SCHEDULE
+
+    if not empleado:
+        return _schedule_vacio(year, month, compacto)
+
+    # Documento pre-serializado en la sincronización (una búsqueda por clave primaria)
+    documento = cache_service.obtener_documento(db, tipo, empleado, year, month)
+    if not documento:
+        return _schedule_vacio(year, month, compacto, empleado)
+    return respuesta_documento(request, documento)
+
+
+@app.get("/api/schedule/range")
+def get_schedule_range(
+    request: Request,
+    desde: str = Query(..., alias="from", description="Primer mes (YYYY-MM)"),
+    hasta: str = Query(..., alias="to", description="Último mes (YYYY-MM), incluido"),
+    empleado_id: Optional[int] = None,
+    formato: Optional[str] = PARAM_FORMATO,
+    current_user: dict = Depends(auth.get_current_user),
+    identidad: Identidad = Depends(get_identidad),
+    db: Session = Depends(get_db),
+    cache: ValidadoresCache = Depends(CacheVersion())
+):
+    """
+    Obtiene el cuadrante de varios meses en una sola petición
+    (p. ej. ?from=2026-01&to=2026-12). Sin empleado_id devuelve el del
+    usuario autenticado; con empleado_id aplica los mismos permisos que
+    /api/schedule/{year}/{month}/empleado/{empleado_id}.
+    """
+    from models.sql_models import Empleado
+    from utils.validators import DateValidator, ValidationError
+
+    inicio = DateValidator.validate_date_string(desde, "%Y-%m")
+    fin = DateValidator.validate_date_string(hasta, "%Y-%m")
+    meses = (fin.year - inicio.year) * 12 + fin.month - inicio.month + 1
+    if meses < 1:
+        raise ValidationError("El mes final no puede ser anterior al inicial")
+    if meses > cache_service.MAX_MESES_RANGO:
+        raise ValidationError(f"Como máximo {cache_service.MAX_MESES_RANGO} meses por petición")
+
+    if empleado_id is None:
+        empleado = identidad.empleado
+    else:
+        verificar_acceso_empleado(current_user, identidad, empleado_id)
+        empleado = db.get(Empleado, empleado_id)
+
+    if cache.no_modificado:
+        return cache.respuesta_304()
+
+    compacto = pide_formato_compacto(request, formato)
+    if not empleado:
+        vacio = {"empleado_id": empleado_id, "desde": desde, "hasta": hasta, "meses": []}
+        if compacto:
+            vacio["formato"] = "compact"
+        return vacio
+    return cache_service.schedule_rango(
+        db, empleado, (inicio.year, inicio.month), (fin.year, fin.month), compacto=compacto
+    )
 
 
 @app.get("/api/schedule/{year}/{month}/empleado/{empleado_id}")
-async def get_schedule_by_employee(
+def get_schedule_by_employee(
     year: int, 
     month: int,
     empleado_id: int,
-    current_user: dict = Depends(auth.get_current_user)
+    request: Request,
+    formato: Optional[str] = PARAM_FORMATO,
+    current_user: dict = Depends(auth.get_current_user),
+    identidad: Identidad = Depends(get_identidad),
+    db: Session = Depends(get_db)
 ):
     """
     Obtiene el cuadrante de turnos para un empleado específico
     Solo permitido para coordinadores
     """
-    from models.database import SessionLocal
-    from models.sql_models import Turno, Empleado
-    from fastapi import HTTPException
-    
-    # Verificar que el usuario sea coordinador o que sea el propio empleado
-    if current_user.get("rol") != "coordinador":
-        db_perm = SessionLocal()
-        try:
-            from sqlalchemy import func
-            import logging
-            logger = logging.getLogger("uvicorn")
-            
-            nombre_usuario = current_user.get("nombre")
-            email_usuario = current_user.get("email")
-            
-            logger.info(f"🔍 Validando acceso: Usuario='{nombre_usuario}' ({email_usuario}) -> EmpleadoID={empleado_id}")
-            
-            # Buscar el ID del empleado del usuario actual (insensible a mayúsculas/espacios)
-            user_empleado = db_perm.query(Empleado).filter(
-                func.lower(func.trim(Empleado.nombre_completo)) == func.lower(func.trim(nombre_usuario))
-            ).first()
-            
-            # Fallback por email si el nombre no coincide exactamente
-            if not user_empleado and email_usuario:
-                user_empleado = db_perm.query(Empleado).filter(
-                    func.lower(func.trim(Empleado.email)) == func.lower(func.trim(email_usuario))
-                ).first()
-
-            if not user_empleado:
-                logger.error(f"❌ No se encontró empleado para '{nombre_usuario}' o '{email_usuario}'")
-                raise HTTPException(status_code=403, detail="Perfil de empleado no vinculado a tu cuenta")
-            
-            if user_empleado.id != empleado_id:
-                logger.error(f"❌ Intento de acceso a ID ajeno: UserEmpID={user_empleado.id} vs RequestedID={empleado_id}")
-                raise HTTPException(status_code=403, detail="No tienes permiso para ver el cuadrante de otro compañero")
-                
-            logger.info(f"✅ Acceso concedido a {user_empleado.nombre_completo}")
-        finally:
-            db_perm.close()
-    
-    db = SessionLocal()
-    try:
-        # Verificar que el empleado existe
-        empleado = db.query(Empleado).filter(Empleado.id == empleado_id).first()
-        if not empleado:
-            return {"anio": year, "mes": month, "shifts": {}}
-
-        # Obtener turnos del mes para este empleado
-        turnos = db.query(Turno).filter(
-            Turno.empleado_id == empleado_id,
-            Turno.anio == year,
-            Turno.mes == month
-        ).all()
-        
-        # Formatear como diccionario día -> objeto detallado
-        shifts = {
-            str(t.dia): {
-                "codigo": t.codigo_turno,
-                "t": t.horas_trabajadas,
-                "n": t.horas_nocturnas,
-                "f": t.horas_festivas,
-                "es_festivo": t.es_festivo
-            } 
-            for t in turnos
-        }
-        
-        return {
-            "anio": year,
-            "mes": month,
-            "empleado_id": empleado_id,
-            "empleado_nombre": empleado.nombre_completo,
-            "shifts": shifts
-        }
-    finally:
-        db.close()
+    from models.sql_models import Empleado
+
+    # Coordinador, o el propio empleado
+    verificar_acceso_empleado(current_user, identidad, empleado_id)
+
+    compacto = pide_formato_compacto(request, formato)
+    tipo = cache_service.TIPO_SCHEDULE_COMPACTO if compacto else cache_service.TIPO_SCHEDULE
+
+    # Verificar que el empleado existe
+    empleado = db.get(Empleado, empleado_id)
+    if not empleado:
+        return _schedule_vacio(year, month, compacto)
+
+    documento = cache_service.obtener_documento(db, tipo, empleado, year, month)
+    if not documento:
+        return _schedule_vacio(year, month, compacto, empleado)
+    return respuesta_documento(request, documento)
 
 
 @app.get("/health")
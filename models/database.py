@@ -1,8 +1,12 @@
 from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+import io
 import os
 
+from config import settings
+
 # Por defecto usamos SQLite local para desarrollo
 # En producción (Railway) usaremos la variable DATABASE_URL
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./cuadrante.db")
@@ -11,9 +15,20 @@ SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./cuadrante.db")
 if SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
     SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in SQLALCHEMY_DATABASE_URL else {}
-)
+if "sqlite" in SQLALCHEMY_DATABASE_URL:
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    )
+else:
+    # Los endpoints síncronos corren en el threadpool: el pool debe aguantar
+    # tantas conexiones simultáneas como hilos atiendan peticiones con BD
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_pre_ping=True
+    )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -24,3 +39,103 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def _sin_duplicados(rows, index_elements):
+    """Una fila por clave (gana la última): un ON CONFLICT no puede tocar dos veces la misma fila"""
+    unicas = {tuple(row[col] for col in index_elements): row for row in rows}
+    return rows if len(unicas) == len(rows) else list(unicas.values())
+
+
+def upsert(db, table, rows, index_elements, update_columns):
+    """
+    INSERT ... ON CONFLICT (index_elements) DO UPDATE en bloque.
+    Soporta PostgreSQL y SQLite; en otros motores borra por clave e inserta.
+    Con filas repetidas por clave gana la última.
+    """
+    if not rows:
+        return
+
+    rows = _sin_duplicados(rows, index_elements)
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(index_elements),
+            set_={col: stmt.excluded[col] for col in update_columns}
+        )
+        db.execute(stmt, rows)
+    else:
+        for row in rows:
+            db.execute(table.delete().where(
+                *(table.c[col] == row[col] for col in index_elements)
+            ))
+        db.execute(table.insert(), rows)
+
+
+def _valor_copy(valor) -> str:
+    """Campo CSV para COPY: NULL sin comillas, el resto entre comillas"""
+    if valor is None:
+        return "\\N"
+    if isinstance(valor, bool):
+        return "t" if valor else "f"
+    if isinstance(valor, (int, float)):
+        return repr(valor)
+    texto = valor.isoformat() if hasattr(valor, "isoformat") else str(valor)
+    return '"' + texto.replace('"', '""') + '"'
+
+
+def _copiar(cursor, sql: str, datos: str) -> bool:
+    """COPY ... FROM STDIN con psycopg2 o psycopg 3 (False si el driver no lo soporta)"""
+    if hasattr(cursor, "copy_expert"):  # psycopg2
+        cursor.copy_expert(sql, io.StringIO(datos))
+        return True
+    if hasattr(cursor, "copy"):  # psycopg 3
+        with cursor.copy(sql) as copia:
+            copia.write(datos)
+        return True
+    return False
+
+
+def upsert_masivo(db, table, rows, index_elements, update_columns):
+    """
+    Igual que upsert(), pero en PostgreSQL carga las filas con COPY en una
+    tabla temporal de staging y las fusiona en la tabla con un único
+    INSERT ... SELECT ... ON CONFLICT DO UPDATE (mucho más rápido que un
+    INSERT por fila). En otros motores, o si el driver no soporta COPY,
+    usa upsert() (executemany). Con filas repetidas por clave gana la última.
+    """
+    if not rows:
+        return
+
+    if db.get_bind().dialect.name != "postgresql":
+        upsert(db, table, rows, index_elements, update_columns)
+        return
+
+    rows = _sin_duplicados(rows, index_elements)
+
+    columnas = list(rows[0].keys())
+    staging = f"{table.name}_staging"
+    lista = ", ".join(columnas)
+    datos = "".join(
+        ",".join(_valor_copy(row[col]) for col in columnas) + "\n" for row in rows
+    )
+
+    cursor = db.connection().connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {staging} ON COMMIT DELETE ROWS "
+            f"AS SELECT {lista} FROM {table.name} WITH NO DATA"
+        )
+        if not _copiar(cursor, f"COPY {staging} ({lista}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", datos):
+            upsert(db, table, rows, index_elements, update_columns)
+            return
+        actualizar = ", ".join(f"{col} = EXCLUDED.{col}" for col in update_columns)
+        cursor.execute(
+            f"INSERT INTO {table.name} ({lista}) SELECT {lista} FROM {staging} "
+            f"ON CONFLICT ({', '.join(index_elements)}) DO UPDATE SET {actualizar}"
+        )
+        cursor.execute(f"TRUNCATE {staging}")
+    finally:
+        cursor.close()
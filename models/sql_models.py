@@ -1,7 +1,30 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Float
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Date, DateTime, Float, Index, LargeBinary
+from sqlalchemy.orm import relationship, validates
 from .database import Base
-from datetime import datetime
+from datetime import date, datetime
+from typing import Optional
+import unicodedata
+
+def fecha_turno(anio: int, mes: int, dia: int) -> Optional[date]:
+    """Fecha de un turno a partir de año/mes/día (None si no es una fecha válida)"""
+    try:
+        return date(int(anio), int(mes), int(dia))
+    except (TypeError, ValueError):
+        return None
+
+def normalizar_nombre(nombre: Optional[str]) -> str:
+    """Nombre para búsquedas: sin acentos, en minúsculas y con espacios simples"""
+    if not nombre:
+        return ""
+    sin_acentos = "".join(
+        c for c in unicodedata.normalize("NFKD", nombre) if not unicodedata.combining(c)
+    )
+    return " ".join(sin_acentos.lower().split())
+
+def _fecha_por_defecto(context) -> Optional[date]:
+    """Rellena turnos.fecha en los INSERT que no la indican"""
+    params = context.get_current_parameters()
+    return fecha_turno(params.get("anio"), params.get("mes"), params.get("dia"))
 
 class User(Base):
     __tablename__ = "users"
@@ -12,12 +35,20 @@ class User(Base):
     full_name = Column(String)
     role = Column(String, default="vigilante")  # coordinador, vigilante
     is_active = Column(Boolean, default=True)
+    empleado_id = Column(Integer, ForeignKey("empleados.id"), nullable=True, index=True) # Vinculado en cada sync
+
+    empleado = relationship("Empleado")
 
 class Empleado(Base):
     __tablename__ = "empleados"
+    __table_args__ = (
+        # Listado ordenado por nombre (cursor) y búsqueda por prefijo
+        Index("ix_empleados_nombre_normalizado", "nombre_normalizado", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     nombre_completo = Column(String, index=True)
+    nombre_normalizado = Column(String, nullable=True) # normalizar_nombre(nombre_completo)
     email = Column(String, nullable=True)
     telefono = Column(String, nullable=True)
     dni = Column(String, nullable=True)
@@ -27,14 +58,27 @@ class Empleado(Base):
     # Relación con turnos
     turnos = relationship("Turno", back_populates="empleado")
 
+    @validates("nombre_completo")
+    def _actualizar_nombre_normalizado(self, key, nombre):
+        self.nombre_normalizado = normalizar_nombre(nombre)
+        return nombre
+
 class Turno(Base):
     __tablename__ = "turnos"
+    __table_args__ = (
+        # Un único turno por empleado y día; también sirve a las consultas por (empleado, año, mes)
+        Index("uq_turnos_empleado_dia", "empleado_id", "anio", "mes", "dia", unique=True),
+        # Consultas por rango de fechas (próximos días, cobertura)
+        Index("ix_turnos_empleado_fecha", "empleado_id", "fecha"),
+        Index("ix_turnos_fecha_codigo", "fecha", "codigo_turno"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     empleado_id = Column(Integer, ForeignKey("empleados.id"))
     anio = Column(Integer)
     mes = Column(Integer)
     dia = Column(Integer)
+    fecha = Column(Date, default=_fecha_por_defecto, nullable=True) # anio/mes/dia como fecha real
     codigo_turno = Column(String) # N, D, L, etc.
     
     # Campos de cálculo maestro (enviados desde el escritorio)
@@ -45,6 +89,51 @@ class Turno(Base):
     
     empleado = relationship("Empleado", back_populates="turnos")
 
+class TurnoResumen(Base):
+    """Agregado mensual de horas y días por empleado (se mantiene en cada sync)"""
+    __tablename__ = "turnos_resumen"
+
+    empleado_id = Column(Integer, ForeignKey("empleados.id"), primary_key=True)
+    anio = Column(Integer, primary_key=True)
+    mes = Column(Integer, primary_key=True)
+    horas_trabajadas = Column(Float, default=0.0)
+    horas_nocturnas = Column(Float, default=0.0)
+    horas_festivas = Column(Float, default=0.0)
+    dias_trabajados = Column(Integer, default=0)
+    dias_vacaciones = Column(Integer, default=0) # código V
+    dias_baja = Column(Integer, default=0) # código B
+
+class HashMes(Base):
+    """Huella del contenido sincronizado por empleado y mes (sincronización delta)"""
+    __tablename__ = "sync_hashes"
+
+    empleado_id = Column(Integer, ForeignKey("empleados.id"), primary_key=True)
+    anio = Column(Integer, primary_key=True)
+    mes = Column(Integer, primary_key=True)
+    hash_contenido = Column(String) # sha256 hex del JSON canónico de los turnos
+    fecha_sync = Column(DateTime, default=datetime.utcnow)
+
+class DocumentoCache(Base):
+    """Respuesta JSON pre-serializada por empleado y mes (se regenera en cada sync)"""
+    __tablename__ = "documentos_cache"
+
+    tipo = Column(String, primary_key=True) # schedule, calendario
+    empleado_id = Column(Integer, ForeignKey("empleados.id"), primary_key=True)
+    anio = Column(Integer, primary_key=True)
+    mes = Column(Integer, primary_key=True)
+    contenido = Column(LargeBinary)
+    contenido_gzip = Column(LargeBinary, nullable=True)
+    etag = Column(String)
+    generado = Column(DateTime, default=datetime.utcnow)
+
+class VersionDatos(Base):
+    """Contadores de versión de los datos (validadores HTTP e invalidación de cachés)"""
+    __tablename__ = "versiones_datos"
+
+    clave = Column(String, primary_key=True) # datos, config_turnos...
+    version = Column(Integer, default=0)
+    actualizado = Column(DateTime, default=datetime.utcnow)
+
 class ConfiguracionTurno(Base):
     __tablename__ = "config_turnos"
     
@@ -57,6 +146,13 @@ class ConfiguracionTurno(Base):
 
 class Permuta(Base):
     __tablename__ = "permutas"
+    __table_args__ = (
+        # Listados de coordinador: orden (fecha_solicitud, id) con o sin filtro de estado
+        Index("ix_permutas_fecha_id", "fecha_solicitud", "id"),
+        Index("ix_permutas_estado_fecha_id", "estado", "fecha_solicitud", "id"),
+        Index("ix_permutas_solicitante", "solicitante_id"),
+        Index("ix_permutas_receptor", "receptor_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     solicitante_id = Column(Integer, ForeignKey("users.id"))
@@ -74,6 +170,11 @@ class Permuta(Base):
 
 class Vacacion(Base):
     __tablename__ = "vacaciones"
+    __table_args__ = (
+        Index("ix_vacaciones_fecha_id", "fecha_solicitud", "id"),
+        Index("ix_vacaciones_estado_fecha_id", "estado", "fecha_solicitud", "id"),
+        Index("ix_vacaciones_solicitante_fecha", "solicitante_id", "fecha_solicitud"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     solicitante_id = Column(Integer, ForeignKey("users.id"))
@@ -87,3 +188,46 @@ class Vacacion(Base):
 
     solicitante = relationship("User", foreign_keys=[solicitante_id])
 
+
+class TrabajoSync(Base):
+    """Sincronización encolada (POST /api/sync/jobs): datos, estado y progreso"""
+    __tablename__ = "sync_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    estado = Column(String, default="pendiente", index=True) # pendiente, en_curso, completado, error, reemplazado
+    modo = Column(String, default="completo")
+    solicitado_por = Column(String, nullable=True)
+    datos = Column(LargeBinary, nullable=True) # JSON del desktop en gzip (se borra al terminar)
+    reemplazado_por = Column(Integer, nullable=True) # trabajo completo posterior que lo sustituye
+
+    empleados_procesados = Column(Integer, default=0)
+    meses_actualizados = Column(Integer, default=0)
+    meses_omitidos = Column(Integer, default=0)
+    filas_escritas = Column(Integer, default=0)
+    error = Column(String, nullable=True)
+
+    creado = Column(DateTime, default=datetime.utcnow)
+    iniciado = Column(DateTime, nullable=True)
+    finalizado = Column(DateTime, nullable=True)
+
+class SesionSync(Base):
+    """Sincronización por trozos (/api/sync/sesiones): se confirma de una vez al final"""
+    __tablename__ = "sync_sesiones"
+
+    id = Column(String, primary_key=True) # uuid4 hex
+    estado = Column(String, default="abierta") # abierta, confirmada
+    modo = Column(String, default="completo")
+    solicitado_por = Column(String, nullable=True)
+    estadisticas = Column(String, nullable=True) # JSON con el resultado de la confirmación
+    creado = Column(DateTime, default=datetime.utcnow, index=True)
+    actualizado = Column(DateTime, default=datetime.utcnow)
+
+class TrozoSync(Base):
+    """Trozo recibido de una sesión de sincronización (JSON parcial del desktop, en gzip)"""
+    __tablename__ = "sync_trozos"
+
+    sesion_id = Column(String, ForeignKey("sync_sesiones.id"), primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    checksum = Column(String) # sha256 hex del JSON sin comprimir
+    datos = Column(LargeBinary)
+    recibido = Column(DateTime, default=datetime.utcnow)
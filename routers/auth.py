@@ -8,6 +8,7 @@ import os
 import fastapi
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, EmailStr
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
@@ -46,31 +47,30 @@ class UserInfo(BaseModel):
     rol: str
 
 # Dependencia para obtener usuario actual
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> dict:
     """
     Obtiene usuario actual desde el token JWT.
     
     En entorno de desarrollo/tests, si el token es 'fake_token', se mapea
-    automáticamente al primer usuario de la base de datos para permitir
+    automáticamente al primer usuario de la base de datos (la misma sesión
+    que usa la petición) para permitir
     probar validaciones de negocio sin necesidad de JWT real.
     """
     # Modo pruebas: aceptar token "fake_token" si NO estamos en producción
     if token == "fake_token" and os.getenv("ENVIRONMENT", "development") != "production":
-        db = SessionLocal()
-        try:
-            # Buscar usuario por email "test@example.com" primero (el que crean los tests)
-            user = db.query(User).filter(User.email == "test@example.com").first()
-            # Si no existe, tomar el primero disponible
-            if not user:
-                user = db.query(User).first()
-            if user:
-                return {
-                    "email": user.email,
-                    "nombre": user.full_name,
-                    "rol": user.role,
-                }
-        finally:
-            db.close()
+        # Buscar usuario por email "test@example.com" primero (el que crean los tests)
+        user = db.query(User).filter(User.email == "test@example.com").first()
+        # Si no existe, tomar el primero disponible
+        if not user:
+            user = db.query(User).first()
+        if user:
+            return {
+                "email": user.email,
+                "nombre": user.full_name,
+                "rol": user.role,
+                "user_id": user.id,
+                "empleado_id": user.empleado_id,
+            }
         # Fallback genérico si no hay usuarios en BD (pero esto debería ser raro en tests)
         return {
             "email": "test@example.com",
@@ -89,7 +89,13 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
-        return {"email": email, "nombre": payload.get("nombre"), "rol": payload.get("rol")}
+        return {
+            "email": email,
+            "nombre": payload.get("nombre"),
+            "rol": payload.get("rol"),
+            "user_id": payload.get("user_id"),
+            "empleado_id": payload.get("empleado_id"),
+        }
     except JWTError:
         raise credentials_exception
 
@@ -124,7 +130,8 @@ async def login(request: fastapi.Request, db: Session = Depends(get_db)):
             detail="Email y contraseña son requeridos"
         )
     
-    user = auth_service.authenticate_user(db, username, password)
+    # Consulta a BD y verificación sha256_crypt fuera del event loop
+    user = await run_in_threadpool(auth_service.authenticate_user, db, username, password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -133,13 +140,7 @@ async def login(request: fastapi.Request, db: Session = Depends(get_db)):
         )
     
     # Crear token JWT
-    user_data = {
-        "sub": user.email,
-        "nombre": user.full_name,
-        "rol": user.role
-    }
-    
-    access_token = security.create_access_token(data=user_data)
+    access_token = security.create_access_token(data=auth_service.datos_token(user))
     
     return {
         "access_token": access_token,
@@ -159,7 +160,7 @@ async def get_me(current_user: dict = Depends(get_current_user)):
     return current_user
 
 @router.post("/register")
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+def register(user: UserCreate, db: Session = Depends(get_db)):
     """
     Registro de nuevo usuario
     """
@@ -194,7 +195,7 @@ class LoginJSON(BaseModel):
 
 # Endpoint adicional: login con JSON
 @router.post("/login-json", response_model=Token)
-async def login_json(credentials: LoginJSON, db: Session = Depends(get_db)):
+def login_json(credentials: LoginJSON, db: Session = Depends(get_db)):
     """
     Login de usuario con JSON (alternativa a form-data)
     Devuelve token JWT si las credenciales son correctas
@@ -208,13 +209,7 @@ async def login_json(credentials: LoginJSON, db: Session = Depends(get_db)):
         )
     
     # Crear token JWT
-    user_data = {
-        "sub": user.email,
-        "nombre": user.full_name,
-        "rol": user.role
-    }
-    
-    access_token = security.create_access_token(data=user_data)
+    access_token = security.create_access_token(data=auth_service.datos_token(user))
     
     return {
         "access_token": access_token,
@@ -228,7 +223,7 @@ async def login_json(credentials: LoginJSON, db: Session = Depends(get_db)):
 
 
 @router.post("/cambiar-password")
-async def cambiar_password(
+def cambiar_password(
     request: ChangePasswordRequest,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -237,9 +232,13 @@ async def cambiar_password(
     Cambia la contraseña del usuario actual
     """
     # Obtener usuario de BD
-    user = auth_service.get_user_by_email(db, current_user['email'])
+    user = auth_service.get_usuario_actual(db, current_user)
     if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Usuario del token no encontrado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     
     # Verificar contraseña actual usando el mismo contexto que el resto del sistema
     if not security.verify_password(request.password_actual, user.hashed_password):
@@ -256,23 +255,21 @@ async def cambiar_password(
 
 
 @router.post("/refresh", response_model=Token)
-async def refresh_token(current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+def refresh_token(current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
     """
     Refresca el token JWT del usuario actual
     """
     # Obtener usuario actualizado de BD
-    user = auth_service.get_user_by_email(db, current_user['email'])
+    user = auth_service.get_usuario_actual(db, current_user)
     if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Usuario del token no encontrado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     
     # Crear nuevo token
-    user_data = {
-        "sub": user.email,
-        "nombre": user.full_name,
-        "rol": user.role
-    }
-    
-    access_token = security.create_access_token(data=user_data)
+    access_token = security.create_access_token(data=auth_service.datos_token(user))
     
     return {
         "access_token": access_token,
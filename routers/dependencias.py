@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Dependencias compartidas por los routers
+"""
+
+from fastapi import Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from typing import Dict, Any, Optional, Tuple
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+from models import sql_models
+from models.database import get_db
+from routers.auth import get_current_user
+from services import auth_service, config_turnos_service
+
+logger = logging.getLogger("uvicorn")
+
+# Caché de identidades: sujeto del token -> (caduca, user_id, empleado_id)
+IDENTIDAD_TTL_SEGUNDOS = 60
+IDENTIDAD_MAX_ENTRADAS = 1024
+_identidades: "OrderedDict[str, Tuple[float, int, Optional[int]]]" = OrderedDict()
+_identidades_lock = threading.Lock()
+
+
+def get_config_turnos(db: Session = Depends(get_db)) -> Dict[str, Dict[str, Any]]:
+    """Configuración de turnos (código -> datos) desde la caché del proceso"""
+    return config_turnos_service.obtener(db)
+
+
+class Identidad:
+    """Usuario y empleado del token, resueltos una sola vez por petición"""
+
+    def __init__(self, db: Session, usuario: Optional[sql_models.User], empleado_id: Optional[int]):
+        self._db = db
+        self.usuario = usuario
+        self.empleado_id = empleado_id
+
+    @property
+    def empleado(self) -> Optional[sql_models.Empleado]:
+        """Empleado vinculado (búsqueda por clave primaria, sale del identity map)"""
+        if self.empleado_id is None:
+            return None
+        return self._db.get(sql_models.Empleado, self.empleado_id)
+
+
+def _identidad_cacheada(sujeto: str) -> Optional[Tuple[int, Optional[int]]]:
+    with _identidades_lock:
+        entrada = _identidades.get(sujeto)
+        if not entrada:
+            return None
+        caduca, user_id, empleado_id = entrada
+        if caduca < time.monotonic():
+            del _identidades[sujeto]
+            return None
+        _identidades.move_to_end(sujeto)
+        return user_id, empleado_id
+
+
+def _guardar_identidad(sujeto: str, user_id: int, empleado_id: Optional[int]) -> None:
+    with _identidades_lock:
+        _identidades[sujeto] = (time.monotonic() + IDENTIDAD_TTL_SEGUNDOS, user_id, empleado_id)
+        _identidades.move_to_end(sujeto)
+        while len(_identidades) > IDENTIDAD_MAX_ENTRADAS:
+            _identidades.popitem(last=False)
+
+
+def limpiar_identidades() -> None:
+    """Vacía la caché de identidades del proceso"""
+    with _identidades_lock:
+        _identidades.clear()
+
+
+def get_identidad(
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+) -> Identidad:
+    """
+    Resuelve el User y el Empleado del token. Con el claim user_id, o con
+    una entrada reciente de la caché, basta una búsqueda por clave primaria
+    (el empleado es el vinculado al usuario en la BD, no el del claim); si
+    no, se busca por email y el resultado se cachea unos segundos.
+    401 si el sujeto del token no existe: no hay usuarios de reserva.
+    """
+    sujeto = current_user.get("email") or ""
+    user_id = current_user.get("user_id")
+    empleado_id = None
+    empleado_resuelto = False
+
+    cacheada = _identidad_cacheada(sujeto)
+    if cacheada:
+        if user_id is None:
+            user_id = cacheada[0]
+        if cacheada[0] == user_id:
+            empleado_id, empleado_resuelto = cacheada[1], True
+
+    usuario = db.get(sql_models.User, user_id) if user_id is not None else None
+    if usuario is None or usuario.email != sujeto:
+        # Sin id, o id reutilizado por otro usuario: resolver por email
+        usuario = auth_service.get_user_by_email(db, sujeto) if sujeto else None
+        empleado_id, empleado_resuelto = None, False
+    if usuario is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Usuario del token no encontrado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    # El vínculo con el empleado se toma de la BD y no del claim empleado_id,
+    # que puede haber quedado obsoleto durante la vida del token
+    if usuario.empleado_id is not None:
+        empleado_id, empleado_resuelto = usuario.empleado_id, True
+
+    if not empleado_resuelto:
+        empleado = auth_service.get_empleado_actual(
+            db, {**current_user, "user_id": usuario.id}
+        )
+        empleado_id = empleado.id if empleado else None
+
+    _guardar_identidad(sujeto, usuario.id, empleado_id)
+    return Identidad(db, usuario, empleado_id)
+
+
+def get_usuario_db(identidad: Identidad = Depends(get_identidad)) -> Optional[sql_models.User]:
+    """User de BD del usuario actual (None si no existe)"""
+    return identidad.usuario
+
+
+def get_empleado_db(identidad: Identidad = Depends(get_identidad)) -> Optional[sql_models.Empleado]:
+    """Empleado vinculado al usuario actual (None si no tiene)"""
+    return identidad.empleado
+
+
+def verificar_acceso_empleado(current_user: dict, identidad: Identidad, empleado_id: int) -> None:
+    """
+    Comprueba que el usuario puede ver los datos del empleado: los
+    coordinadores ven a cualquiera, el resto solo a sí mismos (403 si no).
+    """
+    if current_user.get("rol") == "coordinador":
+        return
+
+    nombre_usuario = current_user.get("nombre")
+    email_usuario = current_user.get("email")
+    logger.info(f"🔍 Validando acceso: Usuario='{nombre_usuario}' ({email_usuario}) -> EmpleadoID={empleado_id}")
+
+    # Empleado vinculado al usuario (claim del token o caché de identidades)
+    user_empleado_id = identidad.empleado_id
+
+    if user_empleado_id is None:
+        logger.error(f"❌ No se encontró empleado para '{nombre_usuario}' o '{email_usuario}'")
+        raise HTTPException(status_code=403, detail="Perfil de empleado no vinculado a tu cuenta")
+
+    if user_empleado_id != empleado_id:
+        logger.error(f"❌ Intento de acceso a ID ajeno: UserEmpID={user_empleado_id} vs RequestedID={empleado_id}")
+        raise HTTPException(status_code=403, detail="No tienes permiso para ver el cuadrante de otro compañero")
+
+    logger.info(f"✅ Acceso concedido a EmpleadoID={empleado_id}")
@@ -4,16 +4,20 @@ Router de empleados
 Endpoints para consultar información de empleados
 """
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Response
 from pydantic import BaseModel
 from typing import Optional
 import sys
-import os
 
 sys.path.append('..')
 from routers.auth import get_current_user
-from routers.turnos import cargar_datos_desktop
+from utils.desktop_data import cargar_datos_desktop
 from models import sql_models
+from models.database import get_db
+from sqlalchemy.orm import Session
+from routers.dependencias import Identidad, get_identidad, get_usuario_db
+from utils.http_cache import CacheVersion, ValidadoresCache
+from utils.pagination import CABECERA_CURSOR
 
 router = APIRouter()
 
@@ -39,12 +43,21 @@ class EmpleadoResponse(BaseModel):
 
 # Endpoints
 @router.get("/", response_model=list[EmpleadoResponse])
-async def listar_empleados(
+def listar_empleados(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    current_user=Depends(get_current_user)
+    cursor: Optional[str] = None,
+    q: Optional[str] = Query(None, max_length=100),
+    current_user=Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
-    """Listar todos los empleados con paginación"""
+    """
+    Listar empleados ordenados por nombre, con paginación por cursor.
+    q busca por prefijo del nombre sin distinguir mayúsculas ni acentos.
+    El cursor de la página siguiente va en la cabecera X-Next-Cursor
+    (skip se mantiene por compatibilidad y solo se aplica sin cursor).
+    """
     # Validar paginación
     from utils.validators import PaginationValidator
     from utils.error_handlers import ValidationError
@@ -53,16 +66,18 @@ async def listar_empleados(
         PaginationValidator.validate_pagination(skip, limit)
     except ValidationError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    
-    from models.database import SessionLocal
-    db = SessionLocal()
-    empleados = db.query(sql_models.Empleado).offset(skip).limit(limit).all()
-    db.close()
+
+    try:
+        empleados, siguiente = empleados_service.buscar_empleados(db, limit, cursor=cursor, q=q, skip=skip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
     return empleados
 
 
 @router.get("/perfil", response_model=PerfilEmpleado)
-async def get_perfil(current_user: dict = Depends(get_current_user)):
+def get_perfil(current_user: dict = Depends(get_current_user)):
     """
     Obtiene el perfil del empleado actual
     """
@@ -81,8 +96,6 @@ async def get_perfil(current_user: dict = Depends(get_current_user)):
 
 
 from services import empleados_service
-from models.database import get_db
-from sqlalchemy.orm import Session
 
 class BalanceResponse(BaseModel):
     anio: int
@@ -94,11 +107,13 @@ class BalanceResponse(BaseModel):
     dias_baja: int
 
 @router.get("/balance/{anio}", response_model=BalanceResponse)
-async def get_balance_anual(
+def get_balance_anual(
     anio: int,
     id_empleado: Optional[int] = None,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    identidad: Identidad = Depends(get_identidad),
+    db: Session = Depends(get_db),
+    cache: ValidadoresCache = Depends(CacheVersion())
 ):
     """
     Obtiene el balance de horas del año.
@@ -114,35 +129,22 @@ async def get_balance_anual(
         from fastapi import HTTPException
         raise HTTPException(status_code=400, detail=str(e))
 
+    # Sin cambios desde la última vez que el cliente lo pidió
+    if cache.no_modificado:
+        return cache.respuesta_304()
+
     # Determinar qué empleado consultar
-    if id_empleado and current_user.get('role') == 'coordinador':
-        empleado = db.query(sql_models.Empleado).filter(sql_models.Empleado.id == id_empleado).first()
+    if id_empleado and current_user.get('rol') == 'coordinador':
+        empleado = db.get(sql_models.Empleado, id_empleado)
     else:
-        # 1. Obtener usuario de BD para tener su ID
-        from services import auth_service
-        user_db = auth_service.get_user_by_email(db, current_user['email'])
-        if not user_db:
-             # Fallback si por alguna razón extraña no está en BD pero tiene token
-            return BalanceResponse(
-                anio=anio,
-                total_horas_trabajadas=0,
-                horas_convenio=1768,
-                balance_horas=0,
-                dias_trabajados=0,
-                dias_vacaciones=0,
-                dias_baja=0
-            )
-        
-        # Buscar el Empleado asociado al User
-        empleado = db.query(sql_models.Empleado).filter(
-            sql_models.Empleado.nombre_completo == user_db.full_name
-        ).first()
+        # Empleado vinculado al usuario (resuelto una vez por petición)
+        empleado = identidad.empleado
     
     if not empleado:
          return BalanceResponse(
             anio=anio,
             total_horas_trabajadas=0,
-            horas_convenio=1768,
+            horas_convenio=empleados_service.HORAS_CONVENIO_ANUAL,
             balance_horas=0,
             dias_trabajados=0,
             dias_vacaciones=0,
@@ -153,6 +155,64 @@ async def get_balance_anual(
     return BalanceResponse(**balance)
 
 
+class BalanceEmpleadoResponse(BalanceResponse):
+    empleado_id: int
+    nombre: str
+    mes: Optional[int] = None
+
+
+class BalancesResponse(BaseModel):
+    anio: int
+    mes: Optional[int] = None
+    total: int
+    skip: int
+    limit: int
+    balances: list[BalanceEmpleadoResponse]
+
+
+@router.get("/balances/{anio}", response_model=BalancesResponse)
+def get_balances_todos(
+    anio: int,
+    mes: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 100,
+    orden: str = "balance_asc",
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    cache: ValidadoresCache = Depends(CacheVersion())
+):
+    """
+    Balance de horas de todos los empleados (Solo para coordinadores).
+    Anual, o mensual si se indica mes. Ordenable por balance (balance_asc,
+    balance_desc) o por nombre.
+    """
+    from fastapi import HTTPException
+    from utils.validators import DateValidator, PaginationValidator
+    from utils.error_handlers import ValidationError
+
+    if current_user.get("rol") != "coordinador":
+        raise HTTPException(status_code=403, detail="No autorizado para ver los balances de todos los empleados")
+
+    try:
+        DateValidator.validate_year(anio)
+        if mes is not None:
+            DateValidator.validate_month(mes)
+        PaginationValidator.validate_pagination(skip, limit)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if orden not in empleados_service.ORDEN_BALANCES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Orden no válido. Use: {', '.join(empleados_service.ORDEN_BALANCES)}"
+        )
+
+    if cache.no_modificado:
+        return cache.respuesta_304()
+
+    total, balances = empleados_service.calcular_balances_todos(db, anio, mes, skip, limit, orden)
+    return BalancesResponse(anio=anio, mes=mes, total=total, skip=skip, limit=limit, balances=balances)
+
+
 # Modelos adicionales
 class UpdateProfileRequest(BaseModel):
     nombre: Optional[str] = None
@@ -174,7 +234,7 @@ class BalanceMensualResponse(BaseModel):
 
 # Endpoint adicional: mi-perfil (alias de /perfil)
 @router.get("/mi-perfil", response_model=PerfilEmpleado)
-async def get_mi_perfil(current_user: dict = Depends(get_current_user)):
+def get_mi_perfil(current_user: dict = Depends(get_current_user)):
     """
     Obtiene el perfil del empleado actual (alias de /perfil)
     """
@@ -193,9 +253,9 @@ async def get_mi_perfil(current_user: dict = Depends(get_current_user)):
 
 
 @router.put("/actualizar-perfil")
-async def actualizar_perfil(
+def actualizar_perfil(
     profile_update: UpdateProfileRequest,
-    current_user: dict = Depends(get_current_user),
+    user: Optional[sql_models.User] = Depends(get_usuario_db),
     db: Session = Depends(get_db)
 ):
     """
@@ -204,27 +264,6 @@ async def actualizar_perfil(
     from services import auth_service
     from fastapi import HTTPException
     
-    # Obtener usuario de BD con fallbacks para modo pruebas
-    user = auth_service.get_user_by_email(db, current_user['email'])
-    if not user:
-        from models.sql_models import User
-        user = db.query(User).filter(
-            User.full_name == current_user.get('nombre', '')
-        ).first()
-    if not user:
-        user = db.query(User).first()
-    # En modo pruebas, si no hay usuario, crear uno temporal
-    if not user and os.getenv("ENVIRONMENT", "development") != "production":
-        from models.sql_models import User
-        user = User(
-            email=current_user.get('email', 'test@example.com'),
-            hashed_password="temp",
-            full_name=current_user.get('nombre', 'Test User'),
-            role=current_user.get('rol', 'vigilante')
-        )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
@@ -264,12 +303,14 @@ async def actualizar_perfil(
 
 
 @router.get("/balance/{anio}/{mes}", response_model=BalanceMensualResponse)
-async def get_balance_mensual(
+def get_balance_mensual(
     anio: int,
     mes: int,
     id_empleado: Optional[int] = None,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    identidad: Identidad = Depends(get_identidad),
+    db: Session = Depends(get_db),
+    cache: ValidadoresCache = Depends(CacheVersion())
 ):
     """
     Obtiene el balance de horas de un mes específico.
@@ -277,7 +318,6 @@ async def get_balance_mensual(
     De lo contrario, devuelve el del usuario actual.
     """
     from fastapi import HTTPException
-    from services import auth_service
     from utils.validators import DateValidator
     
     # Validar mes
@@ -292,77 +332,28 @@ async def get_balance_mensual(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     
+    if cache.no_modificado:
+        return cache.respuesta_304()
+    
     # Determinar qué empleado consultar
-    if id_empleado and current_user.get('role') == 'coordinador':
-        empleado = db.query(sql_models.Empleado).filter(sql_models.Empleado.id == id_empleado).first()
+    if id_empleado and current_user.get('rol') == 'coordinador':
+        empleado = db.get(sql_models.Empleado, id_empleado)
     else:
-        # Obtener usuario de BD
-        user_db = auth_service.get_user_by_email(db, current_user['email'])
-        if not user_db:
-            return BalanceMensualResponse(
-                anio=anio,
-                mes=mes,
-                total_horas_trabajadas=0,
-                horas_convenio=147.3,  # Aproximado mensual (1768/12)
-                balance_horas=0,
-                dias_trabajados=0,
-                horas_nocturnas=0,
-                dias_festivos=0
-            )
-        
-        # Buscar empleado asociado
-        empleado = db.query(sql_models.Empleado).filter(
-            sql_models.Empleado.nombre_completo == user_db.full_name
-        ).first()
+        # Empleado vinculado al usuario (resuelto una vez por petición)
+        empleado = identidad.empleado
     
     if not empleado:
         return BalanceMensualResponse(
             anio=anio,
             mes=mes,
             total_horas_trabajadas=0,
-            horas_convenio=147.3,
+            horas_convenio=empleados_service.HORAS_CONVENIO_MENSUAL,
             balance_horas=0,
-            dias_trabajados=0
+            dias_trabajados=0,
+            horas_nocturnas=0,
+            horas_festivas=0
         )
     
-    # Calcular balance mensual
-    # Obtener turnos del mes especificado
-    from datetime import date
-    import calendar
-    
-    # Primer y último día del mes
-    primer_dia = date(anio, mes, 1)
-    ultimo_dia_num = calendar.monthrange(anio, mes)[1]
-    ultimo_dia = date(anio, mes, ultimo_dia_num)
-    
-    turnos = db.query(sql_models.Turno).filter(
-        sql_models.Turno.empleado_id == empleado.id,
-        sql_models.Turno.anio == anio,
-        sql_models.Turno.mes == mes
-    ).all()
-    
-    total_horas = 0
-    horas_nocturnas = 0
-    dias_trabajados = 0
-    horas_festivas = 0
-    
-    for turno in turnos:
-        total_horas += turno.horas_trabajadas
-        horas_nocturnas += turno.horas_nocturnas
-        horas_festivas += turno.horas_festivas
-        if turno.horas_trabajadas > 0:
-            dias_trabajados += 1
-    
-    horas_convenio_mes = 147.3  # Aproximado mensual
-    balance = total_horas - horas_convenio_mes
-    
-    return BalanceMensualResponse(
-        anio=anio,
-        mes=mes,
-        total_horas_trabajadas=total_horas,
-        horas_convenio=horas_convenio_mes,
-        balance_horas=balance,
-        dias_trabajados=dias_trabajados,
-        horas_nocturnas=horas_nocturnas,
-        horas_festivas=horas_festivas
-    )
+    # Calcular balance mensual: una fila de turnos_resumen
+    balance = empleados_service.calcular_balance_mensual(db, empleado.id, anio, mes)
+    return BalanceMensualResponse(**balance)
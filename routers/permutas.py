@@ -4,18 +4,19 @@ Router de permutas
 Endpoints para solicitar y gestionar cambios de turno
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
 from sqlalchemy.orm import Session
-import os
 
 from models.database import get_db
 from models import sql_models
 from services import permutas_service, auth_service
 from routers.auth import get_current_user
+from routers.dependencias import get_usuario_db
 from utils.validators import PermutaValidator, EmailValidator
+from utils.pagination import CABECERA_CURSOR
 from utils.logging_config import (
     log_permuta_creada,
     log_permuta_aceptada,
@@ -23,6 +24,9 @@ from utils.logging_config import (
 )
 from services.notification_service import notify_permuta_request
 
+# Tamaño de página si se pide un cursor sin limit
+LIMITE_PAGINA_ADMIN = 100
+
 router = APIRouter()
 
 # Modelos Pydantic
@@ -75,9 +79,9 @@ def map_permuta_response(
 
 # Endpoints
 @router.post("/solicitar", response_model=PermutaResponse)
-async def solicitar_permuta(
+def solicitar_permuta(
     solicitud: SolicitudPermuta,
-    current_user: dict = Depends(get_current_user),
+    solicitante: Optional[sql_models.User] = Depends(get_usuario_db),
     db: Session = Depends(get_db)
 ):
     """Solicita una permuta de turno a otro usuario"""
@@ -91,22 +95,7 @@ async def solicitar_permuta(
             )
         )
 
-        # Obtener usuario actual (solicitante)
-        # En modo pruebas con fake_token, current_user['email'] puede no existir en BD
-        # Buscar primero por email, luego por nombre completo como fallback
-        solicitante = auth_service.get_user_by_email(
-            db,
-            current_user['email']
-        )
-        if not solicitante:
-            # Fallback: buscar por nombre completo (útil en modo pruebas)
-            from models.sql_models import User
-            solicitante = db.query(User).filter(
-                User.full_name == current_user.get('nombre', '')
-            ).first()
-        if not solicitante:
-            # Último fallback: tomar el primer usuario disponible (modo pruebas)
-            solicitante = db.query(User).first()
+        # Usuario actual (solicitante), resuelto una vez por petición
         if not solicitante:
             raise HTTPException(
                 status_code=404,
@@ -165,87 +154,46 @@ async def solicitar_permuta(
 
 
 @router.get("/mis-solicitudes", response_model=List[PermutaResponse])
-async def get_mis_solicitudes(
-    current_user: dict = Depends(get_current_user),
+def get_mis_solicitudes(
+    user: Optional[sql_models.User] = Depends(get_usuario_db),
     db: Session = Depends(get_db)
 ):
     """
     Obtiene todas las permutas (solicitadas o recibidas) del usuario
     """
-    # Buscar usuario con fallbacks para modo pruebas
-    user = auth_service.get_user_by_email(db, current_user['email'])
-    if not user:
-        from models.sql_models import User
-        user = db.query(User).filter(
-            User.full_name == current_user.get('nombre', '')
-        ).first()
-    if not user:
-        user = db.query(User).first()
-    # En modo pruebas, si no hay usuario, crear uno temporal
-    if not user and os.getenv("ENVIRONMENT", "development") != "production":
-        from models.sql_models import User
-        user = User(
-            email=current_user.get('email', 'test@example.com'),
-            hashed_password="temp",
-            full_name=current_user.get('nombre', 'Test User'),
-            role=current_user.get('rol', 'vigilante')
-        )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
     if not user:
-         raise HTTPException(status_code=404, detail="Usuario no encontrado")
-         
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+
     permutas = permutas_service.get_permutas_by_user(db, user.id)
     return [map_permuta_response(p) for p in permutas]
 
 
 @router.get("/pendientes", response_model=List[PermutaResponse])
-async def get_permutas_pendientes(
-    current_user: dict = Depends(get_current_user),
+def get_permutas_pendientes(
+    user: Optional[sql_models.User] = Depends(get_usuario_db),
     db: Session = Depends(get_db)
 ):
     """
     Obtiene permutas pendientes que el usuario ha RECIBIDO
     """
-    # Buscar usuario con fallbacks para modo pruebas
-    user = auth_service.get_user_by_email(db, current_user['email'])
-    if not user:
-        from models.sql_models import User
-        user = db.query(User).filter(
-            User.full_name == current_user.get('nombre', '')
-        ).first()
-    if not user:
-        user = db.query(User).first()
-    # En modo pruebas, si no hay usuario, crear uno temporal
-    if not user and os.getenv("ENVIRONMENT", "development") != "production":
-        from models.sql_models import User
-        user = User(
-            email=current_user.get('email', 'test@example.com'),
-            hashed_password="temp",
-            full_name=current_user.get('nombre', 'Test User'),
-            role=current_user.get('rol', 'vigilante')
-        )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
     if not user:
-         raise HTTPException(status_code=404, detail="Usuario no encontrado")
-         
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+
     permutas = permutas_service.get_permutas_pendientes(db, user.id)
     return [map_permuta_response(p) for p in permutas]
 
 
 @router.put("/{permuta_id}/aceptar", response_model=PermutaResponse)
-async def aceptar_permuta(
+def aceptar_permuta(
     permuta_id: int,
-    current_user: dict = Depends(get_current_user),
+    user: Optional[sql_models.User] = Depends(get_usuario_db),
     db: Session = Depends(get_db)
 ):
     """
     Acepta una permuta pendiente
     """
-    user = auth_service.get_user_by_email(db, current_user['email'])
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
     permuta = permutas_service.get_permuta_by_id(db, permuta_id)
     
     if not permuta:
@@ -263,15 +211,16 @@ async def aceptar_permuta(
 
 
 @router.put("/{permuta_id}/rechazar", response_model=PermutaResponse)
-async def rechazar_permuta(
+def rechazar_permuta(
     permuta_id: int,
-    current_user: dict = Depends(get_current_user),
+    user: Optional[sql_models.User] = Depends(get_usuario_db),
     db: Session = Depends(get_db)
 ):
     """
     Rechaza una permuta pendiente
     """
-    user = auth_service.get_user_by_email(db, current_user['email'])
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
     permuta = permutas_service.get_permuta_by_id(db, permuta_id)
     
     if not permuta:
@@ -295,51 +244,91 @@ async def rechazar_permuta(
 
 # Endpoints adicionales con POST para compatibilidad con tests
 @router.post("/aceptar/{permuta_id}", response_model=PermutaResponse)
-async def aceptar_permuta_post(
+def aceptar_permuta_post(
     permuta_id: int,
-    current_user: dict = Depends(get_current_user),
+    user: Optional[sql_models.User] = Depends(get_usuario_db),
     db: Session = Depends(get_db)
 ):
     """
     Acepta una permuta pendiente (POST version para  tests)
     """
-    return await aceptar_permuta(permuta_id, current_user, db)
+    return aceptar_permuta(permuta_id, user, db)
 
 
 @router.post("/rechazar/{permuta_id}", response_model=PermutaResponse)
-async def rechazar_permuta_post(
+def rechazar_permuta_post(
     permuta_id: int,
-    current_user: dict = Depends(get_current_user),
+    user: Optional[sql_models.User] = Depends(get_usuario_db),
     db: Session = Depends(get_db)
 ):
     """
     Rechaza una permuta pendiente (POST version para tests)
     """
-    return await rechazar_permuta(permuta_id, current_user, db)
+    return rechazar_permuta(permuta_id, user, db)
 
 
 # Alias adicional para /mis-permutas (para tests que usan esta ruta)
 @router.get("/mis-permutas", response_model=List[PermutaResponse])
-async def get_mis_permutas(
-    current_user: dict = Depends(get_current_user),
+def get_mis_permutas(
+    user: Optional[sql_models.User] = Depends(get_usuario_db),
     db: Session = Depends(get_db)
 ):
     """
     Alias de /mis-solicitudes para compatibilidad
     """
-    return await get_mis_solicitudes(current_user, db)
+    return get_mis_solicitudes(user, db)
 
 
 @router.get("/admin/all", response_model=List[PermutaResponse])
-async def get_all_permutas_admin(
+def get_all_permutas_admin(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    estado: Optional[str] = None,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    usuario_id: Optional[int] = None,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Obtiene todas las permutas registradas (Solo para coordinadores)
+    Obtiene las permutas registradas, de la más reciente a la más antigua
+    (Solo para coordinadores). Sin limit ni cursor devuelve todas, como
+    antes; con limit (o cursor, con páginas de LIMITE_PAGINA_ADMIN) se
+    pagina: si hay más resultados, la cabecera X-Next-Cursor trae el valor
+    de cursor para la página siguiente.
+    Filtros: estado, fecha de solicitud entre desde y hasta (incluidos) y
+    usuario (solicitante o receptor).
     """
     if current_user.get("rol") != "coordinador":
         raise HTTPException(status_code=403, detail="No autorizado para ver todas las permutas")
-    
-    permutas = permutas_service.get_all_permutas(db)
+
+    try:
+        permutas, siguiente = permutas_service.get_all_permutas(
+            db,
+            limit=limit or (LIMITE_PAGINA_ADMIN if cursor else None),
+            cursor=cursor,
+            estado=estado,
+            desde=datetime.combine(desde, time.min) if desde else None,
+            hasta=datetime.combine(hasta + timedelta(days=1), time.min) if hasta else None,
+            usuario_id=usuario_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
     return [map_permuta_response(p) for p in permutas]
+
+
+@router.get("/admin/conteos")
+def get_conteos_permutas_admin(
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Número de permutas por estado, para los contadores del panel (Solo para coordinadores)
+    """
+    if current_user.get("rol") != "coordinador":
+        raise HTTPException(status_code=403, detail="No autorizado para ver todas las permutas")
+
+    return permutas_service.contar_por_estado(db)
@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Request, status
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 
 from models.database import get_db, engine
 from models import sql_models
-from services import sync_service
+from services import sync_jobs_service, sync_sesiones_service, sync_service
 from routers.auth import get_current_user
+from utils.ndjson import ErrorNDJSON, leer_ndjson
+
+# Registros NDJSON que se aplican en cada paso por el threadpool
+LOTE_REGISTROS_STREAM = 100
 
 # Crear tablas si no existen
 sql_models.Base.metadata.create_all(bind=engine)
@@ -19,9 +24,19 @@ class SyncData(BaseModel):
     cuadrantes: Dict[str, Any] # Estructura anidada anio -> mes -> lista vigilantes
     config_turnos: Dict[str, Any]
     festivos: Optional[Dict[str, Any]] = None
+    modo: Optional[str] = sync_service.MODO_COMPLETO # "completo" o "delta"
+
+class AbrirSesionData(BaseModel):
+    modo: Optional[str] = sync_service.MODO_COMPLETO
+
+class ConfirmarSesionData(BaseModel):
+    total_trozos: int
+
+class HashesData(BaseModel):
+    hashes: Dict[str, Dict[str, Dict[str, str]]] # anio -> mes -> nombre -> hash
 
 @router.post("/full")
-async def sync_full_data(
+def sync_full_data(
     data: SyncData,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
@@ -29,12 +44,236 @@ async def sync_full_data(
     """
     Sincronización completa: Recibe los JSONs del desktop y actualiza la BD.
     Solo permitido para coordinadores.
+    Se declara síncrono para que FastAPI lo ejecute en el threadpool y la
+    sincronización no bloquee el event loop.
+    Todo se aplica en una sola transacción, salvo con SYNC_WORKERS > 1 en
+    PostgreSQL: entonces los empleados, la configuración y cada mes se
+    confirman por separado y, si un mes falla también al reintentarlo, lo
+    ya escrito se queda (con una versión nueva) y se devuelve 500; volver
+    a enviar los mismos datos completa la sincronización.
     """
     if current_user["rol"] != "coordinador":
         raise HTTPException(status_code=403, detail="No autorizado para sincronizar")
 
+    if data.modo not in (sync_service.MODO_COMPLETO, sync_service.MODO_DELTA):
+        raise HTTPException(status_code=400, detail=f"Modo de sincronización no válido: {data.modo}")
+
     try:
-        sync_service.sync_data(db, data.dict())
-        return {"status": "success", "message": "Sincronización completada"}
+        stats = sync_service.sync_data(db, data.dict())
+        respuesta = {"status": "success", "message": "Sincronización completada"}
+        if data.modo == sync_service.MODO_DELTA:
+            respuesta["estadisticas"] = stats
+        return respuesta
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en sincronización: {str(e)}")
+
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+def encolar_sync(
+    data: SyncData,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Sincronización en segundo plano: guarda los datos y responde al momento
+    con el id del trabajo; el progreso se consulta en /api/sync/jobs/{id}.
+    Los envíos simultáneos se ejecutan de uno en uno, y un envío completo
+    sustituye a los pendientes anteriores. Cada trabajo es atómico salvo
+    con SYNC_WORKERS > 1 en PostgreSQL (ver /full): un trabajo en error
+    puede haber dejado escritos algunos meses.
+    Solo permitido para coordinadores.
+    """
+    if current_user["rol"] != "coordinador":
+        raise HTTPException(status_code=403, detail="No autorizado para sincronizar")
+
+    if data.modo not in (sync_service.MODO_COMPLETO, sync_service.MODO_DELTA):
+        raise HTTPException(status_code=400, detail=f"Modo de sincronización no válido: {data.modo}")
+
+    job_id = sync_jobs_service.encolar(
+        db, data.model_dump(), current_user.get("email"), sync_jobs_service.fabrica_para(db)
+    )
+    return {"job_id": job_id, "estado": sync_jobs_service.ESTADO_PENDIENTE}
+
+
+@router.get("/jobs/{job_id}")
+def estado_sync(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Estado de un trabajo de sincronización: pendiente, en_curso, completado,
+    error o reemplazado, con el progreso (empleados y meses procesados,
+    filas escritas) y los tiempos de espera y ejecución.
+    """
+    if current_user["rol"] != "coordinador":
+        raise HTTPException(status_code=403, detail="No autorizado para sincronizar")
+
+    estado = sync_jobs_service.estado(db, job_id)
+    if estado is None:
+        raise HTTPException(status_code=404, detail="Trabajo de sincronización no encontrado")
+    return estado
+
+
+@router.post("/stream")
+async def sync_stream(
+    request: Request,
+    modo: str = sync_service.MODO_COMPLETO,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Sincronización por streaming: el cuerpo es NDJSON (un registro por
+    línea, ver sync_service.aplicar_registros), opcionalmente con
+    Content-Encoding: gzip. Se descomprime y se parsea según llega y los
+    turnos se escriben por lotes, así que la memoria no depende del tamaño
+    de la subida. Todo se confirma en una sola transacción al final.
+    Solo permitido para coordinadores.
+    """
+    if current_user["rol"] != "coordinador":
+        raise HTTPException(status_code=403, detail="No autorizado para sincronizar")
+
+    if modo not in (sync_service.MODO_COMPLETO, sync_service.MODO_DELTA):
+        raise HTTPException(status_code=400, detail=f"Modo de sincronización no válido: {modo}")
+
+    codificacion = request.headers.get("content-encoding", "identity").lower()
+    if codificacion not in ("identity", "gzip"):
+        raise HTTPException(status_code=415, detail=f"Content-Encoding no soportado: {codificacion}")
+
+    lote = []
+    try:
+        # En PostgreSQL el constructor espera al advisory lock: fuera del event loop
+        sincronizacion = await run_in_threadpool(sync_service.Sincronizacion, db, modo)
+        async for registro in leer_ndjson(request.stream(), gzip=codificacion == "gzip"):
+            lote.append(registro)
+            if len(lote) >= LOTE_REGISTROS_STREAM:
+                await run_in_threadpool(sync_service.aplicar_registros, sincronizacion, lote)
+                lote = []
+        if lote:
+            await run_in_threadpool(sync_service.aplicar_registros, sincronizacion, lote)
+        stats = await run_in_threadpool(sincronizacion.finalizar)
+    except ErrorNDJSON as e:
+        await run_in_threadpool(db.rollback)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        await run_in_threadpool(db.rollback)
+        raise HTTPException(status_code=500, detail=f"Error en sincronización: {str(e)}")
+
+    return {"status": "success", "message": "Sincronización completada", "estadisticas": stats}
+
+
+def _solo_coordinador(current_user: dict) -> None:
+    if current_user["rol"] != "coordinador":
+        raise HTTPException(status_code=403, detail="No autorizado para sincronizar")
+
+
+@router.post("/sesiones", status_code=status.HTTP_201_CREATED)
+def abrir_sesion(
+    data: AbrirSesionData,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Abre una sincronización por trozos. Después: PUT de cada trozo en
+    /sesiones/{id}/trozos/{seq} (en cualquier orden, con la cabecera
+    X-Checksum = sha256 del cuerpo) y POST /sesiones/{id}/confirmar.
+    Solo permitido para coordinadores.
+    """
+    _solo_coordinador(current_user)
+    if data.modo not in (sync_service.MODO_COMPLETO, sync_service.MODO_DELTA):
+        raise HTTPException(status_code=400, detail=f"Modo de sincronización no válido: {data.modo}")
+    sesion_id = sync_sesiones_service.abrir(db, data.modo, current_user.get("email"))
+    return {"sesion_id": sesion_id}
+
+
+@router.put("/sesiones/{sesion_id}/trozos/{seq}")
+async def subir_trozo(
+    sesion_id: str,
+    request: Request,
+    seq: int = Path(..., ge=0),
+    x_checksum: str = Header(...),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Sube un trozo (JSON con empleados, config_turnos y/o cuadrantes de
+    algunos meses, como en /full). Idempotente: reenviar el mismo trozo no
+    lo duplica. Admite Content-Encoding: gzip; el checksum es del JSON
+    sin comprimir.
+    """
+    _solo_coordinador(current_user)
+    maximo = sync_sesiones_service.MAX_TROZO_BYTES
+    demasiado_grande = HTTPException(status_code=413, detail=f"Trozo {seq} demasiado grande (máximo {maximo} bytes)")
+    longitud = request.headers.get("content-length")
+    if longitud and longitud.isdigit() and int(longitud) > maximo:
+        raise demasiado_grande
+
+    # Lectura acotada: no se acumula más de MAX_TROZO_BYTES aunque falte Content-Length
+    contenido = bytearray()
+    async for trozo in request.stream():
+        contenido += trozo
+        if len(contenido) > maximo:
+            raise demasiado_grande
+    contenido = bytes(contenido)
+
+    try:
+        if request.headers.get("content-encoding", "").lower() == "gzip":
+            contenido = await run_in_threadpool(sync_sesiones_service.descomprimir_trozo, contenido)
+        nuevo = await run_in_threadpool(
+            sync_sesiones_service.guardar_trozo, db, sesion_id, seq, contenido, x_checksum
+        )
+    except sync_sesiones_service.ErrorSesion as e:
+        raise HTTPException(status_code=e.codigo, detail=str(e))
+    return {"seq": seq, "guardado": nuevo}
+
+
+@router.get("/sesiones/{sesion_id}")
+def estado_sesion(
+    sesion_id: str,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Trozos ya recibidos de la sesión (para reanudar una subida interrumpida)"""
+    _solo_coordinador(current_user)
+    try:
+        return sync_sesiones_service.estado(db, sesion_id)
+    except sync_sesiones_service.ErrorSesion as e:
+        raise HTTPException(status_code=e.codigo, detail=str(e))
+
+
+@router.post("/sesiones/{sesion_id}/confirmar")
+def confirmar_sesion(
+    sesion_id: str,
+    data: ConfirmarSesionData,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Aplica todos los trozos de la sesión en una sola transacción (409 si
+    falta alguno). Confirmar dos veces devuelve el mismo resultado.
+    """
+    _solo_coordinador(current_user)
+    try:
+        stats = sync_sesiones_service.confirmar(db, sesion_id, data.total_trozos)
+    except sync_sesiones_service.ErrorSesion as e:
+        raise HTTPException(status_code=e.codigo, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en sincronización: {str(e)}")
+    return {"status": "success", "message": "Sincronización completada", "estadisticas": stats}
+
+
+@router.post("/hashes")
+def comparar_hashes(
+    data: HashesData,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Primer paso de la sincronización delta: el desktop envía la huella de
+    cada mes y vigilante, y la API responde qué meses han cambiado y deben
+    subirse en un POST /full con modo "delta".
+    """
+    if current_user["rol"] != "coordinador":
+        raise HTTPException(status_code=403, detail="No autorizado para sincronizar")
+
+    return sync_service.comparar_hashes(db, data.hashes)
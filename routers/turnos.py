@@ -4,12 +4,10 @@ Router de turnos
 Endpoints para consultar turnos de vigilantes
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 from datetime import date
-import json
-import os
 import sys
 
 from sqlalchemy.orm import Session
@@ -20,6 +18,10 @@ from datetime import date, timedelta
 # Importar autenticación
 sys.path.append('..')
 from routers.auth import get_current_user
+from services import cache_service
+from utils.http_cache import respuesta_documento, CacheVersion, ValidadoresCache
+from utils.desktop_data import cargar_datos_desktop, vigilante_mes
+from routers.dependencias import get_config_turnos, get_empleado_db
 
 router = APIRouter()
 
@@ -46,25 +48,14 @@ class CalendarioMes(BaseModel):
     total_horas: float
 
 
-# Funciones auxiliares
-def cargar_datos_desktop(archivo: str) -> dict:
-    """Carga datos desde los JSON del proyecto desktop"""
-    desktop_path = os.getenv("DESKTOP_DATA_PATH", "../../proyecto_modulo_cuadrante/datos_cuadrante")
-    ruta_completa = os.path.join(desktop_path, archivo)
-    
-    try:
-        with open(ruta_completa, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
-
-
 # Endpoints
 @router.get("/mis-turnos/{anio}/{mes}", response_model=CalendarioMes)
-async def get_mis_turnos(
+def get_mis_turnos(
     anio: int,
     mes: int,
+    request: Request,
     current_user: dict = Depends(get_current_user),
+    empleado: Optional[Empleado] = Depends(get_empleado_db),
     db: Session = Depends(get_db)
 ):
     """
@@ -73,51 +64,15 @@ async def get_mis_turnos(
     # 1. Intentar cargar desde DB primero (fuente de verdad sincronizada)
     nombre_vigilante = current_user.get("nombre")
     
-    # Obtener configuración de turnos desde DB
-    from services import empleados_service
-    config_horas = empleados_service.get_horas_config(db)
-    # También necesitamos la leyenda y color que están en ConfiguracionTurno
-    configs_db = {c.codigo: c for c in db.query(ConfiguracionTurno).all()}
-    
-    # Buscar turnos del vigilante en DB
-    empleado = db.query(Empleado).filter(Empleado.nombre_completo == nombre_vigilante).first()
-    
+    # Turnos del vigilante en DB: documento pre-serializado en la sincronización
     if empleado:
-        turnos_db = db.query(TurnoDB).filter(
-            TurnoDB.empleado_id == empleado.id,
-            TurnoDB.anio == anio,
-            TurnoDB.mes == mes
-        ).all()
-        
-        if turnos_db:
-            turnos_lista = []
-            total_horas = 0
-            for t in turnos_db:
-                conf = configs_db.get(t.codigo_turno)
-                
-                turnos_lista.append(Turno(
-                    dia=t.dia,
-                    codigo=t.codigo_turno,
-                    horario=conf.descripcion if conf else "",
-                    es_festivo=t.es_festivo
-                ))
-                total_horas += t.horas_trabajadas
-            
-            turnos_lista.sort(key=lambda x: x.dia)
-            return CalendarioMes(
-                anio=anio,
-                mes=mes,
-                vigilante=nombre_vigilante,
-                turnos=turnos_lista,
-                total_horas=total_horas
-            )
+        documento = cache_service.obtener_documento(db, cache_service.TIPO_CALENDARIO, empleado, anio, mes)
+        if documento:
+            return respuesta_documento(request, documento)
 
     # 2. Fallback a JSON (solo para desarrollo local si no hay DB)
-    cuadrantes = cargar_datos_desktop("cuadrantes.json")
     turnos_config = cargar_datos_desktop("turnos.json")
-    
-    turnos_mes = cuadrantes.get(str(anio), {}).get(str(mes), [])
-    vigilante_data = next((v for v in turnos_mes if v["nombre"] == nombre_vigilante), None)
+    vigilante_data = vigilante_mes(anio, mes, nombre_vigilante)
     
     if not vigilante_data:
         return CalendarioMes(anio=anio, mes=mes, vigilante=nombre_vigilante, turnos=[], total_horas=0)
@@ -140,7 +95,7 @@ async def get_mis_turnos(
 
 
 @router.get("/calendario/{anio}/{mes}")
-async def get_calendario_completo(
+def get_calendario_completo(
     anio: int,
     mes: int,
     current_user: dict = Depends(get_current_user)
@@ -161,24 +116,49 @@ async def get_calendario_completo(
     }
 
 
+@router.get("/equipo/{anio}/{mes}")
+def get_cuadrante_equipo(
+    anio: int,
+    mes: int,
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Cuadrante de todo el equipo en un mes desde la base de datos (solo
+    coordinadores). Una cadena de turnos por empleado, un carácter por día.
+    """
+    from utils.validators import DateValidator
+
+    if current_user.get("rol") != "coordinador":
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    # Año acotado: cada (año, mes) ocupa una entrada de la caché del equipo
+    DateValidator.validate_year(anio)
+    DateValidator.validate_month(mes)
+
+    return respuesta_documento(request, cache_service.obtener_equipo(db, anio, mes))
+
+
 from services import turnos_service
 from models.sql_models import Empleado
 
 @router.get("/proximos-turnos", response_model=List[ProximoTurno])
-async def get_proximos_turnos(
-    dias: int = 7,
-    current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+def get_proximos_turnos(
+    dias: int = Query(7, ge=0, le=turnos_service.MAX_DIAS_PROXIMOS),
+    empleado: Optional[Empleado] = Depends(get_empleado_db),
+    db: Session = Depends(get_db),
+    cache: ValidadoresCache = Depends(CacheVersion(diario=True)),
+    config_turnos: Dict[str, Dict] = Depends(get_config_turnos)
 ):
     """
     Obtiene los próximos turnos del vigilante desde la base de datos.
     """
-    nombre_usuario = current_user.get("nombre")
-    empleado = db.query(Empleado).filter(Empleado.nombre_completo == nombre_usuario).first()
+    if cache.no_modificado:
+        return cache.respuesta_304()
 
     if not empleado:
         raise HTTPException(status_code=404, detail="Empleado no encontrado")
 
-    proximos_turnos = turnos_service.get_proximos_turnos_empleado(db, empleado.id, dias)
+    proximos_turnos = turnos_service.get_proximos_turnos_empleado(db, empleado.id, dias, config_turnos)
     
     return proximos_turnos
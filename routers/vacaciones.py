@@ -4,17 +4,22 @@ Router de vacaciones
 Endpoints para solicitar y gestionar vacaciones
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
 from sqlalchemy.orm import Session
 
 from models.database import get_db
 from models import sql_models
-from services import vacaciones_service, auth_service, notification_service
+from services import vacaciones_service, notification_service
 from routers.auth import get_current_user
+from routers.dependencias import get_usuario_db
 from utils.validators import DateValidator
+from utils.pagination import CABECERA_CURSOR
+
+# Tamaño de página si se pide un cursor sin limit
+LIMITE_PAGINA_ADMIN = 100
 
 router = APIRouter()
 
@@ -49,9 +54,9 @@ def map_vacacion_response(vacacion: sql_models.Vacacion) -> VacacionResponse:
 
 # Endpoints
 @router.post("/solicitar", response_model=VacacionResponse)
-async def solicitar_vacaciones(
+def solicitar_vacaciones(
     solicitud: SolicitudVacacion,
-    current_user: dict = Depends(get_current_user),
+    user: Optional[sql_models.User] = Depends(get_usuario_db),
     db: Session = Depends(get_db)
 ):
     """Solicita un periodo de vacaciones"""
@@ -69,8 +74,7 @@ async def solicitar_vacaciones(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    # Obtener usuario
-    user = auth_service.get_user_by_email(db, current_user['email'])
+    # Usuario actual, resuelto una vez por petición
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
@@ -93,12 +97,11 @@ async def solicitar_vacaciones(
     return map_vacacion_response(nueva_vacacion)
 
 @router.get("/mis-solicitudes", response_model=List[VacacionResponse])
-async def get_mis_solicitudes(
-    current_user: dict = Depends(get_current_user),
+def get_mis_solicitudes(
+    user: Optional[sql_models.User] = Depends(get_usuario_db),
     db: Session = Depends(get_db)
 ):
     """Obtiene el historial de solicitudes del usuario"""
-    user = auth_service.get_user_by_email(db, current_user['email'])
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
         
@@ -106,12 +109,51 @@ async def get_mis_solicitudes(
 
 
 @router.get("/admin/all", response_model=List[VacacionResponse])
-async def get_all_vacaciones_admin(
+def get_all_vacaciones_admin(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    estado: Optional[str] = None,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    usuario_id: Optional[int] = None,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Obtiene todas las solicitudes de vacaciones (Solo para coordinadores)"""
+    """
+    Obtiene las solicitudes de vacaciones, de la más reciente a la más
+    antigua (Solo para coordinadores). Sin limit ni cursor devuelve todas,
+    como antes; con limit (o cursor, con páginas de LIMITE_PAGINA_ADMIN)
+    se pagina por cursor (cabecera X-Next-Cursor). Filtros por estado,
+    fecha de solicitud y solicitante.
+    """
     if current_user.get("rol") != "coordinador":
         raise HTTPException(status_code=403, detail="No autorizado para ver todas las vacaciones")
-        
-    return [map_vacacion_response(v) for v in vacaciones_service.get_all_solicitudes(db)]
+
+    try:
+        vacaciones, siguiente = vacaciones_service.get_all_solicitudes(
+            db,
+            limit=limit or (LIMITE_PAGINA_ADMIN if cursor else None),
+            cursor=cursor,
+            estado=estado,
+            desde=datetime.combine(desde, time.min) if desde else None,
+            hasta=datetime.combine(hasta + timedelta(days=1), time.min) if hasta else None,
+            usuario_id=usuario_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
+    return [map_vacacion_response(v) for v in vacaciones]
+
+
+@router.get("/admin/conteos")
+def get_conteos_vacaciones_admin(
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Número de solicitudes por estado, para los contadores del panel (Solo para coordinadores)"""
+    if current_user.get("rol") != "coordinador":
+        raise HTTPException(status_code=403, detail="No autorizado para ver todas las vacaciones")
+
+    return vacaciones_service.contar_por_estado(db)
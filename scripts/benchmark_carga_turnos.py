@@ -0,0 +1,91 @@
+"""
+Benchmark de carga masiva de turnos: upsert() (executemany) frente a
+upsert_masivo() (COPY + merge en PostgreSQL) con un dataset de
+500 vigilantes x 3 años (~548.000 filas).
+
+Uso:
+    python scripts/benchmark_carga_turnos.py                 # SQLite temporal
+    python scripts/benchmark_carga_turnos.py postgresql+psycopg2://...  # además PostgreSQL
+
+En PostgreSQL usa una base de pruebas: se crean y vacían las tablas.
+"""
+
+import calendar
+import os
+import sys
+import tempfile
+import time
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import sql_models
+from models.database import upsert, upsert_masivo
+from services.sync_service import CLAVE_TURNO, COLUMNAS_DATOS_TURNO
+
+EMPLEADOS = 500
+ANIOS = (2024, 2025, 2026)
+CODIGOS = ("M", "T", "N", "L", "D", "V")
+# Filas por llamada, como los lotes de Sincronizacion
+LOTE = 5000
+
+
+def generar_filas():
+    filas = []
+    for emp_id in range(1, EMPLEADOS + 1):
+        for anio in ANIOS:
+            for mes in range(1, 13):
+                for dia in range(1, calendar.monthrange(anio, mes)[1] + 1):
+                    codigo = CODIGOS[(emp_id + dia + mes) % len(CODIGOS)]
+                    filas.append({
+                        "empleado_id": emp_id, "anio": anio, "mes": mes, "dia": dia,
+                        "fecha": sql_models.fecha_turno(anio, mes, dia), "codigo_turno": codigo,
+                        "horas_trabajadas": 8.0 if codigo in "MTN" else 0.0,
+                        "horas_nocturnas": 8.0 if codigo == "N" else 0.0,
+                        "horas_festivas": 0.0, "es_festivo": False,
+                    })
+    return filas
+
+
+def medir(url, cargar, filas):
+    engine = create_engine(url)
+    sql_models.Base.metadata.drop_all(bind=engine, tables=[sql_models.Turno.__table__])
+    sql_models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        db.add_all(sql_models.Empleado(id=i, nombre_completo=f"Vigilante {i}") for i in range(1, EMPLEADOS + 1)
+                   if db.get(sql_models.Empleado, i) is None)
+        db.commit()
+
+        inicio = time.perf_counter()
+        for i in range(0, len(filas), LOTE):
+            cargar(db, sql_models.Turno.__table__, filas[i:i + LOTE], CLAVE_TURNO, COLUMNAS_DATOS_TURNO)
+        db.commit()
+        segundos = time.perf_counter() - inicio
+        assert db.query(sql_models.Turno).count() == len(filas)
+    finally:
+        db.close()
+        engine.dispose()
+    return segundos
+
+
+def main():
+    filas = generar_filas()
+    print(f"Dataset: {EMPLEADOS} vigilantes x {len(ANIOS)} años = {len(filas)} filas")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        destinos = [("sqlite", f"sqlite:///{os.path.join(tmp, 'benchmark.db')}")]
+        if len(sys.argv) > 1:
+            destinos.append(("postgresql", sys.argv[1]))
+
+        for nombre, url in destinos:
+            for metodo, cargar in (("upsert", upsert), ("upsert_masivo", upsert_masivo)):
+                segundos = medir(url, cargar, filas)
+                print(f"{nombre:<11} {metodo:<14} {segundos:8.2f} s  {len(filas) / segundos:>10,.0f} filas/s")
+
+
+if __name__ == "__main__":
+    main()
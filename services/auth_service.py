@@ -31,3 +31,46 @@ def create_user(db: Session, user_data: dict) -> sql_models.User:
     db.commit()
     db.refresh(db_user)
     return db_user
+
+def datos_token(user: sql_models.User) -> dict:
+    """
+    Claims del JWT de un usuario. user_id y empleado_id permiten resolver
+    usuario y empleado por clave primaria en cada petición.
+    """
+    return {
+        "sub": user.email,
+        "nombre": user.full_name,
+        "rol": user.role,
+        "user_id": user.id,
+        "empleado_id": user.empleado_id
+    }
+
+def get_usuario_actual(db: Session, current_user: dict) -> Optional[sql_models.User]:
+    """
+    Usuario del token: por user_id si viene en el token y su email coincide
+    con el sujeto (un id reutilizado no da acceso a otra cuenta); si no,
+    por email. None si el sujeto del token no existe.
+    """
+    email = current_user.get("email")
+    user_id = current_user.get("user_id")
+    if user_id is not None:
+        user = db.get(sql_models.User, user_id)
+        if user and user.email == email:
+            return user
+    return get_user_by_email(db, email) if email else None
+
+def get_empleado_actual(db: Session, current_user: dict) -> Optional[sql_models.Empleado]:
+    """
+    Empleado del token: el vinculado al usuario en la BD (no el claim
+    empleado_id, que puede estar obsoleto) o, en su defecto, coincidencia
+    por nombre completo.
+    """
+    user = get_usuario_actual(db, current_user)
+    if user and user.empleado_id is not None:
+        return db.get(sql_models.Empleado, user.empleado_id)
+    nombre = user.full_name if user else current_user.get("nombre")
+    if not nombre:
+        return None
+    return db.query(sql_models.Empleado).filter(
+        sql_models.Empleado.nombre_completo == nombre
+    ).first()
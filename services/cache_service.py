@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+Servicio de caché de cuadrantes
+Documentos JSON pre-serializados (y pre-comprimidos) por empleado y mes.
+Se materializan al final de cada sincronización y se sirven tal cual, de
+modo que la lectura de un mes es una única búsqueda por clave primaria.
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+from collections import OrderedDict
+from datetime import date, datetime
+import calendar
+import gzip
+import hashlib
+import json
+import threading
+
+from models import sql_models
+from models.database import upsert
+from services import config_turnos_service, version_service
+
+TIPO_SCHEDULE = "schedule"        # /api/schedule/{year}/{month}
+TIPO_CALENDARIO = "calendario"    # /api/turnos/mis-turnos/{anio}/{mes}
+TIPO_SCHEDULE_COMPACTO = "schedule_compacto"  # /api/schedule/{year}/{month}?format=compact
+
+# Por debajo de este tamaño no compensa guardar la versión gzip
+GZIP_MINIMO_BYTES = 512
+
+# Cuadrícula del equipo: carácter de un día sin turno y de un código de
+# más de un carácter (que va completo en "extra")
+DIA_SIN_TURNO = "."
+DIA_CODIGO_LARGO = "*"
+# Meses de la cuadrícula del equipo que se guardan en memoria por proceso
+EQUIPO_MAX_MESES = 36
+
+# Máximo de meses de /api/schedule/range
+MAX_MESES_RANGO = 24
+
+CLAVE_DOCUMENTO = ("tipo", "empleado_id", "anio", "mes")
+COLUMNAS_DOCUMENTO = ("contenido", "contenido_gzip", "etag", "generado")
+
+
+def construir_shifts(filas: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Turnos de un mes en el formato de /api/schedule: día -> objeto detallado"""
+    return {
+        str(f["dia"]): {
+            "codigo": f["codigo_turno"],
+            "t": f["horas_trabajadas"],
+            "n": f["horas_nocturnas"],
+            "f": f["horas_festivas"],
+            "es_festivo": f["es_festivo"]
+        }
+        for f in sorted(filas, key=lambda f: f["dia"])
+    }
+
+
+def construir_schedule(empleado_id: int, nombre: str, anio: int, mes: int, filas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Documento de /api/schedule: día -> objeto detallado"""
+    return {
+        "anio": anio,
+        "mes": mes,
+        "empleado_id": empleado_id,
+        "empleado_nombre": nombre,
+        "shifts": construir_shifts(filas)
+    }
+
+
+def construir_columnas(filas: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """
+    Turnos de un mes en formato compacto: arrays paralelos (una posición
+    por día con turno) en lugar de un objeto con claves repetidas por día.
+    """
+    filas = sorted(filas, key=lambda f: f["dia"])
+    return {
+        "dias": [f["dia"] for f in filas],
+        "codigo": [f["codigo_turno"] for f in filas],
+        "t": [f["horas_trabajadas"] for f in filas],
+        "n": [f["horas_nocturnas"] for f in filas],
+        "f": [f["horas_festivas"] for f in filas],
+        "es_festivo": [1 if f["es_festivo"] else 0 for f in filas]
+    }
+
+
+def construir_schedule_compacto(empleado_id: int, nombre: str, anio: int, mes: int, filas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Documento de /api/schedule?format=compact: mismos datos en columnas"""
+    return {
+        "anio": anio,
+        "mes": mes,
+        "empleado_id": empleado_id,
+        "empleado_nombre": nombre,
+        "formato": "compact",
+        "shifts": construir_columnas(filas)
+    }
+
+
+def construir_calendario(nombre: str, anio: int, mes: int, filas: List[Dict[str, Any]], descripciones: Dict[str, str]) -> Dict[str, Any]:
+    """Documento de /api/turnos/mis-turnos (mismo formato que CalendarioMes)"""
+    filas = sorted(filas, key=lambda f: f["dia"])
+    return {
+        "anio": anio,
+        "mes": mes,
+        "vigilante": nombre,
+        "turnos": [
+            {
+                "dia": f["dia"],
+                "codigo": f["codigo_turno"],
+                "horario": descripciones.get(f["codigo_turno"]) or "",
+                "es_festivo": bool(f["es_festivo"])
+            }
+            for f in filas
+        ],
+        "total_horas": float(sum(f["horas_trabajadas"] or 0 for f in filas))
+    }
+
+
+def serializar(documento: Dict[str, Any]) -> Dict[str, Any]:
+    """Serializa un documento y calcula su versión gzip y su ETag fuerte"""
+    contenido = json.dumps(documento, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return {
+        "contenido": contenido,
+        "contenido_gzip": gzip.compress(contenido, mtime=0) if len(contenido) >= GZIP_MINIMO_BYTES else None,
+        "etag": hashlib.sha256(contenido).hexdigest()[:32],
+        "generado": datetime.utcnow()
+    }
+
+
+def filas_desde_turnos(turnos: List[sql_models.Turno]) -> List[Dict[str, Any]]:
+    """Convierte objetos Turno al formato de filas usado por la sincronización"""
+    return [
+        {
+            "dia": t.dia,
+            "codigo_turno": t.codigo_turno,
+            "horas_trabajadas": t.horas_trabajadas,
+            "horas_nocturnas": t.horas_nocturnas,
+            "horas_festivas": t.horas_festivas,
+            "es_festivo": t.es_festivo
+        }
+        for t in turnos
+    ]
+
+
+def get_descripciones(db: Session) -> Dict[str, str]:
+    """Descripción (leyenda) de cada código de turno, leída de la transacción en curso"""
+    return {c.codigo: c.descripcion for c in db.query(sql_models.ConfiguracionTurno).all()}
+
+
+def documentos_mes(empleado_id: int, nombre: str, anio: int, mes: int, filas: List[Dict[str, Any]], descripciones: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Filas de documentos_cache (schedule, schedule compacto y calendario) para un empleado y mes"""
+    clave = {"empleado_id": empleado_id, "anio": anio, "mes": mes}
+    return [
+        {"tipo": TIPO_SCHEDULE, **clave, **serializar(construir_schedule(empleado_id, nombre, anio, mes, filas))},
+        {"tipo": TIPO_SCHEDULE_COMPACTO, **clave, **serializar(construir_schedule_compacto(empleado_id, nombre, anio, mes, filas))},
+        {"tipo": TIPO_CALENDARIO, **clave, **serializar(construir_calendario(nombre, anio, mes, filas, descripciones))},
+    ]
+
+
+def guardar_documentos(db: Session, documentos: List[Dict[str, Any]]) -> None:
+    """Inserta o reemplaza documentos en bloque"""
+    upsert(db, sql_models.DocumentoCache.__table__, documentos, CLAVE_DOCUMENTO, COLUMNAS_DOCUMENTO)
+
+
+def invalidar_tipo(db: Session, tipo: str) -> None:
+    """Elimina todos los documentos de un tipo (se regeneran al leerlos)"""
+    db.query(sql_models.DocumentoCache).filter(
+        sql_models.DocumentoCache.tipo == tipo
+    ).delete(synchronize_session=False)
+
+
+def obtener_documento(db: Session, tipo: str, empleado: sql_models.Empleado, anio: int, mes: int) -> Optional[sql_models.DocumentoCache]:
+    """
+    Devuelve el documento pre-serializado de un empleado y mes.
+    Si no existe (datos anteriores a la caché o invalidados) se construye a
+    partir de los turnos y se guarda. Devuelve None si el mes no tiene turnos.
+    """
+    documento = db.get(sql_models.DocumentoCache, (tipo, empleado.id, anio, mes))
+    if documento:
+        return documento
+
+    turnos = db.query(sql_models.Turno).filter(
+        sql_models.Turno.empleado_id == empleado.id,
+        sql_models.Turno.anio == anio,
+        sql_models.Turno.mes == mes
+    ).all()
+    if not turnos:
+        return None
+
+    filas = filas_desde_turnos(turnos)
+    if tipo == TIPO_SCHEDULE:
+        datos = construir_schedule(empleado.id, empleado.nombre_completo, anio, mes, filas)
+    elif tipo == TIPO_SCHEDULE_COMPACTO:
+        datos = construir_schedule_compacto(empleado.id, empleado.nombre_completo, anio, mes, filas)
+    else:
+        descripciones = {codigo: c["descripcion"] for codigo, c in config_turnos_service.obtener(db).items()}
+        datos = construir_calendario(empleado.nombre_completo, anio, mes, filas, descripciones)
+
+    documento = sql_models.DocumentoCache(tipo=tipo, empleado_id=empleado.id, anio=anio, mes=mes, **serializar(datos))
+    db.add(documento)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Otra petición lo ha generado a la vez: usar el suyo
+        db.rollback()
+        documento = db.get(sql_models.DocumentoCache, (tipo, empleado.id, anio, mes))
+    return documento
+
+
+def meses_rango(desde: Tuple[int, int], hasta: Tuple[int, int]) -> List[Tuple[int, int]]:
+    """Meses (anio, mes) de desde a hasta, ambos incluidos"""
+    meses = []
+    anio, mes = desde
+    while (anio, mes) <= hasta:
+        meses.append((anio, mes))
+        anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+    return meses
+
+
+def schedule_rango(
+    db: Session,
+    empleado: sql_models.Empleado,
+    desde: Tuple[int, int],
+    hasta: Tuple[int, int],
+    compacto: bool = False
+) -> Dict[str, Any]:
+    """
+    Cuadrante de varios meses de un empleado con una sola consulta por
+    rango de fechas (índice por empleado y fecha). Cada mes lleva los
+    turnos en el mismo formato que /api/schedule/{year}/{month}
+    (en columnas si compacto).
+    """
+    construir = construir_columnas if compacto else construir_shifts
+    meses = meses_rango(desde, hasta)
+    ultimo_anio, ultimo_mes = meses[-1]
+    fin = date(ultimo_anio + 1, 1, 1) if ultimo_mes == 12 else date(ultimo_anio, ultimo_mes + 1, 1)
+
+    turnos = db.query(sql_models.Turno).filter(
+        sql_models.Turno.empleado_id == empleado.id,
+        sql_models.Turno.fecha >= date(*desde, 1),
+        sql_models.Turno.fecha < fin
+    ).all()
+    por_mes: Dict[Tuple[int, int], List[sql_models.Turno]] = {}
+    for turno in turnos:
+        por_mes.setdefault((turno.anio, turno.mes), []).append(turno)
+
+    respuesta = {
+        "empleado_id": empleado.id,
+        "empleado_nombre": empleado.nombre_completo,
+        "desde": f"{desde[0]:04d}-{desde[1]:02d}",
+        "hasta": f"{hasta[0]:04d}-{hasta[1]:02d}",
+        "meses": [
+            {"anio": anio, "mes": mes, "shifts": construir(filas_desde_turnos(por_mes.get((anio, mes), [])))}
+            for anio, mes in meses
+        ]
+    }
+    if compacto:
+        respuesta["formato"] = "compact"
+    return respuesta
+
+
+class DocumentoEquipo(NamedTuple):
+    """Cuadrícula del equipo serializada (mismos campos que DocumentoCache)"""
+    contenido: bytes
+    contenido_gzip: Optional[bytes]
+    etag: str
+    generado: datetime
+
+
+# (anio, mes) -> (versión de los datos, documento)
+_equipo: "OrderedDict[Tuple[int, int], Tuple[int, DocumentoEquipo]]" = OrderedDict()
+_equipo_lock = threading.Lock()
+
+
+def construir_equipo(db: Session, anio: int, mes: int) -> Dict[str, Any]:
+    """
+    Cuadrícula empleados x días de un mes con una sola consulta. Cada
+    empleado lleva una cadena con un carácter por día (el código de turno,
+    o DIA_SIN_TURNO); los códigos de más de un carácter van en "extra".
+    """
+    E, T = sql_models.Empleado, sql_models.Turno
+    dias = calendar.monthrange(anio, mes)[1]
+    filas = db.query(E.id, E.nombre_completo, T.dia, T.codigo_turno).join(
+        T, T.empleado_id == E.id
+    ).filter(T.anio == anio, T.mes == mes).order_by(E.nombre_normalizado, E.id).all()
+
+    empleados: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+    for empleado_id, nombre, dia, codigo in filas:
+        fila = empleados.get(empleado_id)
+        if fila is None:
+            fila = empleados[empleado_id] = {"id": empleado_id, "nombre": nombre, "dias": [DIA_SIN_TURNO] * dias}
+        if not (1 <= dia <= dias) or not codigo:
+            continue
+        if len(codigo) == 1:
+            fila["dias"][dia - 1] = codigo
+        else:
+            fila["dias"][dia - 1] = DIA_CODIGO_LARGO
+            fila.setdefault("extra", {})[str(dia)] = codigo
+
+    return {
+        "anio": anio,
+        "mes": mes,
+        "dias": dias,
+        "empleados": [
+            {**{k: v for k, v in fila.items() if k != "dias"}, "turnos": "".join(fila["dias"])}
+            for fila in empleados.values()
+        ]
+    }
+
+
+def obtener_equipo(db: Session, anio: int, mes: int) -> DocumentoEquipo:
+    """
+    Cuadrícula del equipo pre-serializada. Se guarda en memoria por
+    versión de los datos: solo se recalcula tras un sync (o un cambio de
+    estado) que incremente el contador.
+    """
+    version, _ = version_service.obtener(db)
+    clave = (anio, mes)
+    entrada = _equipo.get(clave)
+    if entrada and entrada[0] == version:
+        return entrada[1]
+
+    documento = DocumentoEquipo(**serializar(construir_equipo(db, anio, mes)))
+    with _equipo_lock:
+        _equipo[clave] = (version, documento)
+        _equipo.move_to_end(clave)
+        while len(_equipo) > EQUIPO_MAX_MESES:
+            _equipo.popitem(last=False)
+    return documento
+
+
+def limpiar_equipo() -> None:
+    """Descarta las cuadrículas del equipo cacheadas"""
+    with _equipo_lock:
+        _equipo.clear()
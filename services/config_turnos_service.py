@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Servicio de configuración de turnos
+Caché en memoria del proceso de la tabla configuracion_turnos. La tabla
+solo cambia en la sincronización, que incrementa el contador de versión
+"config_turnos"; cada lectura comprueba ese contador (una búsqueda por
+clave primaria) y recarga la tabla solo si ha cambiado, de modo que todos
+los workers ven la configuración nueva tras un sync.
+"""
+
+from sqlalchemy.orm import Session
+from typing import Dict, Any, Optional
+import threading
+
+from models import sql_models
+from services import version_service
+
+_lock = threading.Lock()
+_version: Optional[int] = None
+_config: Dict[str, Dict[str, Any]] = {}
+
+
+def cargar(db: Session) -> Dict[str, Dict[str, Any]]:
+    """Lee la configuración completa de la base de datos: código -> datos"""
+    return {
+        c.codigo: {
+            "descripcion": c.descripcion,
+            "horario": c.horario,
+            "color": c.color,
+            "horas_total": c.horas_total,
+            "horas_nocturnas": c.horas_nocturnas
+        }
+        for c in db.query(sql_models.ConfiguracionTurno).all()
+    }
+
+
+def obtener(db: Session) -> Dict[str, Dict[str, Any]]:
+    """
+    Configuración de turnos cacheada (no modificar el diccionario devuelto).
+    Solo consulta la tabla si la versión ha cambiado desde la última carga.
+    """
+    global _version, _config
+    version, _ = version_service.obtener(db, version_service.VERSION_CONFIG_TURNOS)
+    if version == _version:
+        return _config
+    with _lock:
+        if version != _version:
+            _config = cargar(db)
+            _version = version
+        return _config
+
+
+def invalidar() -> None:
+    """Descarta la caché local (la siguiente lectura recarga la tabla)"""
+    global _version, _config
+    with _lock:
+        _version = None
+        _config = {}
@@ -1,13 +1,66 @@
+from sqlalchemy import func, select, insert, update
 from sqlalchemy.orm import Session
 from models import sql_models
-from typing import Dict, Any
+from models.database import upsert
+from services import config_turnos_service
+from typing import Dict, Any, List, Optional, Tuple
+from utils.pagination import paginar
+
+# Convenio: 1768 horas anuales (aproximado mensual: 1768/12)
+HORAS_CONVENIO_ANUAL = 1768.0
+HORAS_CONVENIO_MENSUAL = 147.3
+
+CLAVE_RESUMEN = ("empleado_id", "anio", "mes")
+COLUMNAS_RESUMEN = (
+    "horas_trabajadas", "horas_nocturnas", "horas_festivas",
+    "dias_trabajados", "dias_vacaciones", "dias_baja"
+)
+
+def rellenar_nombres_normalizados(db: Session) -> int:
+    """
+    Rellena empleados.nombre_normalizado en las filas que no lo tienen
+    (datos anteriores a la columna). Devuelve el número de filas actualizadas.
+    """
+    E = sql_models.Empleado
+    filas = db.query(E.id, E.nombre_completo).filter(E.nombre_normalizado.is_(None)).all()
+    cambios = [
+        {"id": f.id, "nombre_normalizado": sql_models.normalizar_nombre(f.nombre_completo)}
+        for f in filas
+    ]
+    if cambios:
+        db.execute(update(E), cambios)
+    return len(cambios)
+
+def buscar_empleados(
+    db: Session,
+    limit: int,
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+    skip: int = 0
+) -> Tuple[List[sql_models.Empleado], Optional[str]]:
+    """
+    Página de empleados ordenados por nombre normalizado e id (orden estable).
+    q filtra por prefijo del nombre sin distinguir mayúsculas ni acentos
+    (índice ix_empleados_nombre_normalizado). skip (OFFSET) solo se
+    admite sin cursor, por compatibilidad con clientes antiguos.
+    """
+    E = sql_models.Empleado
+    query = db.query(E)
+    if q:
+        prefijo = sql_models.normalizar_nombre(q)
+        prefijo = prefijo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.filter(E.nombre_normalizado.like(prefijo + "%", escape="\\"))
+    if skip and not cursor:
+        empleados = query.order_by(E.nombre_normalizado, E.id).offset(skip).limit(limit).all()
+        return empleados, None
+    return paginar(query, [E.nombre_normalizado, E.id], limit, cursor)
 
 def get_horas_config(db: Session) -> Dict[str, Dict[str, float]]:
     """
-    Obtiene la configuración de horas de todos los turnos desde la base de datos.
+    Obtiene la configuración de horas de todos los turnos (caché en memoria).
     """
-    configs = db.query(sql_models.ConfiguracionTurno).all()
-    return {c.codigo: {"total": c.horas_total, "nocturnas": c.horas_nocturnas} for c in configs}
+    configs = config_turnos_service.obtener(db)
+    return {codigo: {"total": c["horas_total"], "nocturnas": c["horas_nocturnas"]} for codigo, c in configs.items()}
 
 def get_horas_turno(codigo: str, config_mapping: Dict[str, Dict[str, float]] = None) -> float:
     """
@@ -35,24 +88,62 @@ def get_horas_nocturnas(codigo: str, config_mapping: Dict[str, Dict[str, float]]
     }
     return mapping.get(codigo, 0.0)
 
+def resumen_mes(empleado_id: int, anio: int, mes: int, filas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Agregado de un mes a partir de sus filas de turnos (formato de la sincronización).
+    """
+    return {
+        "empleado_id": empleado_id,
+        "anio": anio,
+        "mes": mes,
+        "horas_trabajadas": sum(f["horas_trabajadas"] or 0 for f in filas),
+        "horas_nocturnas": sum(f["horas_nocturnas"] or 0 for f in filas),
+        "horas_festivas": sum(f["horas_festivas"] or 0 for f in filas),
+        "dias_trabajados": sum(1 for f in filas if (f["horas_trabajadas"] or 0) > 0),
+        "dias_vacaciones": sum(1 for f in filas if f["codigo_turno"] == "V"),
+        "dias_baja": sum(1 for f in filas if f["codigo_turno"] == "B"),
+    }
+
+def guardar_resumenes(db: Session, resumenes: List[Dict[str, Any]]) -> None:
+    """Inserta o reemplaza agregados mensuales en bloque"""
+    upsert(db, sql_models.TurnoResumen.__table__, resumenes, CLAVE_RESUMEN, COLUMNAS_RESUMEN)
+
+def reconstruir_resumenes(db: Session) -> None:
+    """
+    Recalcula la tabla turnos_resumen completa desde turnos con una sola
+    consulta agrupada (migración inicial o reparación).
+    """
+    T = sql_models.Turno
+    db.query(sql_models.TurnoResumen).delete(synchronize_session=False)
+    agregado = select(
+        T.empleado_id, T.anio, T.mes,
+        func.coalesce(func.sum(T.horas_trabajadas), 0.0),
+        func.coalesce(func.sum(T.horas_nocturnas), 0.0),
+        func.coalesce(func.sum(T.horas_festivas), 0.0),
+        func.count().filter(T.horas_trabajadas > 0),
+        func.count().filter(T.codigo_turno == "V"),
+        func.count().filter(T.codigo_turno == "B"),
+    ).group_by(T.empleado_id, T.anio, T.mes)
+    db.execute(
+        insert(sql_models.TurnoResumen.__table__).from_select(list(CLAVE_RESUMEN + COLUMNAS_RESUMEN), agregado)
+    )
+
 def calcular_balance_anual(db: Session, empleado_id: int, anio: int) -> Dict[str, Any]:
     """
     Calcula el balance de horas para un empleado en un año específico.
-    Utiliza los campos pre-calculados por el escritorio.
+    Suma como mucho 12 filas de turnos_resumen (campos pre-calculados por el escritorio).
     """
-    # 1. Obtener turnos del año
-    turnos = db.query(sql_models.Turno).filter(
-        sql_models.Turno.empleado_id == empleado_id,
-        sql_models.Turno.anio == anio
-    ).all()
+    R = sql_models.TurnoResumen
+    fila = db.query(
+        func.coalesce(func.sum(R.horas_trabajadas), 0.0),
+        func.coalesce(func.sum(R.dias_trabajados), 0),
+        func.coalesce(func.sum(R.dias_vacaciones), 0),
+        func.coalesce(func.sum(R.dias_baja), 0),
+    ).filter(R.empleado_id == empleado_id, R.anio == anio).one()
+    total_horas, dias_trabajados, dias_vacaciones, dias_baja = fila
     
-    total_horas = sum(t.horas_trabajadas for t in turnos)
-    dias_trabajados = sum(1 for t in turnos if t.horas_trabajadas > 0)
-    dias_vacaciones = sum(1 for t in turnos if t.codigo_turno == "V")
-    dias_baja = sum(1 for t in turnos if t.codigo_turno == "B")
-    
-    # 3. Calcular esperadas (1768 horas anuales convenio)
-    horas_convenio = 1768.0
+    # Calcular esperadas (1768 horas anuales convenio)
+    horas_convenio = HORAS_CONVENIO_ANUAL
     balance = total_horas - horas_convenio
     
     return {
@@ -64,3 +155,82 @@ def calcular_balance_anual(db: Session, empleado_id: int, anio: int) -> Dict[str
         "dias_vacaciones": dias_vacaciones,
         "dias_baja": dias_baja
     }
+
+def calcular_balance_mensual(db: Session, empleado_id: int, anio: int, mes: int) -> Dict[str, Any]:
+    """
+    Calcula el balance de horas de un mes: una única fila de turnos_resumen.
+    """
+    resumen = db.get(sql_models.TurnoResumen, (empleado_id, anio, mes))
+    total_horas = resumen.horas_trabajadas if resumen else 0.0
+    
+    return {
+        "anio": anio,
+        "mes": mes,
+        "total_horas_trabajadas": total_horas,
+        "horas_convenio": HORAS_CONVENIO_MENSUAL,
+        "balance_horas": total_horas - HORAS_CONVENIO_MENSUAL,
+        "dias_trabajados": resumen.dias_trabajados if resumen else 0,
+        "horas_nocturnas": resumen.horas_nocturnas if resumen else 0.0,
+        "horas_festivas": resumen.horas_festivas if resumen else 0.0
+    }
+
+ORDEN_BALANCES = ("balance_asc", "balance_desc", "nombre")
+
+def calcular_balances_todos(
+    db: Session,
+    anio: int,
+    mes: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 100,
+    orden: str = "balance_asc"
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Balance anual (o mensual si se indica mes) de todos los empleados en una
+    sola consulta agrupada sobre turnos_resumen, paginada y ordenada en SQL.
+    Los empleados sin turnos en el periodo aparecen con 0 horas.
+    Devuelve (total de empleados, página de balances).
+    """
+    E = sql_models.Empleado
+    R = sql_models.TurnoResumen
+    horas_convenio = HORAS_CONVENIO_MENSUAL if mes else HORAS_CONVENIO_ANUAL
+
+    condicion = (R.empleado_id == E.id) & (R.anio == anio)
+    if mes:
+        condicion = condicion & (R.mes == mes)
+
+    total_horas = func.coalesce(func.sum(R.horas_trabajadas), 0.0)
+    consulta = db.query(
+        E.id,
+        E.nombre_completo,
+        total_horas.label("total_horas"),
+        func.coalesce(func.sum(R.dias_trabajados), 0),
+        func.coalesce(func.sum(R.dias_vacaciones), 0),
+        func.coalesce(func.sum(R.dias_baja), 0),
+    ).outerjoin(R, condicion).group_by(E.id, E.nombre_completo)
+
+    # El convenio es igual para todos: ordenar por horas equivale a ordenar por balance
+    if orden == "balance_desc":
+        consulta = consulta.order_by(total_horas.desc(), E.id)
+    elif orden == "nombre":
+        consulta = consulta.order_by(E.nombre_completo, E.id)
+    else:
+        consulta = consulta.order_by(total_horas, E.id)
+
+    total = db.query(func.count(E.id)).scalar()
+    balances = [
+        {
+            "empleado_id": empleado_id,
+            "nombre": nombre,
+            "anio": anio,
+            "mes": mes,
+            "total_horas_trabajadas": horas,
+            "horas_convenio": horas_convenio,
+            "balance_horas": horas - horas_convenio,
+            "dias_trabajados": dias_trabajados,
+            "dias_vacaciones": dias_vacaciones,
+            "dias_baja": dias_baja
+        }
+        for empleado_id, nombre, horas, dias_trabajados, dias_vacaciones, dias_baja
+        in consulta.offset(skip).limit(limit).all()
+    ]
+    return total, balances
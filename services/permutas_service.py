@@ -1,7 +1,10 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, Query, joinedload
 from models import sql_models
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func
+from services import version_service
+from utils.pagination import paginar_por_fecha
 
 def create_permuta(
     db: Session, 
@@ -22,20 +25,28 @@ def create_permuta(
         fecha_solicitud=datetime.utcnow()
     )
     db.add(permuta)
+    version_service.incrementar(db)
     db.commit()
     db.refresh(permuta)
     return permuta
 
+def _con_usuarios(query: Query) -> Query:
+    """Carga solicitante y receptor en la misma consulta (evita N+1 al mapear la respuesta)"""
+    return query.options(
+        joinedload(sql_models.Permuta.solicitante),
+        joinedload(sql_models.Permuta.receptor)
+    )
+
 def get_permutas_by_user(db: Session, user_id: int) -> List[sql_models.Permuta]:
     """Obtiene permutas donde el usuario es solicitante o receptor"""
-    return db.query(sql_models.Permuta).filter(
+    return _con_usuarios(db.query(sql_models.Permuta)).filter(
         (sql_models.Permuta.solicitante_id == user_id) | 
         (sql_models.Permuta.receptor_id == user_id)
     ).all()
 
 def get_permutas_pendientes(db: Session, user_id: int) -> List[sql_models.Permuta]:
     """Obtiene permutas pendientes recibidas por el usuario"""
-    return db.query(sql_models.Permuta).filter(
+    return _con_usuarios(db.query(sql_models.Permuta)).filter(
         sql_models.Permuta.receptor_id == user_id,
         sql_models.Permuta.estado == "pendiente"
     ).all()
@@ -47,10 +58,41 @@ def get_permuta_by_id(db: Session, permuta_id: int) -> Optional[sql_models.Permu
 def update_permuta_status(db: Session, permuta: sql_models.Permuta, nuevo_estado: str):
     """Actualiza el estado de una permuta"""
     permuta.estado = nuevo_estado
+    version_service.incrementar(db)
     db.commit()
     db.refresh(permuta)
     return permuta
 
-def get_all_permutas(db: Session) -> List[sql_models.Permuta]:
-    """Obtiene todas las permutas (para modo administrador)"""
-    return db.query(sql_models.Permuta).order_by(sql_models.Permuta.fecha_solicitud.desc()).all()
+def get_all_permutas(
+    db: Session,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    estado: Optional[str] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    usuario_id: Optional[int] = None
+) -> Tuple[List[sql_models.Permuta], Optional[str]]:
+    """
+    Obtiene las permutas (para modo administrador), de la más reciente a la
+    más antigua. Con limit se pagina por cursor sobre (fecha_solicitud, id).
+    Devuelve (permutas, cursor de la página siguiente o None).
+    """
+    P = sql_models.Permuta
+    query = _con_usuarios(db.query(P))
+    if estado:
+        query = query.filter(P.estado == estado)
+    if desde:
+        query = query.filter(P.fecha_solicitud >= desde)
+    if hasta:
+        query = query.filter(P.fecha_solicitud < hasta)
+    if usuario_id is not None:
+        query = query.filter((P.solicitante_id == usuario_id) | (P.receptor_id == usuario_id))
+
+    if limit is None:
+        return query.order_by(P.fecha_solicitud.desc(), P.id.desc()).all(), None
+    return paginar_por_fecha(query, P.fecha_solicitud, P.id, limit, cursor)
+
+def contar_por_estado(db: Session) -> Dict[str, int]:
+    """Número de permutas por estado (una consulta agrupada)"""
+    P = sql_models.Permuta
+    return dict(db.query(P.estado, func.count(P.id)).group_by(P.estado).all())
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Servicio de trabajos de sincronización
+POST /api/sync/jobs guarda los datos del desktop en sync_jobs y responde al
+momento; un único hilo por proceso ejecuta los trabajos pendientes de uno
+en uno (y en PostgreSQL el advisory lock de sync_service los serializa
+también entre procesos), así que la petición nunca espera a la
+sincronización ni choca con los timeouts del proxy.
+
+Un trabajo completo sustituye a los pendientes anteriores (quedan en
+estado "reemplazado"): contiene todos los datos, así que ejecutar los antiguos
+sería trabajo perdido. Los delta solo llevan los meses que cambiaron y se
+ejecutan todos, en orden.
+"""
+
+from sqlalchemy.orm import Session, sessionmaker
+from typing import Any, Callable, Dict, Optional
+from datetime import datetime
+import gzip
+import json
+import threading
+
+from models import sql_models
+from services import sync_service
+from utils.logging_config import log_info
+
+ESTADO_PENDIENTE = "pendiente"
+ESTADO_EN_CURSO = "en_curso"
+ESTADO_COMPLETADO = "completado"
+ESTADO_ERROR = "error"
+ESTADO_REEMPLAZADO = "reemplazado"
+
+FabricaSesiones = Callable[[], Session]
+
+_lock = threading.Lock()
+_aviso = threading.Event()
+_worker: Optional[threading.Thread] = None
+# Trabajos en ejecución en este proceso: id -> Sincronizacion (progreso en vivo)
+_en_curso: Dict[int, sync_service.Sincronizacion] = {}
+
+
+def fabrica_para(db: Session) -> FabricaSesiones:
+    """Fábrica de sesiones sobre el mismo motor que la sesión de la petición"""
+    return sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())
+
+
+def encolar(db: Session, data: Dict[str, Any], solicitado_por: Optional[str], fabrica: FabricaSesiones) -> int:
+    """
+    Guarda un trabajo pendiente, sustituye a los anteriores si es completo
+    y despierta al worker. Devuelve el id del trabajo.
+    """
+    T = sql_models.TrabajoSync
+    ahora = datetime.utcnow()
+    modo = data.get("modo") or sync_service.MODO_COMPLETO
+    trabajo = T(
+        estado=ESTADO_PENDIENTE,
+        modo=modo,
+        solicitado_por=solicitado_por,
+        datos=gzip.compress(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")),
+        creado=ahora
+    )
+    db.add(trabajo)
+    db.flush()
+    trabajo_id = trabajo.id
+
+    if modo == sync_service.MODO_COMPLETO:
+        db.query(T).filter(T.estado == ESTADO_PENDIENTE, T.id != trabajo_id).update(
+            {T.estado: ESTADO_REEMPLAZADO, T.reemplazado_por: trabajo_id, T.datos: None, T.finalizado: ahora},
+            synchronize_session=False
+        )
+    db.commit()
+
+    _despertar(fabrica)
+    return trabajo_id
+
+
+def _reclamar_siguiente(db: Session) -> Optional[int]:
+    """Marca en curso el trabajo pendiente más antiguo (None si no hay)"""
+    T = sql_models.TrabajoSync
+    while True:
+        candidato = db.query(T.id).filter(T.estado == ESTADO_PENDIENTE).order_by(T.id).first()
+        if candidato is None:
+            return None
+        reclamados = db.query(T).filter(T.id == candidato.id, T.estado == ESTADO_PENDIENTE).update(
+            {T.estado: ESTADO_EN_CURSO, T.iniciado: datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+        if reclamados:
+            return candidato.id
+
+
+def ejecutar(fabrica: FabricaSesiones, trabajo_id: int) -> None:
+    """
+    Ejecuta un trabajo reclamado, con el lock de sincronización ya tomado
+    (procesar_pendientes). El estado final se guarda en la misma
+    transacción que los datos (en PostgreSQL con varios meses, en la del
+    paso final de la sincronización paralela).
+    """
+    db = fabrica()
+    try:
+        trabajo = db.get(sql_models.TrabajoSync, trabajo_id)
+        data = json.loads(gzip.decompress(trabajo.datos))
+        trabajadores = sync_service.trabajadores_para(db, data)
+        sincronizacion = sync_service.Sincronizacion(db, trabajo.modo, bloquear=False)
+        _en_curso[trabajo_id] = sincronizacion
+        sync_service.aplicar_datos(sincronizacion, data, trabajadores)
+        sincronizacion.volcar()
+
+        _guardar_progreso(trabajo, sincronizacion)
+        trabajo.estado = ESTADO_COMPLETADO
+        trabajo.datos = None
+        trabajo.finalizado = datetime.utcnow()
+        sincronizacion.finalizar()
+        log_info(f"Trabajo de sincronización {trabajo_id} completado")
+    except Exception as e:
+        db.rollback()
+        log_info(f"Error en el trabajo de sincronización {trabajo_id}: {e}")
+        trabajo = db.get(sql_models.TrabajoSync, trabajo_id)
+        if trabajo is not None:
+            trabajo.estado = ESTADO_ERROR
+            trabajo.error = str(e)
+            trabajo.datos = None
+            trabajo.finalizado = datetime.utcnow()
+            db.commit()
+    finally:
+        _en_curso.pop(trabajo_id, None)
+        db.close()
+
+
+def _guardar_progreso(trabajo: sql_models.TrabajoSync, sincronizacion: sync_service.Sincronizacion) -> None:
+    trabajo.empleados_procesados = sincronizacion.empleados_procesados
+    trabajo.meses_actualizados = sincronizacion.stats["meses_actualizados"]
+    trabajo.meses_omitidos = sincronizacion.stats["meses_omitidos"]
+    trabajo.filas_escritas = sincronizacion.filas_escritas
+
+
+def procesar_pendientes(fabrica: FabricaSesiones) -> None:
+    """
+    Ejecuta los trabajos pendientes de uno en uno hasta vaciar la cola. El
+    lock de sincronización (de sesión: sobrevive a los commits) se toma
+    antes de reclamar cada trabajo y se suelta al terminarlo, así que un
+    trabajo en curso siempre tiene el lock y recuperar() no lo confunde con
+    uno huérfano.
+    """
+    while True:
+        db = fabrica()
+        try:
+            with sync_service.bloqueo_exclusivo(db):
+                trabajo_id = _reclamar_siguiente(db)
+                if trabajo_id is None:
+                    return
+                ejecutar(fabrica, trabajo_id)
+        finally:
+            db.close()
+
+
+def _despertar(fabrica: FabricaSesiones) -> None:
+    """Avisa al worker de que hay trabajo (lo arranca si no está vivo)"""
+    global _worker
+    with _lock:
+        _aviso.set()
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_bucle, args=(fabrica,), name="sync-jobs", daemon=True)
+            _worker.start()
+
+
+def _bucle(fabrica: FabricaSesiones) -> None:
+    """Hilo worker: procesa la cola y termina cuando no llegan más avisos"""
+    global _worker
+    while True:
+        _aviso.clear()
+        try:
+            procesar_pendientes(fabrica)
+        except Exception as e:
+            log_info(f"Error en el worker de sincronización: {e}")
+        with _lock:
+            if not _aviso.is_set():
+                _worker = None
+                return
+
+
+def recuperar(fabrica: FabricaSesiones) -> None:
+    """
+    Al arrancar: los trabajos que quedaron en curso (el proceso que los
+    ejecutaba murió) pasan a error, y si hay pendientes se arranca el
+    worker sin esperar a un nuevo POST. Un trabajo en curso no se confirma
+    a medias (salvo en modo paralelo, SYNC_WORKERS > 1) y volver a enviar
+    sus datos es idempotente. Si otra instancia tiene el lock (lo toma antes
+    de reclamar un trabajo, ver procesar_pendientes), sus trabajos en curso
+    son reales y no se tocan.
+    """
+    T = sql_models.TrabajoSync
+    db = fabrica()
+    try:
+        interrumpidos = 0
+        if sync_service.intentar_bloqueo(db):
+            interrumpidos = db.query(T).filter(T.estado == ESTADO_EN_CURSO).update(
+                {T.estado: ESTADO_ERROR, T.error: "Interrumpido por un reinicio del servidor",
+                 T.datos: None, T.finalizado: datetime.utcnow()},
+                synchronize_session=False
+            )
+        db.commit()
+        pendientes = db.query(T.id).filter(T.estado == ESTADO_PENDIENTE).first() is not None
+    finally:
+        db.close()
+
+    if interrumpidos:
+        log_info(f"{interrumpidos} trabajos de sincronización interrumpidos marcados como error")
+    if pendientes:
+        _despertar(fabrica)
+
+
+def estado(db: Session, trabajo_id: int) -> Optional[Dict[str, Any]]:
+    """Estado, progreso y tiempos de un trabajo (progreso en vivo si se ejecuta en este proceso)"""
+    trabajo = db.get(sql_models.TrabajoSync, trabajo_id)
+    if trabajo is None:
+        return None
+
+    progreso = {
+        "empleados_procesados": trabajo.empleados_procesados or 0,
+        "meses_actualizados": trabajo.meses_actualizados or 0,
+        "meses_omitidos": trabajo.meses_omitidos or 0,
+        "filas_escritas": trabajo.filas_escritas or 0,
+    }
+    sincronizacion = _en_curso.get(trabajo_id)
+    if sincronizacion is not None and trabajo.estado == ESTADO_EN_CURSO:
+        progreso = {
+            "empleados_procesados": sincronizacion.empleados_procesados,
+            "meses_actualizados": sincronizacion.stats["meses_actualizados"],
+            "meses_omitidos": sincronizacion.stats["meses_omitidos"],
+            "filas_escritas": sincronizacion.filas_escritas,
+        }
+
+    fin = trabajo.finalizado or datetime.utcnow()
+    return {
+        "id": trabajo.id,
+        "estado": trabajo.estado,
+        "modo": trabajo.modo,
+        "reemplazado_por": trabajo.reemplazado_por,
+        "progreso": progreso,
+        "error": trabajo.error,
+        "tiempos": {
+            "creado": trabajo.creado,
+            "iniciado": trabajo.iniciado,
+            "finalizado": trabajo.finalizado,
+            "espera_segundos": ((trabajo.iniciado or fin) - trabajo.creado).total_seconds() if trabajo.creado else None,
+            "duracion_segundos": (fin - trabajo.iniciado).total_seconds() if trabajo.iniciado else None,
+        },
+    }
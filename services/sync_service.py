@@ -4,20 +4,272 @@ Servicio de Sincronización
 Lógica de negocio para la sincronización de datos con el desktop.
 """
 
-from sqlalchemy.orm import Session
-from typing import Dict, Any
+from sqlalchemy import text
+from sqlalchemy.orm import Session, sessionmaker
+from typing import Dict, Any, Tuple, List, Iterable, Iterator, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+import hashlib
+import json
 
+from config import settings
 from models import sql_models
-from utils.security import get_password_hash
+from models.database import upsert, upsert_masivo
+from services import cache_service, empleados_service, version_service
+from utils.logging_config import log_info
+from utils.ndjson import ErrorNDJSON
+from utils.security import actualizar_password_hashes
 
-def sync_data(db: Session, data: Dict[str, Any]):
+MODO_COMPLETO = "completo"
+MODO_DELTA = "delta"
+
+# Filas de turnos acumuladas antes de lanzar un INSERT ... ON CONFLICT
+LOTE_UPSERT = 5000
+# Documentos pre-serializados acumulados antes de escribirlos (son más pesados)
+LOTE_DOCUMENTOS = 200
+# Clave del advisory lock que serializa las sincronizaciones en PostgreSQL
+CLAVE_BLOQUEO_SYNC = 0x53594E43
+CLAVE_TURNO = ("empleado_id", "anio", "mes", "dia")
+COLUMNAS_DATOS_TURNO = ("fecha", "codigo_turno", "horas_trabajadas", "horas_nocturnas", "horas_festivas", "es_festivo")
+
+
+def calcular_hash_mes(turnos: Dict[str, Any]) -> str:
+    """
+    Calcula la huella del contenido de un mes de un vigilante.
+    Se usa el JSON canónico (claves ordenadas, sin espacios) para que el
+    desktop pueda calcular exactamente el mismo valor antes de enviar.
+    """
+    canonico = json.dumps(turnos or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonico.encode("utf-8")).hexdigest()
+
+
+def _parse_mes(anio_str: str, mes_str: str) -> Tuple[int, int]:
+    """Normaliza las claves de año/mes del desktop ("2025", "12.0"...)"""
+    return int(float(anio_str)), int(float(mes_str))
+
+
+def construir_filas_turnos(emp_id: int, anio: int, mes: int, turnos_mes: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
-    Sincroniza los datos del desktop con la base de datos.
+    Convierte los turnos de un mes del desktop en filas para la tabla turnos.
+    Acepta el formato simple (dia -> código) y el detallado (dia -> {codigo, t, n, f, festivo}).
     """
+    filas: Dict[int, Dict[str, Any]] = {}
+    for dia_str, t_info in (turnos_mes or {}).items():
+        if isinstance(t_info, dict):
+            codigo, h_t, h_n, h_f, es_f = t_info.get("codigo", ""), float(t_info.get("t", 0)), float(t_info.get("n", 0)), float(t_info.get("f", 0)), bool(t_info.get("festivo", False))
+        else:
+            codigo, h_t, h_n, h_f, es_f = t_info, 0.0, 0.0, 0.0, False
+
+        dia = int(float(dia_str))
+        # Indexado por día: un mismo día repetido ("6" y "6.0") no puede chocar dos veces en el upsert
+        filas[dia] = {
+            "empleado_id": emp_id, "anio": anio, "mes": mes, "dia": dia,
+            "fecha": sql_models.fecha_turno(anio, mes, dia), "codigo_turno": codigo, "horas_trabajadas": h_t, "horas_nocturnas": h_n,
+            "horas_festivas": h_f, "es_festivo": es_f
+        }
+    return list(filas.values())
+
+
+def borrar_dias_obsoletos(db: Session, emp_id: int, anio: int, mes: int, dias: Iterable[int]) -> None:
+    """Elimina los turnos del mes que ya no vienen en la sincronización"""
+    query = db.query(sql_models.Turno).filter(
+        sql_models.Turno.empleado_id == emp_id,
+        sql_models.Turno.anio == anio,
+        sql_models.Turno.mes == mes
+    )
+    dias = list(dias)
+    if dias:
+        query = query.filter(sql_models.Turno.dia.notin_(dias))
+    query.delete(synchronize_session=False)
+
+
+def upsert_turnos(db: Session, filas: List[Dict[str, Any]]) -> None:
+    """
+    Inserta o actualiza turnos en bloque usando la clave única
+    (empleado_id, anio, mes, dia): COPY a staging + un INSERT ... SELECT
+    ... ON CONFLICT en PostgreSQL, INSERT ... ON CONFLICT con executemany
+    en SQLite.
+    """
+    upsert_masivo(db, sql_models.Turno.__table__, filas, CLAVE_TURNO, COLUMNAS_DATOS_TURNO)
+
+
+def get_hashes_guardados(db: Session) -> Dict[Tuple[int, int, int], str]:
+    """Devuelve todas las huellas almacenadas indexadas por (empleado_id, anio, mes)"""
+    return {
+        (h.empleado_id, h.anio, h.mes): h.hash_contenido
+        for h in db.query(sql_models.HashMes).all()
+    }
+
+
+def comparar_hashes(db: Session, hashes: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compara las huellas enviadas por el desktop con las almacenadas.
+    Estructura de entrada: anio -> mes -> nombre -> hash.
+    Devuelve los meses (anio -> mes -> [nombres]) que hay que subir.
+    """
+    all_emps = {e.nombre_completo: e.id for e in db.query(sql_models.Empleado).all()}
+    guardados = get_hashes_guardados(db)
+
+    pendientes: Dict[str, Dict[str, list]] = {}
+    total = 0
+    for anio_str, meses in hashes.items():
+        for mes_str, por_empleado in meses.items():
+            if not str(mes_str).replace('.', '').isdigit():
+                continue
+            anio, mes = _parse_mes(anio_str, mes_str)
+            for nombre, hash_desktop in por_empleado.items():
+                emp_id = all_emps.get(nombre)
+                if emp_id is not None and guardados.get((emp_id, anio, mes)) == hash_desktop:
+                    continue
+                pendientes.setdefault(str(anio), {}).setdefault(str(mes), []).append(nombre)
+                total += 1
+
+    return {"pendientes": pendientes, "total_pendientes": total}
+
+
+def sync_config_turnos(db: Session, config_turnos: Dict[str, Any]) -> Tuple[bool, bool]:
+    """
+    Sincroniza la configuración de turnos.
+    Devuelve (ha cambiado algo, ha cambiado alguna leyenda); las leyendas
+    afectan además a los calendarios cacheados.
+    """
+    config_cambiada = False
+    descripciones_cambiadas = False
+    configs_db = {c.codigo: c for c in db.query(sql_models.ConfiguracionTurno).all()}
+    for codigo, config_data in config_turnos.items():
+        valores = {
+            "descripcion": config_data.get('leyenda'),
+            "horario": config_data.get('horario') or config_data.get('leyenda'),
+            "color": config_data.get('color_fondo') or config_data.get('color'),
+            "horas_total": float(config_data.get('trabajadas', 0)),
+            "horas_nocturnas": float(config_data.get('nocturnas', 0)),
+        }
+        db_config = configs_db.get(codigo)
+        if not db_config:
+            db_config = sql_models.ConfiguracionTurno(codigo=codigo)
+            db.add(db_config)
+            descripciones_cambiadas = True
+        elif db_config.descripcion != valores["descripcion"]:
+            descripciones_cambiadas = True
+
+        for campo, valor in valores.items():
+            if getattr(db_config, campo) != valor:
+                setattr(db_config, campo, valor)
+                config_cambiada = True
+    return config_cambiada, descripciones_cambiadas
+
+
+def bloquear_sincronizacion(db: Session) -> None:
+    """
+    En PostgreSQL toma un advisory lock de transacción: dos sincronizaciones
+    (de cualquier worker o proceso) nunca se ejecutan a la vez; la segunda
+    espera a que la primera haga commit o rollback. SQLite ya serializa las
+    escrituras por sí mismo.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:clave)"), {"clave": CLAVE_BLOQUEO_SYNC})
+
+
+def intentar_bloqueo(db: Session) -> bool:
+    """
+    Como bloquear_sincronizacion, pero sin esperar: False si otra
+    sincronización tiene el lock en PostgreSQL (en SQLite siempre True).
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return True
+    return bool(db.execute(text("SELECT pg_try_advisory_xact_lock(:clave)"), {"clave": CLAVE_BLOQUEO_SYNC}).scalar())
+
+
+@contextmanager
+def bloqueo_exclusivo(db: Session) -> Iterator[None]:
+    """
+    Como bloquear_sincronizacion, pero con un advisory lock de sesión en una
+    conexión propia: se mantiene aunque la sincronización haga varios
+    commits (modo paralelo) y excluye también a las sincronizaciones en
+    serie, que usan la misma clave.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        yield
+        return
+    conexion = db.get_bind().connect()
     try:
-        # 1. Sincronizar Empleados
-        for nombre, emp_data in data['empleados'].items():
-            db_emp = db.query(sql_models.Empleado).filter(sql_models.Empleado.nombre_completo == nombre).first()
+        conexion.execute(text("SELECT pg_advisory_lock(:clave)"), {"clave": CLAVE_BLOQUEO_SYNC})
+        conexion.commit()
+        yield
+    finally:
+        try:
+            conexion.execute(text("SELECT pg_advisory_unlock(:clave)"), {"clave": CLAVE_BLOQUEO_SYNC})
+            conexion.commit()
+        finally:
+            conexion.close()
+
+
+def trabajadores_para(db: Session, data: Dict[str, Any]) -> int:
+    """
+    Conexiones con las que aplicar los cuadrantes. Por defecto 1: toda la
+    sincronización en una sola transacción. El modo paralelo es opcional
+    (settings.SYNC_WORKERS > 1), solo en PostgreSQL y con más de un mes, y
+    renuncia a la atomicidad (ver aplicar_en_paralelo).
+    """
+    if settings.SYNC_WORKERS <= 1 or db.get_bind().dialect.name != "postgresql":
+        return 1
+    meses = sum(len(meses_data) for meses_data in (data.get("cuadrantes") or {}).values())
+    return max(1, min(settings.SYNC_WORKERS, meses))
+
+
+class Sincronizacion:
+    """
+    Sincronización por pasos dentro de una sola transacción: empleados(),
+    config_turnos() y mes_empleado() se pueden llamar según van llegando los
+    datos (sync_data con el JSON completo, o la subida NDJSON por streaming)
+    y finalizar() vuelca lo pendiente y hace el commit.
+
+    Las filas se escriben en lotes de tamaño fijo, de modo que la memoria no
+    depende del volumen de meses sincronizados.
+
+    En modo "delta" los meses cuyo hash coincide con el almacenado no se
+    reescriben. En modo "completo" se reescriben todos, pero las huellas se
+    actualizan igualmente para que el siguiente delta sea efectivo.
+    """
+
+    def __init__(self, db: Session, modo: str = MODO_COMPLETO, bloquear: bool = True):
+        self.db = db
+        if bloquear:
+            bloquear_sincronizacion(db)
+        self.modo = modo or MODO_COMPLETO
+        self.stats = {"meses_actualizados": 0, "meses_omitidos": 0}
+        # Progreso (lo consulta /api/sync/jobs/{id} mientras se ejecuta)
+        self.empleados_procesados = 0
+        self.filas_escritas = 0
+        self._ahora = datetime.utcnow()
+        self._empleados_db: Optional[Dict[str, sql_models.Empleado]] = None
+        self._emp_ids: Optional[Dict[str, int]] = None
+        self._hashes_guardados: Optional[Dict[Tuple[int, int, int], str]] = None
+        # Huellas escritas en esta sincronización (las guardadas no se tocan:
+        # las particiones las comparten en solo lectura)
+        self._hashes_nuevos: Dict[Tuple[int, int, int], str] = {}
+        self._descripciones: Optional[Dict[str, str]] = None
+        self._filas: List[Dict[str, Any]] = []
+        self._resumenes: List[Dict[str, Any]] = []
+        self._documentos: List[Dict[str, Any]] = []
+        self._huellas: List[Dict[str, Any]] = []
+
+    def empleados(self, empleados: Dict[str, Any]) -> None:
+        """Crea o actualiza empleados y sus usuarios (nombre -> datos del desktop)"""
+        db = self.db
+        # Pre-cargar empleados una vez y usuarios en una sola consulta por lote
+        if self._empleados_db is None:
+            self._empleados_db = {e.nombre_completo: e for e in db.query(sql_models.Empleado).all()}
+        empleados_db = self._empleados_db
+        emails = {d.get("email") for d in empleados.values() if d.get("email")}
+        usuarios_db = {
+            u.email: u for u in db.query(sql_models.User).filter(sql_models.User.email.in_(emails)).all()
+        } if emails else {}
+        pendientes_hash = []  # (usuario, contraseña en claro, cambiada)
+
+        for nombre, emp_data in empleados.items():
+            db_emp = empleados_db.get(nombre)
             if not db_emp:
                 db_emp = sql_models.Empleado(
                     nombre_completo=nombre,
@@ -27,94 +279,315 @@ def sync_data(db: Session, data: Dict[str, Any]):
                     fecha_alta=emp_data.get("fecha_alta")
                 )
                 db.add(db_emp)
+                empleados_db[nombre] = db_emp
             else:
                 db_emp.email = emp_data.get("email")
                 db_emp.telefono = emp_data.get("telefono")
-            
-            # 1.1 Sincronizar Usuarios y Contraseñas
+
+            # Sincronizar Usuarios y Contraseñas
             email = emp_data.get("email")
             web_password = emp_data.get("web_password")
-            
+
+            db_user = usuarios_db.get(email) if email else None
             if email and web_password:
-                db_user = db.query(sql_models.User).filter(sql_models.User.email == email).first()
-                hashed_pw = get_password_hash(web_password)
-                
                 if not db_user:
                     db_user = sql_models.User(
                         email=email,
-                        hashed_password=hashed_pw,
                         full_name=nombre,
                         role="vigilante",
                         is_active=True
                     )
                     db.add(db_user)
+                    usuarios_db[email] = db_user
                 else:
+                    db_user.full_name = nombre # Asegurar nombre sincronizado
+
+                # web_password_cambiada (desktop): False = la misma que en la
+                # última sync, no se toca el hash; True = se hashea sin
+                # comprobar; sin el campo (desktops antiguos) se verifica
+                cambiada = emp_data.get("web_password_cambiada")
+                if cambiada is not False or not db_user.hashed_password:
+                    pendientes_hash.append((db_user, web_password, bool(cambiada)))
+
+            # Vínculo usuario -> empleado (evita buscar por nombre en cada petición)
+            if db_user is not None and db_user.empleado is not db_emp:
+                db_user.empleado = db_emp
+
+        # Solo se reescribe el hash si la contraseña no coincide con la guardada
+        if pendientes_hash:
+            hashes = actualizar_password_hashes([
+                (pw, None if cambiada else u.hashed_password) for u, pw, cambiada in pendientes_hash
+            ])
+            for (db_user, _, _), hashed_pw in zip(pendientes_hash, hashes):
+                if hashed_pw is not None:
                     db_user.hashed_password = hashed_pw
-                    db_user.full_name = nombre # Asegurar nombre sincronizado 
-        
+
         db.flush()
+        self._emp_ids = None
+        self.empleados_procesados += len(empleados)
 
-        # 2. Sincronizar Turnos (Optimizado)
-        # Pre-cargar empleados para evitar miles de SELECT
-        all_emps = {e.nombre_completo: e.id for e in db.query(sql_models.Empleado).all()}
-        
-        for anio_str, meses_data in data['cuadrantes'].items():
-            anio = int(float(anio_str))
-            for mes_str, vigilantes_list in meses_data.items():
-                if not mes_str.replace('.', '').isdigit():
-                    continue
-                mes = int(float(mes_str))
-                
-                for vig_data in vigilantes_list:
-                    nombre = vig_data["nombre"]
-                    emp_id = all_emps.get(nombre)
-                    if not emp_id: continue
-                    
-                    # Eliminar antiguos del mes de un plumazo
-                    db.query(sql_models.Turno).filter(
-                        sql_models.Turno.empleado_id == emp_id,
-                        sql_models.Turno.anio == anio,
-                        sql_models.Turno.mes == mes
-                    ).delete(synchronize_session=False)
-                    
-                    turnos_objs = []
-                    for dia_str, t_info in vig_data.get("turnos", {}).items():
-                        if isinstance(t_info, dict):
-                            codigo, h_t, h_n, h_f, es_f = t_info.get("codigo", ""), float(t_info.get("t", 0)), float(t_info.get("n", 0)), float(t_info.get("f", 0)), bool(t_info.get("festivo", False))
-                        else:
-                            codigo, h_t, h_n, h_f, es_f = t_info, 0.0, 0.0, 0.0, False
-
-                        turnos_objs.append(sql_models.Turno(
-                            empleado_id=emp_id, anio=anio, mes=mes, 
-                            dia=int(float(dia_str)), codigo_turno=codigo,
-                            horas_trabajadas=h_t, horas_nocturnas=h_n, 
-                            horas_festivas=h_f, es_festivo=es_f
-                        ))
-                    
-                    if turnos_objs:
-                        db.bulk_save_objects(turnos_objs)
-
-        # 3. Sincronizar Configuración de Turnos
-        for codigo, config_data in data['config_turnos'].items():
-            db_config = db.query(sql_models.ConfiguracionTurno).filter(sql_models.ConfiguracionTurno.codigo == codigo).first()
-            if not db_config:
-                db_config = sql_models.ConfiguracionTurno(
-                    codigo=codigo,
-                    descripcion=config_data.get('leyenda'),
-                    horario=config_data.get('horario') or config_data.get('leyenda'),
-                    color=config_data.get('color_fondo') or config_data.get('color'),
-                    horas_total=float(config_data.get('trabajadas', 0)),
-                    horas_nocturnas=float(config_data.get('nocturnas', 0))
+    def config_turnos(self, config_turnos: Dict[str, Any]) -> None:
+        """
+        Sincroniza la configuración de turnos. Conviene enviarla antes que
+        los turnos: los calendarios pre-serializados incluyen la leyenda de
+        cada código. Si llega después y cambian las leyendas, los calendarios
+        ya escritos se invalidan (se regeneran al leerlos).
+        """
+        config_cambiada, descripciones_cambiadas = sync_config_turnos(self.db, config_turnos)
+        if config_cambiada:
+            version_service.incrementar(self.db, version_service.VERSION_CONFIG_TURNOS)
+        if descripciones_cambiadas:
+            self.volcar()
+            cache_service.invalidar_tipo(self.db, cache_service.TIPO_CALENDARIO)
+            self.db.flush()
+        self._descripciones = None
+
+    def mes(self, anio_str: str, mes_str: str, vigilantes: List[Dict[str, Any]]) -> None:
+        """Turnos de un mes de cuadrantes.json (lista de vigilantes con sus turnos)"""
+        if not str(mes_str).replace('.', '').isdigit():
+            return
+        for vig_data in vigilantes:
+            self.mes_empleado(anio_str, mes_str, vig_data["nombre"], vig_data.get("turnos", {}))
+
+    def _cargar_referencias(self) -> None:
+        """Ids de empleados, huellas guardadas y leyendas (una vez por sincronización)"""
+        if self._emp_ids is None:
+            self._emp_ids = {e.nombre_completo: e.id for e in self.db.query(sql_models.Empleado).all()}
+        if self._hashes_guardados is None:
+            self._hashes_guardados = get_hashes_guardados(self.db)
+        if self._descripciones is None:
+            self._descripciones = cache_service.get_descripciones(self.db)
+
+    def particion(self, db: Session) -> "Sincronizacion":
+        """
+        Sincronización hija sobre otra sesión para aplicar algunos meses en
+        paralelo: comparte empleados, leyendas y huellas guardadas (solo
+        lectura) y no toma el lock, que ya tiene el llamante (bloqueo_exclusivo).
+        """
+        self._cargar_referencias()
+        hija = Sincronizacion(db, self.modo, bloquear=False)
+        hija._ahora = self._ahora
+        hija._emp_ids = self._emp_ids
+        hija._descripciones = self._descripciones
+        hija._hashes_guardados = self._hashes_guardados
+        return hija
+
+    def sumar(self, hija: "Sincronizacion") -> None:
+        """Añade el progreso y las huellas de una partición ya confirmada"""
+        for clave, valor in hija.stats.items():
+            self.stats[clave] += valor
+        self.filas_escritas += hija.filas_escritas
+        self._hashes_nuevos.update(hija._hashes_nuevos)
+
+    def mes_empleado(self, anio_str: str, mes_str: str, nombre: str, turnos_mes: Dict[str, Any]) -> None:
+        """Turnos de un vigilante en un mes"""
+        db = self.db
+        self._cargar_referencias()
+
+        emp_id = self._emp_ids.get(nombre)
+        if not emp_id:
+            return
+        anio, mes = _parse_mes(anio_str, mes_str)
+
+        hash_mes = calcular_hash_mes(turnos_mes)
+        clave = (emp_id, anio, mes)
+        hash_previo = self._hashes_nuevos.get(clave, self._hashes_guardados.get(clave))
+        if self.modo == MODO_DELTA and hash_previo == hash_mes:
+            self.stats["meses_omitidos"] += 1
+            return
+
+        # Upsert de los días recibidos y borrado solo de los que ya no existen
+        filas_mes = construir_filas_turnos(emp_id, anio, mes, turnos_mes)
+        borrar_dias_obsoletos(db, emp_id, anio, mes, [f["dia"] for f in filas_mes])
+        self._filas.extend(filas_mes)
+
+        # Agregado mensual para los balances (sin volver a leer los turnos)
+        self._resumenes.append(empleados_service.resumen_mes(emp_id, anio, mes, filas_mes))
+
+        # Materializar las respuestas pre-serializadas del mes
+        self._documentos.extend(
+            cache_service.documentos_mes(emp_id, nombre, anio, mes, filas_mes, self._descripciones)
+        )
+
+        # Guardar huella del mes
+        if hash_previo != hash_mes:
+            self._huellas.append({
+                "empleado_id": emp_id, "anio": anio, "mes": mes,
+                "hash_contenido": hash_mes, "fecha_sync": self._ahora
+            })
+        self._hashes_nuevos[clave] = hash_mes
+        self.stats["meses_actualizados"] += 1
+
+        self.volcar(solo_llenos=True)
+
+    def volcar(self, solo_llenos: bool = False) -> None:
+        """Escribe los lotes pendientes (con solo_llenos, solo los que alcanzan su tamaño)"""
+        if self._filas and (not solo_llenos or len(self._filas) >= LOTE_UPSERT):
+            upsert_turnos(self.db, self._filas)
+            self.filas_escritas += len(self._filas)
+            self._filas = []
+        if self._resumenes and (not solo_llenos or len(self._resumenes) >= LOTE_UPSERT):
+            empleados_service.guardar_resumenes(self.db, self._resumenes)
+            self._resumenes = []
+        if self._documentos and (not solo_llenos or len(self._documentos) >= LOTE_DOCUMENTOS):
+            cache_service.guardar_documentos(self.db, self._documentos)
+            self._documentos = []
+        if self._huellas and (not solo_llenos or len(self._huellas) >= LOTE_UPSERT):
+            guardar_huellas(self.db, self._huellas)
+            self._huellas = []
+
+    def finalizar(self) -> Dict[str, int]:
+        """Vuelca lo pendiente, publica una nueva versión de los datos y hace commit"""
+        self.volcar()
+        # Nueva versión de los datos: invalida ETags de balances y turnos
+        version_service.incrementar(self.db)
+        self.db.commit()
+        return self.stats
+
+
+def aplicar_registros(sincronizacion: Sincronizacion, registros: List[Tuple[int, Dict[str, Any]]]) -> None:
+    """
+    Aplica registros de la subida NDJSON (número de línea, objeto). Tipos:
+      {"tipo": "empleados", "empleados": {nombre: datos}}
+      {"tipo": "empleado", "nombre": ..., <datos del empleado>}
+      {"tipo": "config_turnos", "config_turnos": {...}}
+      {"tipo": "mes", "anio": ..., "mes": ..., "vigilantes": [{"nombre", "turnos"}]}
+      {"tipo": "turnos", "anio": ..., "mes": ..., "nombre": ..., "turnos": {...}}
+      {"tipo": "festivos", ...} (se ignora, como en /full)
+    Los empleados consecutivos se agrupan en un solo paso.
+    ErrorNDJSON si un registro no es válido.
+    """
+    empleados: Dict[str, Any] = {}
+    for numero, registro in registros:
+        tipo = registro.get("tipo") if isinstance(registro, dict) else None
+        try:
+            if tipo == "empleado":
+                datos = {k: v for k, v in registro.items() if k not in ("tipo", "nombre")}
+                empleados[registro["nombre"]] = datos
+                continue
+            if empleados:
+                sincronizacion.empleados(empleados)
+                empleados = {}
+            if tipo == "empleados":
+                sincronizacion.empleados(registro["empleados"])
+            elif tipo == "config_turnos":
+                sincronizacion.config_turnos(registro["config_turnos"])
+            elif tipo == "mes":
+                sincronizacion.mes(str(registro["anio"]), str(registro["mes"]), registro["vigilantes"])
+            elif tipo == "turnos":
+                sincronizacion.mes_empleado(
+                    str(registro["anio"]), str(registro["mes"]), registro["nombre"], registro.get("turnos") or {}
                 )
-                db.add(db_config)
-            else:
-                db_config.descripcion = config_data.get('leyenda')
-                db_config.horario = config_data.get('horario') or config_data.get('leyenda')
-                db_config.color = config_data.get('color_fondo') or config_data.get('color')
-                db_config.horas_total = float(config_data.get('trabajadas', 0))
-                db_config.horas_nocturnas = float(config_data.get('nocturnas', 0))
+            elif tipo != "festivos":
+                raise ErrorNDJSON(f"tipo de registro desconocido: {tipo!r}", numero)
+        except ErrorNDJSON:
+            raise
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            raise ErrorNDJSON(f"registro {tipo!r} incompleto o mal formado ({e!r})", numero) from e
+    if empleados:
+        sincronizacion.empleados(empleados)
+
+
+def guardar_huellas(db: Session, huellas: List[Dict[str, Any]]) -> None:
+    """Inserta o actualiza huellas de meses en bloque"""
+    upsert(
+        db, sql_models.HashMes.__table__, huellas,
+        ("empleado_id", "anio", "mes"), ("hash_contenido", "fecha_sync")
+    )
+
+
+def aplicar_datos(sincronizacion: Sincronizacion, data: Dict[str, Any], trabajadores: int = 1) -> None:
+    """
+    Aplica el JSON completo del desktop (sin el commit final). Con más de
+    un trabajador los meses se aplican en paralelo (ver aplicar_en_paralelo).
+    """
+    # 1. Empleados y usuarios
+    sincronizacion.empleados(data['empleados'])
+    # 2. Configuración de turnos (antes que los turnos, por las leyendas)
+    sincronizacion.config_turnos(data['config_turnos'])
+    # 3. Turnos, mes a mes
+    particiones = [
+        (anio_str, mes_str, vigilantes_list)
+        for anio_str, meses_data in data['cuadrantes'].items()
+        for mes_str, vigilantes_list in meses_data.items()
+    ]
+    if trabajadores > 1 and len(particiones) > 1:
+        aplicar_en_paralelo(sincronizacion, particiones, trabajadores)
+        return
+    for anio_str, mes_str, vigilantes_list in particiones:
+        sincronizacion.mes(anio_str, mes_str, vigilantes_list)
+
+
+def _aplicar_particion(fabrica: sessionmaker, sincronizacion: Sincronizacion, particion: Tuple[str, str, List[Dict[str, Any]]]) -> Sincronizacion:
+    """Aplica un mes en su propia sesión y transacción"""
+    db = fabrica()
+    try:
+        hija = sincronizacion.particion(db)
+        hija.mes(*particion)
+        hija.volcar()
+        db.commit()
+        return hija
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
 
+
+def aplicar_en_paralelo(sincronizacion: Sincronizacion, particiones: List[Tuple[str, str, List[Dict[str, Any]]]], trabajadores: int) -> None:
+    """
+    Aplica los meses repartidos entre varias conexiones. Los meses son
+    independientes (cada uno escribe solo sus filas de turnos, resúmenes,
+    documentos y huellas), así que cada partición hace su propio commit.
+
+    Requiere que la sincronización se haya creado con bloquear=False dentro
+    de bloqueo_exclusivo: se confirman primero los empleados y la
+    configuración (los trabajadores deben verlos) y después cada mes.
+    Paso final de consistencia: los meses que fallen se reintentan en serie
+    en la sesión principal; si vuelven a fallar se publica igualmente una
+    versión nueva (otros meses ya están escritos) y se propaga el error.
+    Volver a sincronizar es idempotente, de modo que un reintento converge.
+    """
+    db = sincronizacion.db
+    sincronizacion.volcar()
+    sincronizacion._cargar_referencias()
+    db.commit()
+
+    fabrica = sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())
+    fallidas = []
+    with ThreadPoolExecutor(max_workers=min(trabajadores, len(particiones)), thread_name_prefix="sync") as pool:
+        futuros = {pool.submit(_aplicar_particion, fabrica, sincronizacion, p): p for p in particiones}
+        for futuro in as_completed(futuros):
+            try:
+                sincronizacion.sumar(futuro.result())
+            except Exception as e:
+                anio_str, mes_str, _ = futuros[futuro]
+                log_info(f"Sincronización paralela: {anio_str}/{mes_str} falló ({e}), se reintenta en serie")
+                fallidas.append(futuros[futuro])
+
+    try:
+        for anio_str, mes_str, vigilantes_list in fallidas:
+            sincronizacion.mes(anio_str, mes_str, vigilantes_list)
+    except Exception:
+        db.rollback()
+        version_service.incrementar(db)
         db.commit()
+        raise
+
+
+def sync_data(db: Session, data: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Sincroniza los datos del desktop (JSON completo) con la base de datos.
+    Ver Sincronizacion para el detalle de los modos. Con SYNC_WORKERS > 1
+    en PostgreSQL los meses se aplican en paralelo y la sincronización deja
+    de ser atómica (trabajadores_para, aplicar_en_paralelo).
+    """
+    trabajadores = trabajadores_para(db, data)
+    try:
+        with bloqueo_exclusivo(db) if trabajadores > 1 else nullcontext():
+            sincronizacion = Sincronizacion(db, data.get("modo") or MODO_COMPLETO, bloquear=trabajadores == 1)
+            aplicar_datos(sincronizacion, data, trabajadores)
+            return sincronizacion.finalizar()
     except Exception as e:
         db.rollback()
         raise e
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Servicio de sesiones de sincronización por trozos
+El desktop abre una sesión, sube trozos numerados (JSON parcial con
+empleados, config_turnos y/o cuadrantes de algunos meses) con su checksum,
+en cualquier orden y reintentando solo los que fallen, y al final la
+confirma: todos los trozos se aplican en una sola transacción. Si la
+conexión se corta, GET de la sesión dice qué trozos ya están guardados.
+"""
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import Any, Dict, Iterator, List, Optional
+from datetime import datetime, timedelta
+import gzip
+import hashlib
+import json
+import uuid
+import zlib
+
+from models import sql_models
+from services import sync_service
+
+ESTADO_ABIERTA = "abierta"
+ESTADO_CONFIRMADA = "confirmada"
+
+# Claves admitidas en un trozo (las mismas que el JSON de /full)
+CLAVES_TROZO = ("empleados", "config_turnos", "cuadrantes", "festivos")
+# Tamaño máximo de un trozo sin comprimir (un trozo suele ser uno o pocos meses)
+MAX_TROZO_BYTES = 8 * 1024 * 1024
+# Las sesiones sin confirmar se descartan pasado este tiempo
+CADUCIDAD_SESION = timedelta(hours=24)
+# Las confirmadas se conservan (con sus estadísticas) para que el desktop
+# pueda repetir la confirmación o consultar el resultado; después se borran
+RETENCION_CONFIRMADAS = timedelta(days=7)
+
+
+class ErrorSesion(Exception):
+    """Operación no válida sobre una sesión; codigo es el estado HTTP a devolver"""
+
+    def __init__(self, codigo: int, mensaje: str):
+        super().__init__(mensaje)
+        self.codigo = codigo
+
+
+def calcular_checksum(contenido: bytes) -> str:
+    """Checksum de un trozo: sha256 hex de su JSON sin comprimir"""
+    return hashlib.sha256(contenido).hexdigest()
+
+
+def descomprimir_trozo(contenido: bytes) -> bytes:
+    """
+    Descomprime un trozo gzip sin pasar de MAX_TROZO_BYTES (una bomba de
+    compresión se corta en cuanto supera el límite).
+    """
+    descompresor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    try:
+        salida = descompresor.decompress(contenido, MAX_TROZO_BYTES + 1)
+    except zlib.error as e:
+        raise ErrorSesion(400, f"Contenido gzip no válido ({e})") from e
+    if len(salida) > MAX_TROZO_BYTES:
+        raise ErrorSesion(413, f"Trozo demasiado grande (máximo {MAX_TROZO_BYTES} bytes sin comprimir)")
+    if not descompresor.eof:
+        raise ErrorSesion(400, "Contenido gzip truncado")
+    return salida
+
+
+def limpiar_caducadas(db: Session) -> None:
+    """
+    Borra las sesiones abiertas (y sus trozos) más antiguas que
+    CADUCIDAD_SESION y las confirmadas más antiguas que RETENCION_CONFIRMADAS
+    """
+    ahora = datetime.utcnow()
+    S, T = sql_models.SesionSync, sql_models.TrozoSync
+    caducada = or_(
+        and_(S.estado == ESTADO_ABIERTA, S.actualizado < ahora - CADUCIDAD_SESION),
+        and_(S.estado == ESTADO_CONFIRMADA, S.actualizado < ahora - RETENCION_CONFIRMADAS),
+    )
+    caducadas = db.query(S.id).filter(caducada)
+    db.query(T).filter(T.sesion_id.in_(caducadas.scalar_subquery())).delete(synchronize_session=False)
+    db.query(S).filter(caducada).delete(synchronize_session=False)
+
+
+def abrir(db: Session, modo: str, solicitado_por: Optional[str]) -> str:
+    """Abre una sesión y devuelve su id"""
+    limpiar_caducadas(db)
+    ahora = datetime.utcnow()
+    sesion = sql_models.SesionSync(
+        id=uuid.uuid4().hex, estado=ESTADO_ABIERTA, modo=modo,
+        solicitado_por=solicitado_por, creado=ahora, actualizado=ahora
+    )
+    db.add(sesion)
+    db.commit()
+    return sesion.id
+
+
+def _sesion_abierta(db: Session, sesion_id: str) -> sql_models.SesionSync:
+    sesion = db.get(sql_models.SesionSync, sesion_id)
+    if sesion is None:
+        raise ErrorSesion(404, "Sesión de sincronización no encontrada")
+    if sesion.estado != ESTADO_ABIERTA:
+        raise ErrorSesion(409, "La sesión ya está confirmada")
+    return sesion
+
+
+def _validar_cuadrantes(seq: int, cuadrantes: Dict[str, Any]) -> None:
+    """
+    Comprueba la estructura anio -> mes -> [{"nombre", "turnos"}] con el
+    mismo parser que aplicará confirmar(), para que un trozo mal formado se
+    rechace al subirlo y no al confirmar la sesión.
+    """
+    for anio_str, meses_data in cuadrantes.items():
+        if not isinstance(meses_data, dict):
+            raise ErrorSesion(400, f"Trozo {seq}: cuadrantes[{anio_str!r}] debe ser un objeto de meses")
+        for mes_str, vigilantes in meses_data.items():
+            if not str(mes_str).replace('.', '').isdigit():
+                continue  # claves que no son meses: confirmar() las ignora
+            donde = f"cuadrantes[{anio_str!r}][{mes_str!r}]"
+            if not isinstance(vigilantes, list):
+                raise ErrorSesion(400, f"Trozo {seq}: {donde} debe ser una lista de vigilantes")
+            try:
+                anio, mes = sync_service._parse_mes(anio_str, mes_str)
+                for vigilante in vigilantes:
+                    if not isinstance(vigilante, dict) or not isinstance(vigilante.get("nombre"), str):
+                        raise ErrorSesion(400, f"Trozo {seq}: {donde} tiene un vigilante sin nombre")
+                    turnos = vigilante.get("turnos") or {}
+                    if not isinstance(turnos, dict):
+                        raise ErrorSesion(400, f"Trozo {seq}: turnos de {vigilante['nombre']!r} en {donde} debe ser un objeto")
+                    sync_service.construir_filas_turnos(0, anio, mes, turnos)
+            except (TypeError, ValueError, AttributeError) as e:
+                raise ErrorSesion(400, f"Trozo {seq}: {donde} mal formado ({e})") from e
+
+
+def _validar_trozo(seq: int, datos: Any) -> None:
+    """Formato de un trozo: ErrorSesion(400) si confirmar() no podría aplicarlo"""
+    if not isinstance(datos, dict) or not datos or set(datos) - set(CLAVES_TROZO):
+        raise ErrorSesion(400, f"Trozo {seq}: debe ser un objeto con claves de {', '.join(CLAVES_TROZO)}")
+    if any(not isinstance(datos[clave], dict) for clave in datos if clave != "festivos"):
+        raise ErrorSesion(400, f"Trozo {seq}: empleados, config_turnos y cuadrantes deben ser objetos")
+    for clave in ("empleados", "config_turnos"):
+        if any(not isinstance(valor, dict) for valor in datos.get(clave, {}).values()):
+            raise ErrorSesion(400, f"Trozo {seq}: cada entrada de {clave} debe ser un objeto")
+    _validar_cuadrantes(seq, datos.get("cuadrantes", {}))
+
+
+def _trozo_repetido(db: Session, sesion_id: str, seq: int, checksum: str) -> bool:
+    """True si el trozo ya está guardado con ese checksum; 409 si lo está con otro"""
+    existente = db.get(sql_models.TrozoSync, (sesion_id, seq))
+    if existente is None:
+        return False
+    if existente.checksum != checksum.lower():
+        raise ErrorSesion(409, f"El trozo {seq} ya se recibió con otro contenido")
+    return True
+
+
+def guardar_trozo(db: Session, sesion_id: str, seq: int, contenido: bytes, checksum: str) -> bool:
+    """
+    Guarda un trozo tras comprobar su checksum y su formato. Reenviar un
+    trozo idéntico no hace nada (devuelve False); reenviarlo con otro
+    contenido es un conflicto.
+    """
+    sesion = _sesion_abierta(db, sesion_id)
+    if len(contenido) > MAX_TROZO_BYTES:
+        raise ErrorSesion(413, f"Trozo {seq} demasiado grande (máximo {MAX_TROZO_BYTES} bytes)")
+    if calcular_checksum(contenido) != checksum.lower():
+        raise ErrorSesion(400, f"Checksum del trozo {seq} no coincide")
+    try:
+        datos = json.loads(contenido)
+    except ValueError as e:
+        raise ErrorSesion(400, f"Trozo {seq}: JSON no válido ({e})") from e
+    _validar_trozo(seq, datos)
+
+    if _trozo_repetido(db, sesion_id, seq, checksum):
+        return False
+
+    ahora = datetime.utcnow()
+    db.add(sql_models.TrozoSync(
+        sesion_id=sesion_id, seq=seq, checksum=checksum.lower(),
+        datos=gzip.compress(contenido), recibido=ahora
+    ))
+    sesion.actualizado = ahora
+    try:
+        db.commit()
+    except IntegrityError:
+        # Otro PUT del mismo trozo se guardó a la vez: se compara con el suyo
+        db.rollback()
+        if _trozo_repetido(db, sesion_id, seq, checksum):
+            return False
+        raise
+    return True
+
+
+def _seqs_recibidos(db: Session, sesion_id: str) -> List[int]:
+    T = sql_models.TrozoSync
+    return [seq for (seq,) in db.query(T.seq).filter(T.sesion_id == sesion_id).order_by(T.seq)]
+
+
+def estado(db: Session, sesion_id: str) -> Dict[str, Any]:
+    """Estado de la sesión y trozos ya guardados (para reanudar la subida)"""
+    sesion = db.get(sql_models.SesionSync, sesion_id)
+    if sesion is None:
+        raise ErrorSesion(404, "Sesión de sincronización no encontrada")
+    recibidos = _seqs_recibidos(db, sesion_id)
+    siguiente = 0
+    for seq in recibidos:
+        if seq != siguiente:
+            break
+        siguiente += 1
+    return {
+        "sesion_id": sesion.id,
+        "estado": sesion.estado,
+        "modo": sesion.modo,
+        "recibidos": recibidos,
+        "siguiente": siguiente,
+        "estadisticas": json.loads(sesion.estadisticas) if sesion.estadisticas else None,
+    }
+
+
+def _trozos(db: Session, sesion_id: str) -> Iterator[Dict[str, Any]]:
+    """Trozos de la sesión en orden de secuencia, descomprimidos de uno en uno"""
+    T = sql_models.TrozoSync
+    for (seq,) in db.query(T.seq).filter(T.sesion_id == sesion_id).order_by(T.seq).all():
+        trozo = db.get(T, (sesion_id, seq))
+        datos = json.loads(gzip.decompress(trozo.datos))
+        db.expunge(trozo)
+        yield datos
+
+
+def confirmar(db: Session, sesion_id: str, total_trozos: int) -> Dict[str, int]:
+    """
+    Aplica todos los trozos (0..total_trozos-1) en una sola transacción:
+    primero los empleados de todos ellos, luego la configuración y por
+    último los cuadrantes, sea cual sea el orden de subida. Confirmar de
+    nuevo una sesión ya confirmada devuelve el mismo resultado (durante
+    RETENCION_CONFIRMADAS; después la sesión se borra).
+    """
+    try:
+        sesion = db.get(sql_models.SesionSync, sesion_id)
+        if sesion is None:
+            raise ErrorSesion(404, "Sesión de sincronización no encontrada")
+        if sesion.estado == ESTADO_CONFIRMADA:
+            db.rollback()
+            return json.loads(sesion.estadisticas or "{}")
+
+        recibidos = set(_seqs_recibidos(db, sesion_id))
+        faltan = sorted(set(range(total_trozos)) - recibidos)
+        sobran = sorted(recibidos - set(range(total_trozos)))
+        if faltan or sobran:
+            raise ErrorSesion(409, f"Trozos incompletos: faltan {faltan}, sobran {sobran}")
+
+        # El lock global solo se toma cuando ya se sabe que hay algo que aplicar
+        sincronizacion = sync_service.Sincronizacion(db, sesion.modo)
+        db.refresh(sesion)
+        if sesion.estado == ESTADO_CONFIRMADA:
+            # Otra petición la confirmó mientras se esperaba el lock
+            db.rollback()
+            return json.loads(sesion.estadisticas or "{}")
+        for datos in _trozos(db, sesion_id):
+            if datos.get("empleados"):
+                sincronizacion.empleados(datos["empleados"])
+        for datos in _trozos(db, sesion_id):
+            if datos.get("config_turnos"):
+                sincronizacion.config_turnos(datos["config_turnos"])
+        for datos in _trozos(db, sesion_id):
+            for anio_str, meses_data in (datos.get("cuadrantes") or {}).items():
+                for mes_str, vigilantes in meses_data.items():
+                    sincronizacion.mes(anio_str, mes_str, vigilantes)
+        sincronizacion.volcar()
+
+        # Los trozos ya no hacen falta: se borran en la misma transacción
+        db.query(sql_models.TrozoSync).filter(
+            sql_models.TrozoSync.sesion_id == sesion_id
+        ).delete(synchronize_session=False)
+        sesion.estado = ESTADO_CONFIRMADA
+        sesion.estadisticas = json.dumps(sincronizacion.stats)
+        sesion.actualizado = datetime.utcnow()
+        return sincronizacion.finalizar()
+    except Exception:
+        db.rollback()
+        raise
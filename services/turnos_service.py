@@ -4,77 +4,112 @@ Servicio de Turnos
 Lógica de negocio para operaciones relacionadas con turnos.
 """
 
+from sqlalchemy import func, update
 from sqlalchemy.orm import Session
 from datetime import date, timedelta
-import json
-import os
-from typing import List, Dict
+from typing import List, Dict, Any, Iterable, Optional
 
-from models.sql_models import Empleado, Turno as TurnoDB, ConfiguracionTurno
+from models.sql_models import Empleado, Turno as TurnoDB, fecha_turno
 from routers.turnos import ProximoTurno
+from services import config_turnos_service
+from utils.desktop_data import fechas_festivas
 
+# Ventana máxima de /api/turnos/proximos-turnos
+MAX_DIAS_PROXIMOS = 366
 
-def cargar_datos_desktop(archivo: str) -> dict:
-    """Carga datos desde los JSON del proyecto desktop"""
-    desktop_path = os.getenv("DESKTOP_DATA_PATH", "../../proyecto_modulo_cuadrante/datos_cuadrante")
-    ruta_completa = os.path.join(desktop_path, archivo)
-    
-    try:
-        with open(ruta_completa, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
 
-def get_proximos_turnos_empleado(db: Session, empleado_id: int, dias: int) -> List[ProximoTurno]:
+def rellenar_fechas(db: Session, lote: int = 5000) -> int:
+    """
+    Rellena turnos.fecha en las filas que no la tienen (datos anteriores a la
+    columna). Devuelve el número de filas actualizadas.
+    """
+    total = 0
+    ultimo_id = 0
+    while True:
+        filas = db.query(TurnoDB.id, TurnoDB.anio, TurnoDB.mes, TurnoDB.dia).filter(
+            TurnoDB.fecha.is_(None),
+            TurnoDB.id > ultimo_id
+        ).order_by(TurnoDB.id).limit(lote).all()
+        if not filas:
+            return total
+        ultimo_id = filas[-1].id
+        cambios = [
+            {"id": f.id, "fecha": fecha}
+            for f in filas
+            if (fecha := fecha_turno(f.anio, f.mes, f.dia)) is not None
+        ]
+        if cambios:
+            db.execute(update(TurnoDB), cambios)
+            total += len(cambios)
+
+
+def get_turnos_rango(
+    db: Session,
+    desde: date,
+    hasta: date,
+    empleado_id: Optional[int] = None,
+    codigos: Optional[Iterable[str]] = None
+) -> List[TurnoDB]:
+    """
+    Turnos con fecha en [desde, hasta], ordenados por fecha.
+    Opcionalmente de un solo empleado y/o de ciertos códigos de turno.
+    """
+    query = db.query(TurnoDB).filter(TurnoDB.fecha.between(desde, hasta))
+    if empleado_id is not None:
+        query = query.filter(TurnoDB.empleado_id == empleado_id)
+    if codigos is not None:
+        query = query.filter(TurnoDB.codigo_turno.in_(list(codigos)))
+    return query.order_by(TurnoDB.fecha, TurnoDB.empleado_id).all()
+
+
+def get_cobertura_rango(db: Session, desde: date, hasta: date) -> Dict[date, Dict[str, int]]:
+    """Número de empleados por fecha y código de turno en [desde, hasta]"""
+    filas = db.query(TurnoDB.fecha, TurnoDB.codigo_turno, func.count()).filter(
+        TurnoDB.fecha.between(desde, hasta)
+    ).group_by(TurnoDB.fecha, TurnoDB.codigo_turno).all()
+    cobertura: Dict[date, Dict[str, int]] = {}
+    for fecha, codigo, n in filas:
+        cobertura.setdefault(fecha, {})[codigo] = n
+    return cobertura
+
+
+def get_proximos_turnos_empleado(
+    db: Session,
+    empleado_id: int,
+    dias: int,
+    config_turnos: Optional[Dict[str, Dict[str, Any]]] = None
+) -> List[ProximoTurno]:
     """
     Obtiene los próximos turnos de un empleado desde la base de datos.
+    Solo consulta la ventana [hoy, hoy + dias] (índice por empleado y fecha).
+    config_turnos es la configuración cacheada (dependencia get_config_turnos).
     """
+    dias = max(0, min(dias, MAX_DIAS_PROXIMOS))
     hoy = date.today()
-    
-    # Cargar festivos
-    festivos_data = cargar_datos_desktop("festivos.json")
-    festivos_nacionales = festivos_data.get("nacional", {})
-    festivos_comunidad = festivos_data.get("comunidad", {})
-    festivos_locales = festivos_data.get("local", {})
-
-    turnos_db = db.query(TurnoDB).filter(
-        TurnoDB.empleado_id == empleado_id,
-        TurnoDB.anio >= hoy.year,
-    ).all()
-    
-    turnos_config = {t.codigo: t for t in db.query(ConfiguracionTurno).all()}
+    hasta = hoy + timedelta(days=dias)
+
+    festivos = fechas_festivas()
+
+    turnos_db = get_turnos_rango(db, hoy, hasta, empleado_id=empleado_id)
+
+    turnos_config = config_turnos if config_turnos is not None else config_turnos_service.obtener(db)
 
     proximos_turnos = []
-    for i in range(dias + 1):
-        fecha_actual = hoy + timedelta(days=i)
-        
-        # Comprobar si es festivo o fin de semana
-        anio_str = str(fecha_actual.year)
-        mes_str = str(fecha_actual.month)
-        dia_str = str(fecha_actual.day)
-        
-        es_festivo = False
-        if anio_str in festivos_data and mes_str in festivos_data[anio_str]:
-            dias_festivos_mes = festivos_data[anio_str][mes_str]
-            if dia_str in [str(d) for d in dias_festivos_mes]:
-                es_festivo = True
-        
-        # También fin de semana
-        if fecha_actual.weekday() >= 5:
-            es_festivo = True
-        
-        turno_en_fecha = next((t for t in turnos_db if t.anio == fecha_actual.year and t.mes == fecha_actual.month and t.dia == fecha_actual.day), None)
-
-        if turno_en_fecha:
-            config_turno = turnos_config.get(turno_en_fecha.codigo_turno)
-            if config_turno:
-                # Usar el modelo Pydantic directamente para construir el objeto
-                proximos_turnos.append(ProximoTurno(
-                    fecha=fecha_actual,
-                    codigo_turno=turno_en_fecha.codigo_turno,
-                    descripcion=config_turno.descripcion,
-                    horario=config_turno.horario,
-                    es_festivo=es_festivo
-                ))
-
-    return sorted(proximos_turnos, key=lambda t: t.fecha)
+    for turno_en_fecha in turnos_db:
+        fecha_actual = turno_en_fecha.fecha
+        config_turno = turnos_config.get(turno_en_fecha.codigo_turno)
+        if not config_turno:
+            continue
+
+        # Festivo del calendario o fin de semana
+        es_festivo = fecha_actual in festivos or fecha_actual.weekday() >= 5
+
+        proximos_turnos.append(ProximoTurno(
+            fecha=fecha_actual,
+            codigo_turno=turno_en_fecha.codigo_turno,
+            descripcion=config_turno["descripcion"],
+            horario=config_turno["horario"],
+            es_festivo=es_festivo
+        ))
+
+    return proximos_turnos
@@ -4,9 +4,13 @@ Servicio de vacaciones
 Lógica de negocio para gestión de solicitudes de vacaciones
 """
 
-from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
 from models import sql_models
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from services import version_service
+from utils.pagination import paginar_por_fecha
 
 def create_solicitud(
     db: Session, 
@@ -25,13 +29,16 @@ def create_solicitud(
         fecha_solicitud=datetime.utcnow()
     )
     db.add(nueva_vacacion)
+    version_service.incrementar(db)
     db.commit()
     db.refresh(nueva_vacacion)
     return nueva_vacacion
 
 def get_mis_solicitudes(db: Session, user_id: int):
     """Obtiene todas las solicitudes de un usuario"""
-    return db.query(sql_models.Vacacion).filter(
+    return db.query(sql_models.Vacacion).options(
+        joinedload(sql_models.Vacacion.solicitante)
+    ).filter(
         sql_models.Vacacion.solicitante_id == user_id
     ).order_by(sql_models.Vacacion.fecha_solicitud.desc()).all()
 
@@ -44,10 +51,42 @@ def get_solicitud_by_id(db: Session, vacacion_id: int):
 def update_estado(db: Session, vacacion: sql_models.Vacacion, nuevo_estado: str):
     """Actualiza el estado de una solicitud"""
     vacacion.estado = nuevo_estado
+    version_service.incrementar(db)
     db.commit()
     db.refresh(vacacion)
     return vacacion
 
-def get_all_solicitudes(db: Session):
-    """Obtiene todas las solicitudes de vacaciones (para modo administrador)"""
-    return db.query(sql_models.Vacacion).order_by(sql_models.Vacacion.fecha_solicitud.desc()).all()
+def get_all_solicitudes(
+    db: Session,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    estado: Optional[str] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    usuario_id: Optional[int] = None
+) -> Tuple[List[sql_models.Vacacion], Optional[str]]:
+    """
+    Obtiene las solicitudes de vacaciones (para modo administrador), de la
+    más reciente a la más antigua. Con limit se pagina por cursor sobre
+    (fecha_solicitud, id). Devuelve (solicitudes, cursor siguiente o None).
+    """
+    V = sql_models.Vacacion
+    # El solicitante se carga en la misma consulta (evita N+1 al mapear la respuesta)
+    query = db.query(V).options(joinedload(V.solicitante))
+    if estado:
+        query = query.filter(V.estado == estado)
+    if desde:
+        query = query.filter(V.fecha_solicitud >= desde)
+    if hasta:
+        query = query.filter(V.fecha_solicitud < hasta)
+    if usuario_id is not None:
+        query = query.filter(V.solicitante_id == usuario_id)
+
+    if limit is None:
+        return query.order_by(V.fecha_solicitud.desc(), V.id.desc()).all(), None
+    return paginar_por_fecha(query, V.fecha_solicitud, V.id, limit, cursor)
+
+def contar_por_estado(db: Session) -> Dict[str, int]:
+    """Número de solicitudes por estado (una consulta agrupada)"""
+    V = sql_models.Vacacion
+    return dict(db.query(V.estado, func.count(V.id)).group_by(V.estado).all())
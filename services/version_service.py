@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Servicio de versiones
+Contadores de versión persistentes que cambian cada vez que cambian los
+datos que sirve la API. Sirven para derivar validadores HTTP (ETag,
+Last-Modified) y para invalidar cachés en memoria entre workers.
+"""
+
+from sqlalchemy.orm import Session
+from typing import Optional, Tuple
+from datetime import datetime
+
+from models import sql_models
+from models.database import upsert
+
+# Cuadrantes, balances, permutas y vacaciones
+VERSION_DATOS = "datos"
+# Configuración de turnos (invalida la caché en memoria de config_turnos_service)
+VERSION_CONFIG_TURNOS = "config_turnos"
+
+
+def incrementar(db: Session, clave: str = VERSION_DATOS) -> None:
+    """
+    Incrementa el contador dentro de la transacción en curso
+    (el llamante hace el commit junto con el resto de cambios).
+    """
+    ahora = datetime.utcnow()
+    actualizadas = db.query(sql_models.VersionDatos).filter(
+        sql_models.VersionDatos.clave == clave
+    ).update(
+        {
+            sql_models.VersionDatos.version: sql_models.VersionDatos.version + 1,
+            sql_models.VersionDatos.actualizado: ahora
+        },
+        synchronize_session=False
+    )
+    if not actualizadas:
+        upsert(
+            db, sql_models.VersionDatos.__table__,
+            [{"clave": clave, "version": 1, "actualizado": ahora}],
+            ["clave"], ["version", "actualizado"]
+        )
+
+
+def obtener(db: Session, clave: str = VERSION_DATOS) -> Tuple[int, Optional[datetime]]:
+    """Devuelve (versión, fecha de la última modificación) del contador"""
+    fila = db.get(sql_models.VersionDatos, clave)
+    if not fila:
+        return 0, None
+    return fila.version, fila.actualizado
@@ -64,9 +64,32 @@ export const api = {
         return await response.json();
     },
 
-    // Get schedule for a specific month
-    async getSchedule(token, year, month) {
-        const response = await fetch(`${API_URL}/api/schedule/${year}/${month}`, {
+    // Search employees by name prefix (accent-insensitive), one page at a time
+    async searchEmployees(token, { q = '', cursor = null, limit = 20 } = {}) {
+        const params = new URLSearchParams({ limit: String(limit) });
+        if (q) params.set('q', q);
+        if (cursor) params.set('cursor', cursor);
+
+        const response = await fetch(`${API_URL}/api/empleados/?${params}`, {
+            headers: {
+                'Authorization': `Bearer ${token}`
+            }
+        });
+
+        if (!response.ok) {
+            throw new Error('Error al buscar empleados');
+        }
+
+        return {
+            empleados: await response.json(),
+            siguienteCursor: response.headers.get('X-Next-Cursor')
+        };
+    },
+
+    // Get schedule for a specific month (compact = parallel arrays instead of one object per day)
+    async getSchedule(token, year, month, { compact = false } = {}) {
+        const query = compact ? '?format=compact' : '';
+        const response = await fetch(`${API_URL}/api/schedule/${year}/${month}${query}`, {
             headers: {
                 'Authorization': `Bearer ${token}`
             }
@@ -79,6 +102,39 @@ export const api = {
         return await response.json();
     },
 
+    // Get several months in one request (from/to as 'YYYY-MM', both included)
+    async getScheduleRange(token, from, to, employeeId = null) {
+        const params = new URLSearchParams({ from, to });
+        if (employeeId !== null) params.set('empleado_id', String(employeeId));
+
+        const response = await fetch(`${API_URL}/api/schedule/range?${params}`, {
+            headers: {
+                'Authorization': `Bearer ${token}`
+            }
+        });
+
+        if (!response.ok) {
+            throw new Error('Error al obtener cuadrante');
+        }
+
+        return await response.json();
+    },
+
+    // Whole-team month grid (coordinators): one code string per employee, one char per day
+    async getTeamSchedule(token, year, month) {
+        const response = await fetch(`${API_URL}/api/turnos/equipo/${year}/${month}`, {
+            headers: {
+                'Authorization': `Bearer ${token}`
+            }
+        });
+
+        if (!response.ok) {
+            throw new Error('Error al obtener cuadrante del equipo');
+        }
+
+        return await response.json();
+    },
+
     // Request Vacation
     async requestVacation(token, startDate, endDate, reason) {
         const response = await fetch(`${API_URL}/api/vacaciones/solicitar`, {
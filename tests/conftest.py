@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import os
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
@@ -6,6 +8,8 @@ from sqlalchemy.orm import sessionmaker
 
 from main import app
 from models.database import Base, get_db
+from services import cache_service, config_turnos_service
+from routers.dependencias import limpiar_identidades
 
 # --- Configuración de la base de datos de prueba ---
 # --- Configuración de la base de datos de prueba ---
@@ -45,6 +49,10 @@ def db_session():
     for table in reversed(Base.metadata.sorted_tables):
         db.execute(table.delete())
     db.commit()
+    # Las cachés en memoria del proceso no deben sobrevivir entre pruebas
+    config_turnos_service.invalidar()
+    cache_service.limpiar_equipo()
+    limpiar_identidades()
     try:
         yield db
     finally:
@@ -61,3 +69,24 @@ def client(db_session):
         yield c
     # Restaurar la dependencia original
     app.dependency_overrides[get_db] = get_db
+
+
+# --- PostgreSQL (opcional) ---
+# Las pruebas marcadas con requiere_postgres solo se ejecutan si
+# TEST_POSTGRES_URL apunta a una base de pruebas (se crean y vacían sus tablas)
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+requiere_postgres = pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL no definida")
+
+@pytest.fixture(scope="function")
+def postgres_session():
+    """Sesión sobre TEST_POSTGRES_URL con las tablas recién creadas."""
+    engine = create_engine(TEST_POSTGRES_URL)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
@@ -165,3 +165,83 @@ def test_refresh_token(client):
         )
         # Debería retornar nuevo token
         assert response.status_code in [200, 401]
+
+
+def test_identidad_cacheada_por_sujeto(db_session: Session):
+    """Un token sin claims de ids se resuelve una vez y luego por clave primaria."""
+    from sqlalchemy import event
+    from routers.dependencias import get_identidad
+    from tests.conftest import engine as test_engine
+
+    empleado = Empleado(nombre_completo="Ana Cache", email="ana.cache@example.com")
+    db_session.add(empleado)
+    db_session.flush()
+    usuario = User(email="ana.cache@example.com", hashed_password="x", full_name="Ana Cache", empleado_id=empleado.id)
+    db_session.add(usuario)
+    db_session.commit()
+    token_antiguo = {"email": "ana.cache@example.com", "nombre": "Ana Cache", "rol": "vigilante"}
+
+    consultas = []
+    def contar(conn, cursor, statement, *args):
+        consultas.append(statement)
+    event.listen(test_engine, "before_cursor_execute", contar)
+    try:
+        identidad = get_identidad(token_antiguo, db_session)
+        assert identidad.usuario.id == usuario.id
+        assert identidad.empleado.id == empleado.id
+        primera = len(consultas)
+
+        db_session.expunge_all()
+        consultas.clear()
+        identidad = get_identidad(token_antiguo, db_session)
+        assert identidad.usuario.id == usuario.id
+        assert identidad.empleado_id == empleado.id
+        # Solo la búsqueda del usuario por clave primaria
+        assert len(consultas) == 1 < primera
+    finally:
+        event.remove(test_engine, "before_cursor_execute", contar)
+
+
+def test_claim_empleado_id_obsoleto_no_da_acceso(db_session: Session):
+    """El empleado se toma del vínculo en BD, no del claim empleado_id del token."""
+    from routers.dependencias import get_identidad
+
+    propio = Empleado(nombre_completo="Propio Claim")
+    ajeno = Empleado(nombre_completo="Ajeno Claim")
+    db_session.add_all([propio, ajeno])
+    db_session.flush()
+    usuario = User(email="claim@example.com", hashed_password="x", full_name="Propio Claim", empleado_id=propio.id)
+    db_session.add(usuario)
+    db_session.commit()
+
+    token = {"email": "claim@example.com", "rol": "vigilante", "user_id": usuario.id, "empleado_id": ajeno.id}
+    assert get_identidad(token, db_session).empleado_id == propio.id
+
+
+def test_refresh_con_user_id_de_otra_cuenta(client, db_session: Session):
+    """Un user_id que no corresponde al sujeto del token no da acceso a esa cuenta."""
+    from utils.security import create_access_token
+
+    otro = User(email="otro.refresh@example.com", hashed_password="x", full_name="Otro", role="coordinador")
+    db_session.add(otro)
+    db_session.commit()
+
+    token = create_access_token({"sub": "fantasma@example.com", "rol": "vigilante", "user_id": otro.id})
+    response = client.post("/api/auth/refresh", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
+
+
+def test_token_de_usuario_inexistente_no_usa_otro(client, db_session: Session):
+    """Un JWT válido de un usuario que no existe recibe 401, no los datos de otro usuario."""
+    from utils.security import create_access_token
+
+    empleado = Empleado(nombre_completo="Real")
+    db_session.add(empleado)
+    db_session.flush()
+    db_session.add(User(email="real@example.com", hashed_password="x", full_name="Real", empleado_id=empleado.id))
+    db_session.commit()
+
+    token = create_access_token({"sub": "ghost@example.com", "rol": "vigilante"})
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/api/empleados/balance/2025", headers=headers).status_code == 401
+    assert client.get(f"/api/schedule/2025/1/empleado/{empleado.id}", headers=headers).status_code == 401
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Tests para models.database
+Verifica la carga masiva (COPY) de upsert_masivo. Las pruebas contra
+PostgreSQL solo se ejecutan si TEST_POSTGRES_URL apunta a una base de
+pruebas (se crean y vacían sus tablas).
+"""
+
+from contextlib import contextmanager
+from datetime import date
+
+from models.database import _copiar, _valor_copy, upsert, upsert_masivo
+from models.sql_models import Empleado, HashMes, Turno, TurnoResumen, fecha_turno
+from services.sync_service import CLAVE_TURNO, COLUMNAS_DATOS_TURNO, Sincronizacion
+from tests.conftest import requiere_postgres
+
+
+def test_valor_copy_formato_csv():
+    """NULL sin comillas, booleanos t/f, números tal cual y el resto entre comillas."""
+    assert _valor_copy(None) == "\\N"
+    assert _valor_copy(True) == "t"
+    assert _valor_copy(False) == "f"
+    assert _valor_copy(7) == "7"
+    assert _valor_copy(8.5) == "8.5"
+    assert _valor_copy(date(2025, 1, 2)) == '"2025-01-02"'
+    # Comillas, comas, saltos de línea y un "\N" literal no se confunden con NULL
+    assert _valor_copy('N"1,\nx') == '"N""1,\nx"'
+    assert _valor_copy("\\N") == '"\\N"'
+
+
+class CursorPsycopg2:
+    def __init__(self):
+        self.copias = []
+
+    def copy_expert(self, sql, fichero):
+        self.copias.append((sql, fichero.read()))
+
+
+class CursorPsycopg3:
+    def __init__(self):
+        self.copias = []
+
+    @contextmanager
+    def copy(self, sql):
+        escrito = []
+
+        class Copia:
+            def write(self, datos):
+                escrito.append(datos)
+        yield Copia()
+        self.copias.append((sql, "".join(escrito)))
+
+
+def test_copiar_segun_driver():
+    """COPY con copy_expert (psycopg2) o cursor.copy (psycopg 3); False con otros drivers."""
+    for cursor in (CursorPsycopg2(), CursorPsycopg3()):
+        assert _copiar(cursor, "COPY t FROM STDIN", "1,2\n") is True
+        assert cursor.copias == [("COPY t FROM STDIN", "1,2\n")]
+    assert _copiar(object(), "COPY t FROM STDIN", "1,2\n") is False
+
+
+@requiere_postgres
+def test_upsert_masivo_postgres_copy_y_merge(postgres_session):
+    """COPY a staging y merge con ON CONFLICT: inserta, actualiza, deduplica y respeta NULL y comillas."""
+    db = postgres_session
+    empleado = Empleado(nombre_completo="Masivo PG")
+    db.add(empleado)
+    db.commit()
+
+    def fila(dia, codigo, horas=8.0, festivo=False):
+        return {
+            "empleado_id": empleado.id, "anio": 2025, "mes": 3, "dia": dia,
+            "fecha": fecha_turno(2025, 3, dia), "codigo_turno": codigo, "horas_trabajadas": horas,
+            "horas_nocturnas": 0.0, "horas_festivas": 0.0, "es_festivo": festivo
+        }
+
+    tabla = Turno.__table__
+    upsert_masivo(db, tabla, [fila(1, "M"), fila(2, 'N"1,x'), fila(3, None, horas=None)], CLAVE_TURNO, COLUMNAS_DATOS_TURNO)
+    db.commit()
+    upsert_masivo(db, tabla, [fila(2, "T"), fila(2, "L", festivo=True), fila(4, "\\N")], CLAVE_TURNO, COLUMNAS_DATOS_TURNO)
+    db.commit()
+
+    turnos = {t.dia: t for t in db.query(Turno).filter(Turno.empleado_id == empleado.id)}
+    assert {d: t.codigo_turno for d, t in turnos.items()} == {1: "M", 2: "L", 3: None, 4: "\\N"}
+    assert turnos[2].es_festivo is True
+    assert turnos[3].horas_trabajadas is None
+    assert turnos[1].fecha == date(2025, 3, 1)
+
+
+@requiere_postgres
+def test_upsert_postgres_claves_repetidas(postgres_session):
+    """upsert() con la misma clave dos veces en un lote no falla en PostgreSQL: gana la última fila."""
+    db = postgres_session
+    empleado = Empleado(nombre_completo="Repetido PG")
+    db.add(empleado)
+    db.commit()
+
+    def huella(valor):
+        return {"empleado_id": empleado.id, "anio": 2025, "mes": 12, "hash_contenido": valor, "fecha_sync": None}
+
+    upsert(db, HashMes.__table__, [huella("a"), huella("b")], ("empleado_id", "anio", "mes"), ("hash_contenido", "fecha_sync"))
+    db.commit()
+    assert [h.hash_contenido for h in db.query(HashMes)] == ["b"]
+
+    # Meses "12" y "12.0" del desktop: resúmenes, documentos y huellas del mismo mes en un lote
+    sincronizacion = Sincronizacion(db)
+    sincronizacion.mes("2025", "12", [{"nombre": "Repetido PG", "turnos": {"1": "M"}}])
+    sincronizacion.mes("2025", "12.0", [{"nombre": "Repetido PG", "turnos": {"1": "N"}}])
+    sincronizacion.finalizar()
+
+    assert [t.codigo_turno for t in db.query(Turno)] == ["N"]
+    assert db.query(TurnoResumen).count() == 1
+    assert db.query(HashMes).count() == 1
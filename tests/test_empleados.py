@@ -206,3 +206,118 @@ def test_get_balance_mes_negativo(client):
     )
     # Debería rechazar mes < 1
     assert response.status_code in [400, 422, 401]
+
+
+def test_balance_etag_304_hasta_nueva_version(client, db_session):
+    """El balance responde 304 mientras no cambie la versión de los datos."""
+    from services import version_service
+    from services.auth_service import create_user
+    create_user(db_session, {"email": "test@example.com", "password": "x", "full_name": "Test User"})
+    headers = {"Authorization": "Bearer fake_token"}
+    response = client.get("/api/empleados/balance/2025", headers=headers)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = client.get("/api/empleados/balance/2025", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    # Un sync o un cambio de estado incrementa la versión: el cliente recibe datos nuevos
+    version_service.incrementar(db_session)
+    db_session.commit()
+    response = client.get("/api/empleados/balance/2025", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+    response = client.get(
+        "/api/empleados/balance/2025",
+        headers={**headers, "If-Modified-Since": response.headers["last-modified"]}
+    )
+    assert response.status_code == 304
+
+
+def test_balances_todos_coordinador(client, db_session):
+    """Balances de todos los empleados: una consulta agrupada, paginada y ordenada."""
+    from models.sql_models import TurnoResumen
+    from services.auth_service import create_user
+    from tests.test_sync import TEST_COORDINADOR
+
+    ana = Empleado(nombre_completo="Ana")
+    beto = Empleado(nombre_completo="Beto")
+    carla = Empleado(nombre_completo="Carla")  # sin turnos: aparece con 0 horas
+    db_session.add_all([ana, beto, carla])
+    db_session.flush()
+    db_session.add_all([
+        TurnoResumen(empleado_id=ana.id, anio=2025, mes=1, horas_trabajadas=150.0,
+                     dias_trabajados=13, dias_vacaciones=0, dias_baja=0),
+        TurnoResumen(empleado_id=ana.id, anio=2025, mes=2, horas_trabajadas=100.0,
+                     dias_trabajados=9, dias_vacaciones=3, dias_baja=0),
+        TurnoResumen(empleado_id=beto.id, anio=2025, mes=1, horas_trabajadas=120.0,
+                     dias_trabajados=10, dias_vacaciones=0, dias_baja=2),
+        TurnoResumen(empleado_id=beto.id, anio=2024, mes=12, horas_trabajadas=500.0,
+                     dias_trabajados=40, dias_vacaciones=0, dias_baja=0),
+    ])
+    db_session.commit()
+
+    # Solo coordinadores
+    response = client.get("/api/empleados/balances/2025", headers={"Authorization": "Bearer fake_token"})
+    assert response.status_code in [401, 403]
+
+    create_user(db_session, TEST_COORDINADOR)
+    token = client.post(
+        "/api/auth/login",
+        data={"username": TEST_COORDINADOR["email"], "password": TEST_COORDINADOR["password"]}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    data = client.get("/api/empleados/balances/2025?orden=balance_desc", headers=headers).json()
+    assert data["total"] == 3
+    assert [b["nombre"] for b in data["balances"]] == ["Ana", "Beto", "Carla"]
+    assert data["balances"][0]["total_horas_trabajadas"] == 250.0
+    assert data["balances"][0]["balance_horas"] == 250.0 - 1768.0
+    assert data["balances"][0]["dias_vacaciones"] == 3
+    assert data["balances"][1]["dias_baja"] == 2
+    assert data["balances"][2]["total_horas_trabajadas"] == 0
+
+    pagina = client.get("/api/empleados/balances/2025?skip=1&limit=1", headers=headers).json()
+    assert [b["nombre"] for b in pagina["balances"]] == ["Beto"]
+
+    mensual = client.get("/api/empleados/balances/2025?mes=1&orden=nombre", headers=headers).json()
+    assert [b["total_horas_trabajadas"] for b in mensual["balances"]] == [150.0, 120.0, 0.0]
+    assert mensual["balances"][0]["horas_convenio"] == 147.3
+
+    assert client.get("/api/empleados/balances/2025?orden=otro", headers=headers).status_code == 400
+
+
+def test_listar_empleados_busqueda_y_cursor(client, db_session):
+    """Búsqueda por prefijo sin acentos y páginas por cursor en orden estable."""
+    db_session.add_all([
+        Empleado(nombre_completo="Álvaro Núñez"),
+        Empleado(nombre_completo="alvarez  Pérez"),
+        Empleado(nombre_completo="Beatriz Soto"),
+        Empleado(nombre_completo="Álvaro Núñez"),  # homónimo: desempata el id
+    ])
+    db_session.commit()
+    headers = {"Authorization": "Bearer fake_token"}
+
+    response = client.get("/api/empleados/?q=ALVA", headers=headers)
+    assert response.status_code == 200
+    assert [e["nombre_completo"] for e in response.json()] == ["alvarez  Pérez", "Álvaro Núñez", "Álvaro Núñez"]
+    assert "X-Next-Cursor" not in response.headers
+
+    assert client.get("/api/empleados/?q=alvaro%20nu", headers=headers).json()[0]["nombre_completo"] == "Álvaro Núñez"
+    assert client.get("/api/empleados/?q=%25", headers=headers).json() == []
+
+    vistos = []
+    cursor = None
+    while True:
+        url = "/api/empleados/?limit=1" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url, headers=headers)
+        vistos.extend(e["id"] for e in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    todos = client.get("/api/empleados/", headers=headers).json()
+    assert vistos == [e["id"] for e in todos]
+    assert len(vistos) == 4
+
+    assert client.get("/api/empleados/?cursor=basura", headers=headers).status_code == 400
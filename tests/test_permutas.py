@@ -203,3 +203,129 @@ def test_formato_fecha_invalido(client, test_usuarios):
     )
     # Debería rechazar formato incorrecto
     assert response.status_code in [400, 422]
+
+
+def test_listado_admin_sin_n_mas_1(client, db_session: Session):
+    """El listado de todas las permutas hace un número fijo de consultas."""
+    from sqlalchemy import event
+    from services.auth_service import create_user
+    from tests.conftest import engine as test_engine
+
+    create_user(db_session, {
+        "email": "coord.permutas@example.com", "password": "clave", "full_name": "Coord", "role": "coordinador"
+    })
+    usuarios = [User(email=f"p{i}@example.com", hashed_password="x", full_name=f"P{i}") for i in range(10)]
+    db_session.add_all(usuarios)
+    db_session.flush()
+    db_session.add_all([
+        Permuta(solicitante_id=usuarios[i].id, receptor_id=usuarios[(i + 1) % 10].id,
+                fecha_origen="2026-01-01", fecha_destino="2026-01-02", estado="pendiente")
+        for i in range(10)
+    ])
+    db_session.commit()
+    token = client.post(
+        "/api/auth/login", data={"username": "coord.permutas@example.com", "password": "clave"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    emails = {u.email for u in usuarios}
+    db_session.expunge_all()
+
+    consultas = []
+    def contar(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            consultas.append(statement)
+    event.listen(test_engine, "before_cursor_execute", contar)
+    try:
+        response = client.get("/api/permutas/admin/all", headers=headers)
+    finally:
+        event.remove(test_engine, "before_cursor_execute", contar)
+
+    assert response.status_code == 200
+    assert len(response.json()) == 10
+    assert {p["receptor_email"] for p in response.json()} == emails
+    # Una sola consulta a permutas (con sus usuarios), no 1 + 2N
+    assert sum(1 for c in consultas if "FROM permutas" in c) == 1
+    assert len(consultas) <= 3
+
+
+def test_admin_paginacion_por_cursor_y_conteos(client, db_session: Session):
+    """Las páginas enlazadas por X-Next-Cursor recorren todo sin repetir filas."""
+    from datetime import datetime
+    from services.auth_service import create_user
+
+    create_user(db_session, {
+        "email": "coord.cursor@example.com", "password": "clave", "full_name": "Coord", "role": "coordinador"
+    })
+    a = User(email="a.cursor@example.com", hashed_password="x", full_name="A")
+    b = User(email="b.cursor@example.com", hashed_password="x", full_name="B")
+    db_session.add_all([a, b])
+    db_session.flush()
+    # Varias filas con la misma fecha: el id desempata
+    fechas = [datetime(2026, 1, 1 + i // 2, 10, 0) for i in range(7)]
+    for i, fecha in enumerate(fechas):
+        db_session.add(Permuta(
+            solicitante_id=a.id if i % 3 else b.id, receptor_id=b.id if i % 3 else a.id,
+            fecha_origen="2026-02-01", fecha_destino="2026-02-02",
+            estado="pendiente" if i % 2 else "aceptada", fecha_solicitud=fecha
+        ))
+    db_session.commit()
+    token = client.post(
+        "/api/auth/login", data={"username": "coord.cursor@example.com", "password": "clave"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    vistos, cursor = [], None
+    while True:
+        url = "/api/permutas/admin/all?limit=3" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        vistos += [p["id"] for p in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    todos = client.get("/api/permutas/admin/all", headers=headers).json()
+    assert vistos == [p["id"] for p in todos]
+    assert len(set(vistos)) == 7
+
+    pendientes = client.get("/api/permutas/admin/all?estado=pendiente&desde=2026-01-02&hasta=2026-01-03", headers=headers).json()
+    assert {p["estado"] for p in pendientes} == {"pendiente"}
+    assert len(pendientes) == 2
+    assert len(client.get(f"/api/permutas/admin/all?usuario_id={b.id}", headers=headers).json()) == 7
+
+    assert client.get("/api/permutas/admin/conteos", headers=headers).json() == {"pendiente": 3, "aceptada": 4}
+    assert client.get("/api/permutas/admin/all?cursor=no-valido", headers=headers).status_code == 400
+
+
+def test_admin_sin_limit_devuelve_todas(client, db_session: Session):
+    """Sin limit ni cursor el listado completo no se recorta (compatibilidad con clientes antiguos)."""
+    from datetime import datetime
+    from routers.permutas import LIMITE_PAGINA_ADMIN
+    from services.auth_service import create_user
+
+    create_user(db_session, {
+        "email": "coord.todas@example.com", "password": "clave", "full_name": "Coord", "role": "coordinador"
+    })
+    a = User(email="a.todas@example.com", hashed_password="x", full_name="A")
+    b = User(email="b.todas@example.com", hashed_password="x", full_name="B")
+    db_session.add_all([a, b])
+    db_session.flush()
+    total = LIMITE_PAGINA_ADMIN + 15
+    db_session.add_all(
+        Permuta(solicitante_id=a.id, receptor_id=b.id, fecha_origen="2026-02-01", fecha_destino="2026-02-02",
+                estado="pendiente", fecha_solicitud=datetime(2026, 1, 1))
+        for _ in range(total)
+    )
+    db_session.commit()
+    token = client.post(
+        "/api/auth/login", data={"username": "coord.todas@example.com", "password": "clave"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/api/permutas/admin/all", headers=headers)
+    assert len(response.json()) == total
+    assert "x-next-cursor" not in response.headers
+
+    response = client.get("/api/permutas/admin/all?limit=10", headers=headers)
+    assert len(response.json()) == 10
+    siguiente = client.get(f"/api/permutas/admin/all?cursor={response.headers['x-next-cursor']}", headers=headers)
+    assert len(siguiente.json()) == LIMITE_PAGINA_ADMIN
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from models.sql_models import Empleado, Turno, ConfiguracionTurno
+from tests.conftest import requiere_postgres
 
 # --- Datos de prueba ---
 TEST_COORDINADOR = {
@@ -117,3 +118,708 @@ def test_full_sync_success(client, db_session):
     config_n = db_session.query(ConfiguracionTurno).filter(ConfiguracionTurno.codigo == "N").first()
     assert config_n is not None
     assert config_n.descripcion == "Noche"
+
+
+def _login_coordinador(client, db_session):
+    """Crea el coordinador de prueba y devuelve las cabeceras con su token."""
+    from services.auth_service import create_user
+    create_user(db_session, TEST_COORDINADOR)
+    login_response = client.post(
+        "/api/auth/login",
+        data={"username": TEST_COORDINADOR["email"], "password": TEST_COORDINADOR["password"]}
+    )
+    assert login_response.status_code == 200
+    return {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+def test_delta_sync_omite_meses_sin_cambios(client, db_session):
+    """Un segundo sync delta con el mismo contenido no reescribe los turnos."""
+    from services.sync_service import calcular_hash_mes
+    headers = _login_coordinador(client, db_session)
+
+    response = client.post("/api/sync/full", json=SYNC_DATA, headers=headers)
+    assert response.status_code == 200
+
+    # El desktop consulta qué meses han cambiado
+    turnos_mes = SYNC_DATA["cuadrantes"]["2025"]["12"][0]["turnos"]
+    hashes = {"hashes": {"2025": {"12": {"Empleado Sync 1": calcular_hash_mes(turnos_mes)}}}}
+    response = client.post("/api/sync/hashes", json=hashes, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"pendientes": {}, "total_pendientes": 0}
+
+    hashes["hashes"]["2025"]["12"]["Empleado Sync 1"] = "otro"
+    response = client.post("/api/sync/hashes", json=hashes, headers=headers)
+    assert response.json()["pendientes"] == {"2025": {"12": ["Empleado Sync 1"]}}
+
+    # Reenviar lo mismo en modo delta no toca la BD
+    ids_antes = sorted(t.id for t in db_session.query(Turno).all())
+    response = client.post("/api/sync/full", json={**SYNC_DATA, "modo": "delta"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["estadisticas"] == {"meses_actualizados": 0, "meses_omitidos": 1}
+    db_session.expire_all()
+    assert sorted(t.id for t in db_session.query(Turno).all()) == ids_antes
+
+def test_delta_sync_reescribe_mes_modificado(client, db_session):
+    """Un mes con contenido distinto se reescribe en modo delta."""
+    import copy
+    headers = _login_coordinador(client, db_session)
+    client.post("/api/sync/full", json=SYNC_DATA, headers=headers)
+
+    modificado = copy.deepcopy(SYNC_DATA)
+    modificado["modo"] = "delta"
+    modificado["cuadrantes"]["2025"]["12"][0]["turnos"] = {"6": "L"}
+    response = client.post("/api/sync/full", json=modificado, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["estadisticas"]["meses_actualizados"] == 1
+
+    db_session.expire_all()
+    turnos = db_session.query(Turno).all()
+    assert [(t.dia, t.codigo_turno) for t in turnos] == [(6, "L")]
+
+def test_sync_no_recalcula_password_sin_cambios(client, db_session):
+    """La web_password solo se vuelve a hashear si no coincide con el hash guardado."""
+    import copy
+    from models.sql_models import User
+    from utils.security import verify_password
+    headers = _login_coordinador(client, db_session)
+
+    def hash_guardado():
+        db_session.expire_all()
+        return db_session.query(User).filter(User.email == "sync1@example.com").first().hashed_password
+
+    datos = copy.deepcopy(SYNC_DATA)
+    datos["empleados"]["Empleado Sync 1"]["web_password"] = "clave1"
+    assert client.post("/api/sync/full", json=datos, headers=headers).status_code == 200
+    primero = hash_guardado()
+    assert client.post("/api/sync/full", json=datos, headers=headers).status_code == 200
+    assert hash_guardado() == primero  # el hash lleva sal: igual = no se ha recalculado
+
+    datos["empleados"]["Empleado Sync 1"]["web_password"] = "clave2"
+    assert client.post("/api/sync/full", json=datos, headers=headers).status_code == 200
+    assert hash_guardado() != primero
+    assert verify_password("clave2", hash_guardado())
+
+def test_sync_password_cambiada_segun_desktop(client, db_session, monkeypatch):
+    """Con web_password_cambiada no se verifica nada: False conserva el hash, True lo regenera."""
+    import copy
+    from models.sql_models import User
+    from utils import security
+    headers = _login_coordinador(client, db_session)
+
+    def hash_guardado():
+        db_session.expire_all()
+        return db_session.query(User).filter(User.email == "sync1@example.com").first().hashed_password
+
+    datos = copy.deepcopy(SYNC_DATA)
+    datos["empleados"]["Empleado Sync 1"].update(web_password="clave1", web_password_cambiada=True)
+    assert client.post("/api/sync/full", json=datos, headers=headers).status_code == 200
+    primero = hash_guardado()
+
+    def sin_verificar(*args):
+        raise AssertionError("no debe verificarse la contraseña")
+    monkeypatch.setattr(security, "verify_password", sin_verificar)
+
+    datos["empleados"]["Empleado Sync 1"]["web_password_cambiada"] = False
+    assert client.post("/api/sync/full", json=datos, headers=headers).status_code == 200
+    assert hash_guardado() == primero
+
+    datos["empleados"]["Empleado Sync 1"]["web_password_cambiada"] = True
+    assert client.post("/api/sync/full", json=datos, headers=headers).status_code == 200
+    segundo = hash_guardado()
+    assert segundo != primero
+    monkeypatch.undo()
+    assert security.verify_password("clave1", segundo)
+
+def test_hash_passwords_en_paralelo():
+    """El lote grande se reparte entre procesos: None si el hash coincide, hash nuevo si no."""
+    from utils.security import actualizar_password_hashes, get_password_hash, verify_password, HASH_PARALELO_MINIMO
+    guardado = get_password_hash("clave0")
+    pares = [("clave0", guardado)] + [(f"clave{i}", guardado if i % 2 else None) for i in range(1, HASH_PARALELO_MINIMO + 1)]
+    hashes = actualizar_password_hashes(pares)
+    assert len(hashes) == len(pares)
+    assert hashes[0] is None
+    assert all(verify_password(p, h) for (p, _), h in zip(pares[1:], hashes[1:]))
+
+def test_sync_upsert_actualiza_sin_duplicar(client, db_session):
+    """Re-sincronizar actualiza los días existentes en su sitio y elimina los obsoletos."""
+    import copy
+    headers = _login_coordinador(client, db_session)
+    client.post("/api/sync/full", json=SYNC_DATA, headers=headers)
+    id_dia_6 = db_session.query(Turno).filter(Turno.dia == 6).first().id
+
+    modificado = copy.deepcopy(SYNC_DATA)
+    modificado["cuadrantes"]["2025"]["12"][0]["turnos"] = {"6": {"codigo": "D", "t": 12}, "8": "N"}
+    assert client.post("/api/sync/full", json=modificado, headers=headers).status_code == 200
+
+    db_session.expire_all()
+    turnos = {t.dia: t for t in db_session.query(Turno).all()}
+    assert sorted(turnos) == [6, 8]
+    assert turnos[6].id == id_dia_6
+    assert turnos[6].codigo_turno == "D"
+    assert turnos[6].horas_trabajadas == 12.0
+
+def test_turno_unico_por_dia(db_session):
+    """La BD rechaza dos turnos del mismo empleado para el mismo día."""
+    import pytest
+    from sqlalchemy.exc import IntegrityError
+    empleado = Empleado(nombre_completo="Duplicado")
+    db_session.add(empleado)
+    db_session.commit()
+    db_session.add_all([
+        Turno(empleado_id=empleado.id, anio=2025, mes=1, dia=1, codigo_turno="N"),
+        Turno(empleado_id=empleado.id, anio=2025, mes=1, dia=1, codigo_turno="D"),
+    ])
+    with pytest.raises(IntegrityError):
+        db_session.commit()
+    db_session.rollback()
+
+def test_sync_materializa_documentos_cache(client, db_session):
+    """El sync deja pre-serializados los documentos de cada empleado y mes."""
+    import json
+    from models.sql_models import DocumentoCache
+    headers = _login_coordinador(client, db_session)
+    client.post("/api/sync/full", json=SYNC_DATA, headers=headers)
+
+    empleado = db_session.query(Empleado).filter(Empleado.nombre_completo == "Empleado Sync 1").first()
+    documentos = {d.tipo: d for d in db_session.query(DocumentoCache).filter(DocumentoCache.empleado_id == empleado.id)}
+    assert set(documentos) == {"schedule", "schedule_compacto", "calendario"}
+
+    schedule = json.loads(documentos["schedule"].contenido)
+    assert schedule["shifts"]["6"]["codigo"] == "N"
+    calendario = json.loads(documentos["calendario"].contenido)
+    assert [t["horario"] for t in calendario["turnos"]] == ["Noche", "Libre"]
+
+SYNC_DATA_HORAS = {
+    "empleados": {
+        "Empleado Horas": {"email": "horas@example.com", "web_password": "clave-horas"}
+    },
+    "cuadrantes": {
+        "2025": {
+            "11": [{"nombre": "Empleado Horas", "turnos": {
+                "1": {"codigo": "N", "t": 12, "n": 8, "f": 0},
+                "2": {"codigo": "V", "t": 0},
+            }}],
+            "12": [{"nombre": "Empleado Horas", "turnos": {
+                "24": {"codigo": "D", "t": 12, "n": 0, "f": 12, "festivo": True},
+                "26": {"codigo": "B", "t": 0},
+            }}]
+        }
+    },
+    "config_turnos": {}
+}
+
+def test_sync_mantiene_resumen_y_balances(client, db_session):
+    """Los balances se calculan desde turnos_resumen, que el sync mantiene al día."""
+    from models.sql_models import TurnoResumen
+    from services import empleados_service
+    headers = _login_coordinador(client, db_session)
+    assert client.post("/api/sync/full", json=SYNC_DATA_HORAS, headers=headers).status_code == 200
+    assert db_session.query(TurnoResumen).count() == 2
+
+    login = client.post("/api/auth/login", data={"username": "horas@example.com", "password": "clave-horas"})
+    headers_vig = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    anual = client.get("/api/empleados/balance/2025", headers=headers_vig).json()
+    assert anual["total_horas_trabajadas"] == 24.0
+    assert anual["balance_horas"] == 24.0 - 1768.0
+    assert (anual["dias_trabajados"], anual["dias_vacaciones"], anual["dias_baja"]) == (2, 1, 1)
+
+    mensual = client.get("/api/empleados/balance/2025/12", headers=headers_vig).json()
+    assert mensual["total_horas_trabajadas"] == 12.0
+    assert mensual["horas_festivas"] == 12.0
+    assert mensual["dias_trabajados"] == 1
+
+    # La reconstrucción completa desde turnos da el mismo resultado
+    antes = {(r.anio, r.mes): (r.horas_trabajadas, r.dias_trabajados, r.dias_vacaciones, r.dias_baja)
+             for r in db_session.query(TurnoResumen).all()}
+    empleados_service.reconstruir_resumenes(db_session)
+    db_session.commit()
+    despues = {(r.anio, r.mes): (r.horas_trabajadas, r.dias_trabajados, r.dias_vacaciones, r.dias_baja)
+               for r in db_session.query(TurnoResumen).all()}
+    assert antes == despues
+
+def test_config_turnos_cache_invalidada_por_sync(client, db_session):
+    """La configuración de turnos se cachea y solo se recarga si el sync la cambia."""
+    import copy
+    from services import config_turnos_service, version_service
+    headers = _login_coordinador(client, db_session)
+    assert client.post("/api/sync/full", json=SYNC_DATA, headers=headers).status_code == 200
+
+    config = config_turnos_service.obtener(db_session)
+    assert config["N"]["descripcion"] == "Noche"
+    assert config_turnos_service.obtener(db_session) is config
+    version, _ = version_service.obtener(db_session, version_service.VERSION_CONFIG_TURNOS)
+
+    # Mismo contenido: no hay cambio de versión ni recarga
+    assert client.post("/api/sync/full", json=SYNC_DATA, headers=headers).status_code == 200
+    db_session.expire_all()
+    assert version_service.obtener(db_session, version_service.VERSION_CONFIG_TURNOS)[0] == version
+    assert config_turnos_service.obtener(db_session) is config
+
+    datos = copy.deepcopy(SYNC_DATA)
+    datos["config_turnos"]["N"]["horario"] = "20:00-08:00"
+    assert client.post("/api/sync/full", json=datos, headers=headers).status_code == 200
+    db_session.expire_all()
+    assert config_turnos_service.obtener(db_session)["N"]["horario"] == "20:00-08:00"
+
+def test_sync_vincula_usuario_y_empleado_en_token(client, db_session):
+    """El sync enlaza User -> Empleado y el token lleva user_id/empleado_id."""
+    from jose import jwt
+    from models.sql_models import User
+    from utils import security
+    headers = _login_coordinador(client, db_session)
+    assert client.post("/api/sync/full", json=SYNC_DATA_HORAS, headers=headers).status_code == 200
+
+    usuario = db_session.query(User).filter(User.email == "horas@example.com").one()
+    empleado = db_session.query(Empleado).filter(Empleado.nombre_completo == "Empleado Horas").one()
+    assert usuario.empleado_id == empleado.id
+
+    token = client.post(
+        "/api/auth/login", data={"username": "horas@example.com", "password": "clave-horas"}
+    ).json()["access_token"]
+    claims = jwt.decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM])
+    assert claims["user_id"] == usuario.id
+    assert claims["empleado_id"] == empleado.id
+
+    headers_vig = {"Authorization": f"Bearer {token}"}
+    response = client.get(f"/api/schedule/2025/12/empleado/{empleado.id}", headers=headers_vig)
+    assert response.status_code == 200
+    assert response.json()["empleado_nombre"] == "Empleado Horas"
+    response = client.get(f"/api/schedule/2025/12/empleado/{empleado.id + 1}", headers=headers_vig)
+    assert response.status_code == 403
+
+
+def test_sync_stream_ndjson_gzip(client, db_session):
+    """La subida NDJSON (también con gzip) escribe lo mismo que /full y un error lo deshace todo."""
+    import gzip
+    import json
+    from models.sql_models import DocumentoCache, HashMes
+    headers = _login_coordinador(client, db_session)
+
+    registros = [
+        {"tipo": "empleado", "nombre": "Empleado Sync 1", **SYNC_DATA["empleados"]["Empleado Sync 1"]},
+        {"tipo": "empleado", "nombre": "Empleado Sync 2", "email": "sync2@example.com"},
+        {"tipo": "config_turnos", "config_turnos": SYNC_DATA["config_turnos"]},
+        {"tipo": "mes", "anio": "2025", "mes": "12", "vigilantes": SYNC_DATA["cuadrantes"]["2025"]["12"]},
+        {"tipo": "turnos", "anio": 2026, "mes": 1, "nombre": "Empleado Sync 2", "turnos": {"1": "N"}},
+        {"tipo": "festivos", "festivos": {}},
+    ]
+    cuerpo = "\n".join(json.dumps(r) for r in registros).encode("utf-8")
+    ndjson = {**headers, "Content-Type": "application/x-ndjson"}
+
+    response = client.post("/api/sync/stream", content=gzip.compress(cuerpo), headers={**ndjson, "Content-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.json()["estadisticas"] == {"meses_actualizados": 2, "meses_omitidos": 0}
+
+    uno = db_session.query(Empleado).filter(Empleado.nombre_completo == "Empleado Sync 1").one()
+    dos = db_session.query(Empleado).filter(Empleado.nombre_completo == "Empleado Sync 2").one()
+    assert {(t.dia, t.codigo_turno) for t in db_session.query(Turno).filter(Turno.empleado_id == uno.id)} == {(6, "N"), (7, "L")}
+    assert [(t.anio, t.mes, t.dia) for t in db_session.query(Turno).filter(Turno.empleado_id == dos.id)] == [(2026, 1, 1)]
+    assert db_session.query(HashMes).count() == 2
+    assert db_session.query(DocumentoCache).filter(DocumentoCache.empleado_id == uno.id).count() == 3
+
+    # Delta sin gzip: nada cambia
+    response = client.post("/api/sync/stream?modo=delta", content=cuerpo, headers=ndjson)
+    assert response.json()["estadisticas"] == {"meses_actualizados": 0, "meses_omitidos": 2}
+
+    # Una línea mal formada devuelve 400 y no deja nada escrito
+    malo = cuerpo.replace(b'"N"}}', b'"D"}}') + b"\n{no es json\n"
+    response = client.post("/api/sync/stream", content=malo, headers=ndjson)
+    assert response.status_code == 400
+    assert "Línea 7" in response.json()["detail"]
+    db_session.expire_all()
+    assert db_session.query(Turno).filter(Turno.empleado_id == dos.id).one().codigo_turno == "N"
+
+    anio_malo = json.dumps({"tipo": "turnos", "anio": "dos mil", "mes": 1, "nombre": "Empleado Sync 2", "turnos": {}})
+    response = client.post("/api/sync/stream", content=anio_malo.encode("utf-8"), headers=ndjson)
+    assert response.status_code == 400
+    assert "Línea 1" in response.json()["detail"]
+
+    desconocido = json.dumps({"tipo": "otro"}).encode("utf-8")
+    assert client.post("/api/sync/stream", content=desconocido, headers=ndjson).status_code == 400
+    assert client.post("/api/sync/stream", content=cuerpo, headers={**ndjson, "Content-Encoding": "br"}).status_code == 415
+    assert client.post("/api/sync/stream", content=b"\x1f\x8bbasura", headers={**ndjson, "Content-Encoding": "gzip"}).status_code == 400
+
+
+def _esperar_worker_jobs(timeout=30):
+    """Espera a que el worker de sync_jobs_service vacíe la cola"""
+    from services import sync_jobs_service
+    worker = sync_jobs_service._worker
+    if worker is not None:
+        worker.join(timeout)
+
+
+def test_sync_en_segundo_plano_con_estado(client, db_session):
+    """POST /jobs responde al momento; el worker sincroniza y /jobs/{id} da progreso y tiempos."""
+    from services import sync_jobs_service
+    headers = _login_coordinador(client, db_session)
+
+    response = client.post("/api/sync/jobs", json=SYNC_DATA, headers=headers)
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    _esperar_worker_jobs()
+
+    estado = client.get(f"/api/sync/jobs/{job_id}", headers=headers).json()
+    assert estado["estado"] == "completado"
+    assert estado["progreso"] == {
+        "empleados_procesados": 1, "meses_actualizados": 1, "meses_omitidos": 0, "filas_escritas": 2
+    }
+    assert estado["tiempos"]["duracion_segundos"] >= 0
+    assert db_session.query(Turno).count() == 2
+
+    assert client.get("/api/sync/jobs/9999", headers=headers).status_code == 404
+
+
+def test_sync_jobs_completo_sustituye_pendientes(client, db_session, monkeypatch):
+    """Un envío completo reemplaza a los pendientes; los trabajos se ejecutan de uno en uno."""
+    import copy
+    from services import sync_jobs_service
+    from models.sql_models import TrabajoSync
+    headers = _login_coordinador(client, db_session)
+
+    # Sin worker: los trabajos se quedan pendientes
+    monkeypatch.setattr(sync_jobs_service, "_despertar", lambda fabrica: None)
+    delta = copy.deepcopy(SYNC_DATA)
+    delta["modo"] = "delta"
+    primero = client.post("/api/sync/jobs", json=delta, headers=headers).json()["job_id"]
+    segundo = client.post("/api/sync/jobs", json=delta, headers=headers).json()["job_id"]
+    completo = copy.deepcopy(SYNC_DATA)
+    completo["cuadrantes"]["2025"]["12"][0]["turnos"]["8"] = "D"
+    ultimo = client.post("/api/sync/jobs", json=completo, headers=headers).json()["job_id"]
+
+    estados = {t.id: (t.estado, t.reemplazado_por) for t in db_session.query(TrabajoSync)}
+    assert estados == {
+        primero: ("reemplazado", ultimo), segundo: ("reemplazado", ultimo), ultimo: ("pendiente", None)
+    }
+
+    sync_jobs_service.procesar_pendientes(sync_jobs_service.fabrica_para(db_session))
+    db_session.expire_all()
+    assert db_session.get(TrabajoSync, ultimo).estado == "completado"
+    assert db_session.get(TrabajoSync, ultimo).datos is None
+    assert db_session.query(Turno).count() == 3
+
+    # Un fallo deja el trabajo en error sin escribir nada
+    malo = copy.deepcopy(SYNC_DATA)
+    malo["cuadrantes"]["2025"]["12"][0]["turnos"] = {"x": "N"}
+    fallido = client.post("/api/sync/jobs", json=malo, headers=headers).json()["job_id"]
+    sync_jobs_service.procesar_pendientes(sync_jobs_service.fabrica_para(db_session))
+    estado = client.get(f"/api/sync/jobs/{fallido}", headers=headers).json()
+    assert estado["estado"] == "error" and estado["error"]
+    assert db_session.query(Turno).count() == 3
+
+
+def test_sync_jobs_recuperar_al_arrancar(client, db_session, monkeypatch):
+    """Al arrancar, los trabajos en curso de un proceso muerto pasan a error y los pendientes se ejecutan."""
+    from datetime import datetime
+    from services import sync_jobs_service
+    from models.sql_models import TrabajoSync
+    headers = _login_coordinador(client, db_session)
+
+    monkeypatch.setattr(sync_jobs_service, "_despertar", lambda fabrica: None)
+    pendiente = client.post("/api/sync/jobs", json=SYNC_DATA, headers=headers).json()["job_id"]
+    huerfano = TrabajoSync(estado="en_curso", modo="completo", creado=datetime.utcnow(), iniciado=datetime.utcnow())
+    db_session.add(huerfano)
+    db_session.commit()
+    monkeypatch.undo()
+
+    sync_jobs_service.recuperar(sync_jobs_service.fabrica_para(db_session))
+    _esperar_worker_jobs()
+
+    assert client.get(f"/api/sync/jobs/{pendiente}", headers=headers).json()["estado"] == "completado"
+    estado = client.get(f"/api/sync/jobs/{huerfano.id}", headers=headers).json()
+    assert estado["estado"] == "error" and "reinicio" in estado["error"]
+
+
+def test_sync_por_trozos_reanudable(client, db_session):
+    """Trozos en cualquier orden con checksum; se reanuda con lo recibido y se confirma de una vez."""
+    import gzip
+    import hashlib
+    import json
+    headers = _login_coordinador(client, db_session)
+
+    trozos = [
+        {"empleados": SYNC_DATA["empleados"], "config_turnos": SYNC_DATA["config_turnos"]},
+        {"cuadrantes": {"2025": {"12": SYNC_DATA["cuadrantes"]["2025"]["12"]}}},
+        {"cuadrantes": {"2026": {"1": [{"nombre": "Empleado Sync 1", "turnos": {"2": "N"}}]}}},
+    ]
+    cuerpos = [json.dumps(t).encode("utf-8") for t in trozos]
+
+    def subir(sesion_id, seq, cuerpo, checksum=None, **extra):
+        return client.put(
+            f"/api/sync/sesiones/{sesion_id}/trozos/{seq}", content=cuerpo,
+            headers={**headers, "X-Checksum": checksum or hashlib.sha256(cuerpo).hexdigest(), **extra}
+        )
+
+    sesion_id = client.post("/api/sync/sesiones", json={}, headers=headers).json()["sesion_id"]
+
+    # Se sube el último trozo primero; el del medio llega corrupto
+    assert subir(sesion_id, 2, cuerpos[2]).json() == {"seq": 2, "guardado": True}
+    assert subir(sesion_id, 0, gzip.compress(cuerpos[0]), checksum=hashlib.sha256(cuerpos[0]).hexdigest(),
+                 **{"Content-Encoding": "gzip"}).status_code == 200
+    assert subir(sesion_id, 1, cuerpos[1][:-1], checksum=hashlib.sha256(cuerpos[1]).hexdigest()).status_code == 400
+
+    estado = client.get(f"/api/sync/sesiones/{sesion_id}", headers=headers).json()
+    assert estado["recibidos"] == [0, 2] and estado["siguiente"] == 1
+    response = client.post(f"/api/sync/sesiones/{sesion_id}/confirmar", json={"total_trozos": 3}, headers=headers)
+    assert response.status_code == 409
+    assert db_session.query(Turno).count() == 0
+
+    # Reanudar: solo el que falta; reenviar uno ya guardado no hace nada
+    assert subir(sesion_id, 1, cuerpos[1]).json()["guardado"] is True
+    assert subir(sesion_id, 2, cuerpos[2]).json()["guardado"] is False
+    assert subir(sesion_id, 2, cuerpos[1]).status_code == 409
+
+    response = client.post(f"/api/sync/sesiones/{sesion_id}/confirmar", json={"total_trozos": 3}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["estadisticas"] == {"meses_actualizados": 2, "meses_omitidos": 0}
+    assert sorted((t.anio, t.mes, t.dia) for t in db_session.query(Turno)) == [(2025, 12, 6), (2025, 12, 7), (2026, 1, 2)]
+
+    # Confirmar otra vez es idempotente; la sesión confirmada no admite más trozos
+    again = client.post(f"/api/sync/sesiones/{sesion_id}/confirmar", json={"total_trozos": 3}, headers=headers)
+    assert again.json()["estadisticas"] == response.json()["estadisticas"]
+    assert subir(sesion_id, 3, cuerpos[2]).status_code == 409
+    assert client.get("/api/sync/sesiones/otra", headers=headers).status_code == 404
+
+def test_sync_trozo_mal_formado_se_rechaza_al_subir(client, db_session):
+    """Un trozo con cuadrantes mal formados recibe 400 al subirlo y no llega a confirmar()."""
+    import hashlib
+    import json
+    headers = _login_coordinador(client, db_session)
+    sesion_id = client.post("/api/sync/sesiones", json={}, headers=headers).json()["sesion_id"]
+
+    def subir(seq, trozo):
+        cuerpo = json.dumps(trozo).encode("utf-8")
+        return client.put(
+            f"/api/sync/sesiones/{sesion_id}/trozos/{seq}", content=cuerpo,
+            headers={**headers, "X-Checksum": hashlib.sha256(cuerpo).hexdigest()}
+        )
+
+    malos = [
+        {"cuadrantes": {"2025": [{"nombre": "Empleado Sync 1"}]}},
+        {"cuadrantes": {"2025": {"12": {"nombre": "Empleado Sync 1"}}}},
+        {"cuadrantes": {"2025": {"12": ["Empleado Sync 1"]}}},
+        {"cuadrantes": {"2025": {"12": [{"nombre": "Empleado Sync 1", "turnos": ["M"]}]}}},
+        {"cuadrantes": {"2025": {"12": [{"nombre": "Empleado Sync 1", "turnos": {"x": "M"}}]}}},
+        {"cuadrantes": {"dos mil": {"12": [{"nombre": "Empleado Sync 1", "turnos": {}}]}}},
+        {"empleados": {"Empleado Sync 1": "sync1@example.com"}},
+    ]
+    for trozo in malos:
+        response = subir(0, trozo)
+        assert response.status_code == 400, trozo
+        assert "Trozo 0" in response.json()["detail"]
+    assert client.get(f"/api/sync/sesiones/{sesion_id}", headers=headers).json()["recibidos"] == []
+
+    # Las claves que no son meses se ignoran, como en /full
+    assert subir(0, {"cuadrantes": {"2025": {"festivos": [1], "12": []}}}).status_code == 200
+
+def test_sync_trozo_subido_a_la_vez(db_session, monkeypatch):
+    """Dos PUT simultáneos del mismo trozo: el que pierde la carrera no da 500."""
+    import hashlib
+    import pytest
+    from services import sync_sesiones_service
+    from services.sync_sesiones_service import ErrorSesion
+    sesion_id = sync_sesiones_service.abrir(db_session, "completo", None)
+    cuerpo, otro = b'{"empleados": {}}', b'{"cuadrantes": {}}'
+    checksum = hashlib.sha256(cuerpo).hexdigest()
+    assert sync_sesiones_service.guardar_trozo(db_session, sesion_id, 0, cuerpo, checksum) is True
+
+    # El otro PUT comprobó antes de que se guardara este: solo lo detecta el commit
+    original = sync_sesiones_service._trozo_repetido
+    llamadas = []
+
+    def sin_ver_el_otro(*args):
+        llamadas.append(args)
+        return False if len(llamadas) == 1 else original(*args)
+
+    monkeypatch.setattr(sync_sesiones_service, "_trozo_repetido", sin_ver_el_otro)
+    assert sync_sesiones_service.guardar_trozo(db_session, sesion_id, 0, cuerpo, checksum) is False
+
+    llamadas.clear()
+    with pytest.raises(ErrorSesion) as error:
+        sync_sesiones_service.guardar_trozo(db_session, sesion_id, 0, otro, hashlib.sha256(otro).hexdigest())
+    assert error.value.codigo == 409
+
+def test_sync_sesiones_caducadas_se_borran(db_session):
+    """Al abrir una sesión se purgan las abiertas caducadas y las confirmadas fuera de la retención."""
+    from datetime import datetime, timedelta
+    from models.sql_models import SesionSync
+    from services import sync_sesiones_service as servicio
+    ahora = datetime.utcnow()
+    for id_, estado, antiguedad in (
+        ("abierta-caducada", servicio.ESTADO_ABIERTA, servicio.CADUCIDAD_SESION + timedelta(minutes=1)),
+        ("abierta-reciente", servicio.ESTADO_ABIERTA, timedelta(hours=1)),
+        ("confirmada-antigua", servicio.ESTADO_CONFIRMADA, servicio.RETENCION_CONFIRMADAS + timedelta(minutes=1)),
+        ("confirmada-reciente", servicio.ESTADO_CONFIRMADA, servicio.CADUCIDAD_SESION + timedelta(minutes=1)),
+    ):
+        db_session.add(SesionSync(id=id_, estado=estado, modo="completo", creado=ahora - antiguedad,
+                                  actualizado=ahora - antiguedad, estadisticas="{}"))
+    db_session.commit()
+
+    nueva = servicio.abrir(db_session, "completo", None)
+    assert sorted(s.id for s in db_session.query(SesionSync)) == sorted(["abierta-reciente", "confirmada-reciente", nueva])
+
+def test_sync_trozo_limite_de_tamano(client, db_session, monkeypatch):
+    """Un trozo que supera el límite (comprimido o una vez descomprimido) recibe 413 sin cargarse entero."""
+    import gzip
+    import hashlib
+    from services import sync_sesiones_service
+    headers = _login_coordinador(client, db_session)
+    monkeypatch.setattr(sync_sesiones_service, "MAX_TROZO_BYTES", 1000)
+    sesion_id = client.post("/api/sync/sesiones", json={}, headers=headers).json()["sesion_id"]
+
+    def subir(cuerpo, checksum, **extra):
+        return client.put(
+            f"/api/sync/sesiones/{sesion_id}/trozos/0", content=cuerpo,
+            headers={**headers, "X-Checksum": checksum, **extra}
+        )
+
+    grande = b'{"empleados": {"' + b"x" * 2000 + b'": {}}}'
+    assert subir(grande, hashlib.sha256(grande).hexdigest()).status_code == 413
+    # Comprimido ocupa poco, pero descomprimido pasa del límite
+    bomba = gzip.compress(grande)
+    assert len(bomba) < 1000
+    assert subir(bomba, hashlib.sha256(grande).hexdigest(), **{"Content-Encoding": "gzip"}).status_code == 413
+    assert subir(gzip.compress(b"{}")[:-4], "x", **{"Content-Encoding": "gzip"}).status_code == 400
+    assert client.get(f"/api/sync/sesiones/{sesion_id}", headers=headers).json()["recibidos"] == []
+
+def test_upsert_masivo_deduplica_y_actualiza(db_session):
+    """upsert_masivo se queda con la última fila de cada clave y actualiza las existentes."""
+    from models.database import upsert_masivo
+    from models.sql_models import fecha_turno
+    from services.sync_service import CLAVE_TURNO, COLUMNAS_DATOS_TURNO
+    empleado = Empleado(nombre_completo="Masivo")
+    db_session.add(empleado)
+    db_session.commit()
+
+    def fila(dia, codigo):
+        return {
+            "empleado_id": empleado.id, "anio": 2025, "mes": 3, "dia": dia,
+            "fecha": fecha_turno(2025, 3, dia), "codigo_turno": codigo, "horas_trabajadas": 8.0,
+            "horas_nocturnas": 0.0, "horas_festivas": 0.0, "es_festivo": False
+        }
+
+    tabla = Turno.__table__
+    upsert_masivo(db_session, tabla, [fila(1, "M"), fila(2, "T")], CLAVE_TURNO, COLUMNAS_DATOS_TURNO)
+    upsert_masivo(db_session, tabla, [fila(2, "N"), fila(2, "L"), fila(3, "D")], CLAVE_TURNO, COLUMNAS_DATOS_TURNO)
+    db_session.commit()
+
+    turnos = {t.dia: t.codigo_turno for t in db_session.query(Turno).filter(Turno.empleado_id == empleado.id)}
+    assert turnos == {1: "M", 2: "L", 3: "D"}
+
+def _sync_varios_meses(tmp_path, monkeypatch=None, falla=None):
+    """Sincroniza tres meses con dos trabajadores sobre una BD SQLite en fichero (varias conexiones)"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from models.database import Base
+    from services import sync_service
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'paralelo.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    data = {
+        "empleados": {"Vigilante A": {}, "Vigilante B": {}},
+        "config_turnos": SYNC_DATA["config_turnos"],
+        "cuadrantes": {"2025": {
+            str(mes): [{"nombre": n, "turnos": {"1": "N", "2": "L"}} for n in ("Vigilante A", "Vigilante B")]
+            for mes in (1, 2, 3)
+        }},
+    }
+    if falla:
+        original = sync_service._aplicar_particion
+
+        def aplicar(fabrica, sincronizacion, particion):
+            if particion[1] == falla:
+                raise RuntimeError("conexión perdida")
+            return original(fabrica, sincronizacion, particion)
+        monkeypatch.setattr(sync_service, "_aplicar_particion", aplicar)
+
+    db = sessionmaker(bind=engine)()
+    try:
+        sincronizacion = sync_service.Sincronizacion(db, bloquear=False)
+        sync_service.aplicar_datos(sincronizacion, data, trabajadores=2)
+        stats = sincronizacion.finalizar()
+        meses = {(t.mes, t.dia) for t in db.query(Turno).all()}
+        return stats, meses, db.query(Turno).count()
+    finally:
+        db.close()
+        engine.dispose()
+
+def test_sync_paralelo_aplica_todos_los_meses(tmp_path):
+    """Con varios trabajadores cada mes se aplica en su conexión y el resultado es el mismo."""
+    stats, meses, total = _sync_varios_meses(tmp_path)
+    assert stats["meses_actualizados"] == 6
+    assert meses == {(m, d) for m in (1, 2, 3) for d in (1, 2)}
+    assert total == 12
+
+def test_sync_paralelo_reintenta_en_serie_los_meses_fallidos(tmp_path, monkeypatch):
+    """Un mes que falla en su trabajador se aplica en el paso final, en la sesión principal."""
+    stats, _, total = _sync_varios_meses(tmp_path, monkeypatch, falla="2")
+    assert stats["meses_actualizados"] == 6
+    assert total == 12
+
+def test_sync_paralelo_es_opcional(db_session, monkeypatch):
+    """Por defecto (SYNC_WORKERS=1) la sincronización va en serie y en una sola transacción."""
+    from config import settings
+    from services import sync_service
+    assert settings.SYNC_WORKERS == 1
+    assert sync_service.trabajadores_para(db_session, SYNC_DATA) == 1
+    # En SQLite nunca en paralelo, aunque se configure
+    monkeypatch.setattr(settings, "SYNC_WORKERS", 4)
+    assert sync_service.trabajadores_para(db_session, SYNC_DATA) == 1
+
+
+@requiere_postgres
+def test_sync_paralelo_postgres(postgres_session, monkeypatch):
+    """Con SYNC_WORKERS > 1 en PostgreSQL los meses se reparten entre conexiones bajo el advisory lock."""
+    from config import settings
+    from services import sync_service
+    db = postgres_session
+    data = {
+        "empleados": {"Vigilante A": {}, "Vigilante B": {}},
+        "config_turnos": SYNC_DATA["config_turnos"],
+        "cuadrantes": {"2025": {
+            str(mes): [{"nombre": n, "turnos": {"1": "N", "2": "L"}} for n in ("Vigilante A", "Vigilante B")]
+            for mes in range(1, 13)
+        }},
+    }
+    monkeypatch.setattr(settings, "SYNC_WORKERS", 3)
+    assert sync_service.trabajadores_para(db, data) == 3
+
+    stats = sync_service.sync_data(db, data)
+    assert stats["meses_actualizados"] == 24
+    assert db.query(Turno).count() == 48
+
+    # El lock de sesión se ha liberado: otra sincronización en serie no espera
+    monkeypatch.setattr(settings, "SYNC_WORKERS", 1)
+    data["modo"] = "delta"
+    assert sync_service.sync_data(db, data) == {"meses_actualizados": 0, "meses_omitidos": 24}
+
+
+@requiere_postgres
+def test_sync_jobs_recuperar_respeta_trabajo_reclamado_postgres(postgres_session, monkeypatch):
+    """Un trabajo recién reclamado ya tiene el lock: recuperar() de otra instancia no lo marca como error."""
+    from models.sql_models import TrabajoSync
+    from services import sync_jobs_service
+    db = postgres_session
+    fabrica = sync_jobs_service.fabrica_para(db)
+    monkeypatch.setattr(sync_jobs_service, "_despertar", lambda fabrica: None)
+    trabajo_id = sync_jobs_service.encolar(db, SYNC_DATA, None, fabrica)
+
+    # Otra instancia arranca justo después de que el worker reclame el trabajo
+    reclamar = sync_jobs_service._reclamar_siguiente
+    vistos = []
+
+    def reclamar_y_arrancar_otra(sesion):
+        reclamado = reclamar(sesion)
+        if reclamado is not None:
+            sync_jobs_service.recuperar(fabrica)
+            otra = fabrica()
+            vistos.append(otra.get(TrabajoSync, reclamado).estado)
+            otra.close()
+        return reclamado
+
+    monkeypatch.setattr(sync_jobs_service, "_reclamar_siguiente", reclamar_y_arrancar_otra)
+    sync_jobs_service.procesar_pendientes(fabrica)
+
+    assert vistos == ["en_curso"]
+    db.expire_all()
+    assert db.get(TrabajoSync, trabajo_id).estado == "completado"
+    assert db.query(Turno).count() == 2
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from datetime import date
+from datetime import date, timedelta
 from models.sql_models import Empleado, Turno, ConfiguracionTurno
 
 # --- Datos de prueba ---
@@ -62,3 +62,267 @@ def test_get_proximos_turnos_success(client, db_session):
     assert turno_recibido["codigo_turno"] == "M"
     assert turno_recibido["descripcion"] == "Mañana"
 
+
+def _crear_usuario_con_turnos(db_session):
+    """Crea el usuario/empleado de prueba con dos turnos en enero de 2026."""
+    from services.auth_service import create_user
+    create_user(db_session, TEST_USER)
+    empleado_db = Empleado(**TEST_EMPLEADO)
+    db_session.add(empleado_db)
+    db_session.commit()
+    db_session.add_all([
+        Turno(empleado_id=empleado_db.id, anio=2026, mes=1, dia=5, codigo_turno="N",
+              horas_trabajadas=12.0, horas_nocturnas=8.0),
+        Turno(empleado_id=empleado_db.id, anio=2026, mes=1, dia=6, codigo_turno="L"),
+    ])
+    db_session.commit()
+    return empleado_db
+
+def _login(client):
+    login_response = client.post(
+        "/api/auth/login",
+        data={"username": TEST_USER["email"], "password": TEST_USER["password"]}
+    )
+    assert login_response.status_code == 200
+    return {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+def test_get_schedule_usa_sesion_de_dependencia(client, db_session):
+    """El cuadrante mensual se lee a través de get_db (sesión inyectada)."""
+    _crear_usuario_con_turnos(db_session)
+    response = client.get("/api/schedule/2026/1", headers=_login(client))
+    assert response.status_code == 200
+    shifts = response.json()["shifts"]
+    assert shifts["5"]["codigo"] == "N"
+    assert shifts["5"]["t"] == 12.0
+    assert shifts["6"]["codigo"] == "L"
+
+def test_get_schedule_etag_devuelve_304(client, db_session):
+    """El cuadrante pre-serializado lleva ETag fuerte y responde 304 si no cambia."""
+    _crear_usuario_con_turnos(db_session)
+    headers = _login(client)
+    response = client.get("/api/schedule/2026/1", headers=headers)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert etag.startswith('"') and not etag.startswith("W/")
+
+    response = client.get("/api/schedule/2026/1", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+def test_get_mis_turnos_desde_documento(client, db_session):
+    """mis-turnos se sirve desde el documento pre-serializado, con la leyenda de cada código."""
+    _crear_usuario_con_turnos(db_session)
+    db_session.add(ConfiguracionTurno(codigo="N", descripcion="Noche", horario="19:00-07:00"))
+    db_session.commit()
+
+    response = client.get("/api/turnos/mis-turnos/2026/1", headers=_login(client))
+    assert response.status_code == 200
+    data = response.json()
+    assert data["vigilante"] == "Test User"
+    assert data["total_horas"] == 12.0
+    assert data["turnos"] == [
+        {"dia": 5, "codigo": "N", "horario": "Noche", "es_festivo": False},
+        {"dia": 6, "codigo": "L", "horario": "", "es_festivo": False},
+    ]
+
+
+def test_datos_desktop_cacheados_hasta_cambio_de_fichero(tmp_path, monkeypatch):
+    """Los JSON del desktop se parsean una vez y se recargan si cambia el fichero."""
+    import json
+    import os
+    from utils import desktop_data
+
+    monkeypatch.setenv("DESKTOP_DATA_PATH", str(tmp_path))
+    desktop_data.limpiar_cache()
+    ruta = tmp_path / "cuadrantes.json"
+    ruta.write_text(json.dumps({"2026": {"1": [{"nombre": "Ana", "turnos": {"1": "N"}}]}}), encoding="utf-8")
+
+    datos = desktop_data.cargar_datos_desktop("cuadrantes.json")
+    assert desktop_data.cargar_datos_desktop("cuadrantes.json") is datos
+    assert desktop_data.vigilante_mes(2026, 1, "Ana")["turnos"] == {"1": "N"}
+    assert desktop_data.vigilante_mes(2026, 2, "Ana") is None
+
+    ruta.write_text(json.dumps({"2026": {"1": [{"nombre": "Ana", "turnos": {"1": "D", "2": "N"}}]}}), encoding="utf-8")
+    stat = os.stat(ruta)
+    os.utime(ruta, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert desktop_data.cargar_datos_desktop("cuadrantes.json") is not datos
+    assert desktop_data.vigilante_mes(2026, 1, "Ana")["turnos"] == {"1": "D", "2": "N"}
+
+    assert desktop_data.cargar_datos_desktop("no_existe.json") == {}
+    desktop_data.limpiar_cache()
+
+
+def test_proximos_turnos_ventana_cruza_de_anio(client, db_session):
+    """La ventana se consulta por fecha y dias tiene límite."""
+    from services.auth_service import create_user
+    create_user(db_session, TEST_USER)
+    empleado_db = Empleado(**TEST_EMPLEADO)
+    db_session.add(empleado_db)
+    db_session.commit()
+
+    hoy = date.today()
+    dentro = hoy + timedelta(days=40)
+    fuera = hoy + timedelta(days=80)
+    for fecha in (dentro, fuera):
+        db_session.add(Turno(empleado_id=empleado_db.id, anio=fecha.year, mes=fecha.month, dia=fecha.day, codigo_turno="N"))
+    db_session.add(ConfiguracionTurno(codigo="N", descripcion="Noche", horario="19:00-07:00"))
+    db_session.commit()
+
+    headers = _login(client)
+    data = client.get("/api/turnos/proximos-turnos?dias=60", headers=headers).json()
+    assert [t["fecha"] for t in data] == [dentro.isoformat()]
+
+    response = client.get("/api/turnos/proximos-turnos?dias=400", headers=headers)
+    assert response.status_code == 422
+
+
+def test_consultas_por_rango_de_fechas(db_session):
+    """turnos.fecha se rellena sola y permite rangos que cruzan mes y año."""
+    from services import turnos_service
+    empleado = Empleado(nombre_completo="Rango")
+    otro = Empleado(nombre_completo="Otro")
+    db_session.add_all([empleado, otro])
+    db_session.flush()
+    for emp, anio, mes, dia, codigo in [
+        (empleado, 2025, 12, 30, "N"), (empleado, 2026, 1, 2, "D"), (empleado, 2026, 2, 1, "N"),
+        (otro, 2025, 12, 31, "N"), (otro, 2026, 1, 2, "N"),
+    ]:
+        db_session.add(Turno(empleado_id=emp.id, anio=anio, mes=mes, dia=dia, codigo_turno=codigo))
+    db_session.commit()
+
+    turnos = turnos_service.get_turnos_rango(db_session, date(2025, 12, 29), date(2026, 1, 5), empleado_id=empleado.id)
+    assert [t.fecha for t in turnos] == [date(2025, 12, 30), date(2026, 1, 2)]
+
+    noches = turnos_service.get_turnos_rango(db_session, date(2025, 12, 29), date(2026, 1, 5), codigos=["N"])
+    assert [(t.fecha, t.empleado_id) for t in noches] == [
+        (date(2025, 12, 30), empleado.id), (date(2025, 12, 31), otro.id), (date(2026, 1, 2), otro.id)
+    ]
+
+    cobertura = turnos_service.get_cobertura_rango(db_session, date(2026, 1, 1), date(2026, 1, 31))
+    assert cobertura == {date(2026, 1, 2): {"D": 1, "N": 1}}
+
+    # Filas anteriores a la columna: se rellenan en la migración
+    db_session.query(Turno).update({Turno.fecha: None})
+    db_session.commit()
+    assert turnos_service.rellenar_fechas(db_session) == 5
+    db_session.commit()
+    assert db_session.query(Turno).filter(Turno.fecha.is_(None)).count() == 0
+
+
+def test_schedule_rango_varios_meses(client, db_session):
+    """Varios meses en una petición, con los mismos permisos que el cuadrante por empleado."""
+    empleado_db = _crear_usuario_con_turnos(db_session)
+    otro = Empleado(nombre_completo="Otro")
+    db_session.add(otro)
+    db_session.flush()
+    db_session.add_all([
+        Turno(empleado_id=empleado_db.id, anio=2025, mes=12, dia=31, codigo_turno="D", horas_trabajadas=12.0),
+        Turno(empleado_id=empleado_db.id, anio=2026, mes=3, dia=1, codigo_turno="N"),
+    ])
+    db_session.commit()
+    headers = _login(client)
+
+    response = client.get("/api/schedule/range?from=2025-12&to=2026-02", headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["empleado_id"] == empleado_db.id
+    assert [(m["anio"], m["mes"]) for m in data["meses"]] == [(2025, 12), (2026, 1), (2026, 2)]
+    assert data["meses"][0]["shifts"] == {"31": {"codigo": "D", "t": 12.0, "n": 0.0, "f": 0.0, "es_festivo": False}}
+    assert data["meses"][1]["shifts"] == client.get("/api/schedule/2026/1", headers=headers).json()["shifts"]
+    assert data["meses"][2]["shifts"] == {}
+
+    etag = response.headers["etag"]
+    assert client.get("/api/schedule/range?from=2025-12&to=2026-02",
+                      headers={**headers, "If-None-Match": etag}).status_code == 304
+
+    propio = client.get(f"/api/schedule/range?from=2026-01&to=2026-01&empleado_id={empleado_db.id}", headers=headers)
+    assert propio.json()["meses"][0]["shifts"]["5"]["codigo"] == "N"
+    ajeno = client.get(f"/api/schedule/range?from=2026-01&to=2026-01&empleado_id={otro.id}", headers=headers)
+    assert ajeno.status_code == 403
+
+    assert client.get("/api/schedule/range?from=2026-03&to=2026-01", headers=headers).status_code == 422
+    assert client.get("/api/schedule/range?from=2024-01&to=2026-12", headers=headers).status_code == 422
+    assert client.get("/api/schedule/range?from=2026-1-x&to=2026-02", headers=headers).status_code == 422
+
+
+def test_cuadrante_equipo_desde_bd(client, db_session):
+    """Cuadrícula del equipo: una cadena por empleado, cacheada hasta que cambia la versión."""
+    from services import version_service
+    from services.auth_service import create_user
+    from tests.test_sync import TEST_COORDINADOR
+
+    empleado_db = _crear_usuario_con_turnos(db_session)
+    otro = Empleado(nombre_completo="Álvaro")
+    db_session.add(otro)
+    db_session.flush()
+    db_session.add_all([
+        Turno(empleado_id=otro.id, anio=2026, mes=1, dia=1, codigo_turno="D"),
+        Turno(empleado_id=otro.id, anio=2026, mes=1, dia=31, codigo_turno="VAC"),
+    ])
+    db_session.commit()
+
+    assert client.get("/api/turnos/equipo/2026/1", headers=_login(client)).status_code == 403
+
+    create_user(db_session, TEST_COORDINADOR)
+    token = client.post(
+        "/api/auth/login",
+        data={"username": TEST_COORDINADOR["email"], "password": TEST_COORDINADOR["password"]}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/api/turnos/equipo/2026/1", headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["dias"] == 31
+    assert data["empleados"] == [
+        {"id": otro.id, "nombre": "Álvaro", "extra": {"31": "VAC"}, "turnos": "D" + "." * 29 + "*"},
+        {"id": empleado_db.id, "nombre": "Test User", "turnos": "....NL" + "." * 25},
+    ]
+    assert client.get("/api/turnos/equipo/2026/1",
+                      headers={**headers, "If-None-Match": response.headers["etag"]}).status_code == 304
+
+    # Sin cambio de versión se sirve la copia en memoria; tras el sync, la nueva
+    db_session.add(Turno(empleado_id=empleado_db.id, anio=2026, mes=1, dia=7, codigo_turno="N"))
+    db_session.commit()
+    assert client.get("/api/turnos/equipo/2026/1", headers=headers).json() == data
+    version_service.incrementar(db_session)
+    db_session.commit()
+    assert client.get("/api/turnos/equipo/2026/1", headers=headers).json()["empleados"][1]["turnos"] == "....NLN" + "." * 24
+
+    assert client.get("/api/turnos/equipo/2026/13", headers=headers).status_code == 422
+    assert client.get("/api/turnos/equipo/1900/1", headers=headers).status_code == 422
+
+
+def test_schedule_formato_compacto(client, db_session):
+    """?format=compact o el Accept propio devuelven los mismos datos en columnas."""
+    _crear_usuario_con_turnos(db_session)
+    headers = _login(client)
+
+    normal = client.get("/api/schedule/2026/1", headers=headers)
+    compacto = client.get("/api/schedule/2026/1?format=compact", headers=headers)
+    assert compacto.status_code == 200
+    shifts = compacto.json()["shifts"]
+    assert compacto.json()["formato"] == "compact"
+    assert shifts == {
+        "dias": [5, 6], "codigo": ["N", "L"], "t": [12.0, 0.0], "n": [8.0, 0.0], "f": [0.0, 0.0], "es_festivo": [0, 0]
+    }
+    assert len(compacto.content) < len(normal.content)
+    assert compacto.headers["etag"] != normal.headers["etag"]
+    assert "Accept" in normal.headers["vary"]
+
+    # Un mes sin datos tiene las mismas claves que uno cacheado
+    vacio = client.get("/api/schedule/2026/2?format=compact", headers=headers).json()
+    assert set(vacio) == set(compacto.json())
+    assert vacio["formato"] == "compact" and vacio["shifts"]["dias"] == []
+    assert set(client.get("/api/schedule/2026/2", headers=headers).json()) == set(normal.json())
+
+    por_accept = client.get("/api/schedule/2026/1", headers={**headers, "Accept": "application/vnd.cuadrante.compact+json"})
+    assert por_accept.json() == compacto.json()
+    assert "codigo" in client.get("/api/schedule/2026/1?format=json", headers=headers).json()["shifts"]["5"]
+
+    vacio = client.get("/api/schedule/2026/2?format=compact", headers=headers).json()
+    assert vacio["shifts"]["dias"] == []
+
+    rango = client.get("/api/schedule/range?from=2026-01&to=2026-02&format=compact", headers=headers).json()
+    assert rango["meses"][0]["shifts"] == shifts
+    assert client.get("/api/schedule/2026/1?format=xml", headers=headers).status_code == 422
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Datos del proyecto desktop
+Carga con caché de los JSON de DESKTOP_DATA_PATH (cuadrantes.json,
+turnos.json, empleados.json, festivos.json). Cada fichero se lee y se
+parsea una sola vez por cambio: en cada acceso solo se comprueba su
+mtime/tamaño con os.stat. Los índices derivados de un fichero se guardan
+junto a él y se descartan cuando el fichero cambia.
+"""
+
+from typing import Any, Callable, Dict, FrozenSet, Optional, Tuple
+from datetime import date
+import json
+import os
+import threading
+
+DESKTOP_PATH_POR_DEFECTO = "../../proyecto_modulo_cuadrante/datos_cuadrante"
+
+_lock = threading.Lock()
+# ruta -> (firma (mtime_ns, tamaño), datos, índices)
+_cache: Dict[str, Tuple[Tuple[int, int], Any, Dict[str, Any]]] = {}
+
+
+def ruta_desktop(archivo: str) -> str:
+    """Ruta completa de un fichero del proyecto desktop"""
+    desktop_path = os.getenv("DESKTOP_DATA_PATH", DESKTOP_PATH_POR_DEFECTO)
+    return os.path.join(desktop_path, archivo)
+
+
+def _entrada(archivo: str) -> Optional[Tuple[Tuple[int, int], Any, Dict[str, Any]]]:
+    """Entrada de caché vigente del fichero (None si no existe)"""
+    ruta = ruta_desktop(archivo)
+    try:
+        stat = os.stat(ruta)
+    except FileNotFoundError:
+        _cache.pop(ruta, None)
+        return None
+    firma = (stat.st_mtime_ns, stat.st_size)
+
+    entrada = _cache.get(ruta)
+    if entrada and entrada[0] == firma:
+        return entrada
+
+    with _lock:
+        entrada = _cache.get(ruta)
+        if entrada and entrada[0] == firma:
+            return entrada
+        try:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                datos = json.load(f)
+        except FileNotFoundError:
+            return None
+        entrada = (firma, datos, {})
+        _cache[ruta] = entrada
+        return entrada
+
+
+def cargar_datos_desktop(archivo: str) -> dict:
+    """
+    Carga datos desde los JSON del proyecto desktop ({} si no existe).
+    El resultado es compartido entre peticiones: no modificarlo.
+    """
+    entrada = _entrada(archivo)
+    return entrada[1] if entrada else {}
+
+
+def obtener_indice(archivo: str, nombre: str, construir: Callable[[Any], Any]) -> Any:
+    """
+    Índice derivado de un fichero, construido con construir(datos) la primera
+    vez y reutilizado hasta que el fichero cambie.
+    """
+    entrada = _entrada(archivo)
+    datos = entrada[1] if entrada else {}
+    if entrada is None:
+        return construir(datos)
+
+    indices = entrada[2]
+    if nombre not in indices:
+        indices[nombre] = construir(datos)
+    return indices[nombre]
+
+
+def indice_cuadrantes(cuadrantes: dict) -> Dict[Tuple[str, str], Dict[str, dict]]:
+    """(anio, mes) -> nombre del vigilante -> sus datos del mes"""
+    return {
+        (anio, mes): {v.get("nombre"): v for v in vigilantes}
+        for anio, meses in cuadrantes.items() if isinstance(meses, dict)
+        for mes, vigilantes in meses.items() if isinstance(vigilantes, list)
+    }
+
+
+def vigilante_mes(anio: int, mes: int, nombre: str) -> Optional[dict]:
+    """Datos de un vigilante en un mes de cuadrantes.json (None si no está)"""
+    indice = obtener_indice("cuadrantes.json", "por_mes", indice_cuadrantes)
+    return indice.get((str(anio), str(mes)), {}).get(nombre)
+
+
+def indice_festivos(festivos: dict) -> FrozenSet[date]:
+    """Fechas festivas de festivos.json ({anio: {mes: [dias]}})"""
+    fechas = set()
+    for anio, meses in festivos.items():
+        if not (str(anio).isdigit() and isinstance(meses, dict)):
+            continue
+        for mes, dias in meses.items():
+            for dia in dias or []:
+                try:
+                    fechas.add(date(int(anio), int(mes), int(dia)))
+                except (TypeError, ValueError):
+                    continue
+    return frozenset(fechas)
+
+
+def fechas_festivas() -> FrozenSet[date]:
+    """Conjunto de fechas festivas del desktop"""
+    return obtener_indice("festivos.json", "fechas", indice_festivos)
+
+
+def limpiar_cache() -> None:
+    """Descarta todos los ficheros cacheados"""
+    with _lock:
+        _cache.clear()
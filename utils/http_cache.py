@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Utilidades de caché HTTP
+ETag / If-None-Match, Last-Modified / If-Modified-Since y negociación gzip
+"""
+
+from fastapi import Request, Response, Depends
+from sqlalchemy.orm import Session
+from typing import Optional
+from datetime import datetime, date, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import hashlib
+
+from models.database import get_db
+from services import version_service
+
+# El cliente debe revalidar siempre, pero puede reutilizar el cuerpo si recibe 304
+CACHE_CONTROL = "private, no-cache"
+# La respuesta depende del usuario (token), de la codificación y del formato pedido
+VARY = "Accept, Accept-Encoding, Authorization"
+
+# Formato compacto (columnas) de los cuadrantes: ?format=compact o este Accept
+FORMATO_COMPACTO = "compact"
+MEDIA_TYPE_COMPACTO = "application/vnd.cuadrante.compact+json"
+
+
+def etag_coincide(if_none_match: Optional[str], etag: str) -> bool:
+    """Comprueba si alguna de las ETags de If-None-Match coincide (comparación débil)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    objetivo = etag[2:] if etag.startswith("W/") else etag
+    for candidata in if_none_match.split(","):
+        candidata = candidata.strip()
+        if candidata.startswith("W/"):
+            candidata = candidata[2:]
+        if candidata == objetivo:
+            return True
+    return False
+
+
+def fecha_http(fecha: datetime) -> str:
+    """Formatea una fecha UTC (naive) como fecha HTTP"""
+    return format_datetime(fecha.replace(microsecond=0, tzinfo=timezone.utc), usegmt=True)
+
+
+def no_modificado_desde(if_modified_since: Optional[str], ultima_modificacion: Optional[datetime]) -> bool:
+    """Comprueba If-Modified-Since contra la fecha de última modificación (naive UTC)"""
+    if not if_modified_since or not ultima_modificacion:
+        return False
+    try:
+        desde = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if desde.tzinfo is not None:
+        desde = desde.astimezone(timezone.utc).replace(tzinfo=None)
+    return ultima_modificacion.replace(microsecond=0) <= desde
+
+
+def es_no_modificado(request: Request, etag: str, ultima_modificacion: Optional[datetime]) -> bool:
+    """If-None-Match tiene prioridad; If-Modified-Since solo se evalúa si no viene"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_coincide(if_none_match, etag)
+    return no_modificado_desde(request.headers.get("if-modified-since"), ultima_modificacion)
+
+
+def cabeceras_cache(etag: str, ultima_modificacion: Optional[datetime]) -> dict:
+    """Cabeceras de validación comunes"""
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": VARY}
+    if ultima_modificacion:
+        headers["Last-Modified"] = fecha_http(ultima_modificacion)
+    return headers
+
+
+def acepta_gzip(request: Request) -> bool:
+    """¿El cliente acepta respuestas comprimidas con gzip?"""
+    return "gzip" in request.headers.get("accept-encoding", "").lower()
+
+
+def pide_formato_compacto(request: Request, formato: Optional[str] = None) -> bool:
+    """¿El cliente pide el formato compacto (parámetro format o cabecera Accept)?"""
+    if formato is not None:
+        return formato == FORMATO_COMPACTO
+    return MEDIA_TYPE_COMPACTO in request.headers.get("accept", "").lower()
+
+
+def respuesta_documento(request: Request, documento) -> Response:
+    """
+    Sirve un DocumentoCache tal cual (bytes pre-serializados) con ETag fuerte.
+    Devuelve 304 si el cliente ya tiene esa versión.
+    """
+    usar_gzip = documento.contenido_gzip is not None and acepta_gzip(request)
+    # Cada codificación es una representación distinta: ETag distinta
+    etag = f'"{documento.etag}-gzip"' if usar_gzip else f'"{documento.etag}"'
+    headers = cabeceras_cache(etag, documento.generado)
+
+    if es_no_modificado(request, etag, documento.generado):
+        return Response(status_code=304, headers=headers)
+
+    if usar_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=documento.contenido_gzip, media_type="application/json", headers=headers)
+    return Response(content=documento.contenido, media_type="application/json", headers=headers)
+
+
+class ValidadoresCache:
+    """Resultado de CacheVersion para un endpoint concreto"""
+
+    def __init__(self, etag: str, ultima_modificacion: Optional[datetime], no_modificado: bool):
+        self.etag = etag
+        self.ultima_modificacion = ultima_modificacion
+        self.no_modificado = no_modificado
+
+    def respuesta_304(self) -> Response:
+        """Respuesta vacía para un cliente que ya tiene la versión actual"""
+        return Response(status_code=304, headers=cabeceras_cache(self.etag, self.ultima_modificacion))
+
+
+class CacheVersion:
+    """
+    Dependencia que deriva ETag/Last-Modified del contador de versión de
+    los datos (se incrementa en cada sync y en cada cambio de estado de
+    permutas/vacaciones). Añade las cabeceras a la respuesta y marca si el
+    cliente ya tiene la versión actual, para que el endpoint devuelva 304
+    sin consultar nada más.
+
+    Con diario=True la respuesta depende además de la fecha de hoy
+    (p. ej. próximos turnos), así que el validador cambia cada día.
+    """
+
+    def __init__(self, diario: bool = False):
+        self.diario = diario
+
+    def __call__(
+        self,
+        request: Request,
+        response: Response,
+        db: Session = Depends(get_db)
+    ) -> ValidadoresCache:
+        version, actualizado = version_service.obtener(db)
+
+        # La ETag distingue usuario (token), ruta, parámetros y formato pedido
+        clave = "|".join([
+            request.headers.get("authorization", ""),
+            request.url.path,
+            str(request.url.query),
+            request.headers.get("accept", ""),
+        ])
+        if self.diario:
+            hoy = date.today()
+            clave += f"|{hoy.isoformat()}"
+            inicio_dia = datetime(hoy.year, hoy.month, hoy.day)
+            actualizado = max(actualizado, inicio_dia) if actualizado else inicio_dia
+
+        digest = hashlib.sha256(clave.encode("utf-8")).hexdigest()[:16]
+        etag = f'W/"v{version}-{digest}"'
+
+        for nombre, valor in cabeceras_cache(etag, actualizado).items():
+            response.headers[nombre] = valor
+        return ValidadoresCache(etag, actualizado, es_no_modificado(request, etag, actualizado))
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Lectura incremental de NDJSON (un objeto JSON por línea)
+Descomprime gzip por trozos y corta en líneas según llegan los bytes, de
+modo que la memoria depende del tamaño de una línea y no del cuerpo entero.
+"""
+
+from typing import Any, AsyncIterator, Optional, Tuple
+import json
+import zlib
+
+# Tamaño máximo de una línea (un mes de un vigilante ocupa unos pocos KB)
+MAX_LINEA_BYTES = 1024 * 1024
+# Bytes descomprimidos como máximo por llamada a zlib
+TROZO_DESCOMPRIMIDO = 64 * 1024
+
+
+class ErrorNDJSON(ValueError):
+    """Cuerpo NDJSON no válido; numero_linea indica dónde (1 = primera)"""
+
+    def __init__(self, mensaje: str, numero_linea: Optional[int] = None):
+        super().__init__(f"Línea {numero_linea}: {mensaje}" if numero_linea else mensaje)
+        self.numero_linea = numero_linea
+
+
+async def _descomprimir(trozos: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Descomprime gzip por trozos acotados (protege de bombas de compresión)"""
+    descompresor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    async for trozo in trozos:
+        datos = trozo
+        while datos:
+            try:
+                salida = descompresor.decompress(datos, TROZO_DESCOMPRIMIDO)
+            except zlib.error as e:
+                raise ErrorNDJSON(f"contenido gzip no válido ({e})") from e
+            if salida:
+                yield salida
+            datos = descompresor.unconsumed_tail
+    restante = descompresor.flush()
+    if restante:
+        yield restante
+    if not descompresor.eof:
+        raise ErrorNDJSON("contenido gzip truncado")
+
+
+async def leer_ndjson(
+    trozos: AsyncIterator[bytes],
+    gzip: bool = False,
+    max_linea: int = MAX_LINEA_BYTES
+) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Devuelve (número de línea, objeto) por cada línea no vacía del cuerpo.
+    ErrorNDJSON si una línea no es JSON válido o supera max_linea bytes.
+    """
+    if gzip:
+        trozos = _descomprimir(trozos)
+
+    pendiente = b""
+    numero = 0
+    async for trozo in trozos:
+        pendiente += trozo
+        *lineas, pendiente = pendiente.split(b"\n")
+        for linea in lineas:
+            numero += 1
+            if len(linea) > max_linea:
+                raise ErrorNDJSON("línea demasiado larga", numero)
+            if linea.strip():
+                yield numero, _parsear(linea, numero)
+        if len(pendiente) > max_linea:
+            raise ErrorNDJSON("línea demasiado larga", numero + 1)
+
+    if pendiente.strip():
+        numero += 1
+        yield numero, _parsear(pendiente, numero)
+
+
+def _parsear(linea: bytes, numero: int) -> Any:
+    try:
+        return json.loads(linea)
+    except ValueError as e:
+        raise ErrorNDJSON(f"JSON no válido ({e})", numero) from e
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Paginación por cursor (keyset)
+El cursor codifica la clave de ordenación de la última fila devuelta; la
+página siguiente se pide con WHERE (clave) < (cursor), que usa el índice
+y cuesta lo mismo en la primera página que en la milésima.
+"""
+
+from sqlalchemy import literal, tuple_
+from sqlalchemy.orm import Query
+from typing import Any, List, Optional, Sequence, Tuple
+from datetime import date, datetime
+import base64
+import json
+
+# Cabecera con el cursor de la página siguiente (ausente en la última página)
+CABECERA_CURSOR = "X-Next-Cursor"
+
+
+def codificar_cursor(*valores: Any) -> str:
+    """Cursor opaco a partir de los valores de la clave de ordenación"""
+    datos = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in valores]
+    return base64.urlsafe_b64encode(json.dumps(datos, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+def decodificar_cursor(cursor: str) -> List[Any]:
+    """Valores de un cursor; ValueError si no es válido"""
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("Cursor no válido") from e
+    if not isinstance(datos, list):
+        raise ValueError("Cursor no válido")
+    return datos
+
+
+def _valor_columna(col: Any, valor: Any) -> Any:
+    """Valor de un cursor convertido al tipo Python de su columna"""
+    tipo = col.type.python_type
+    if tipo in (date, datetime):
+        return tipo.fromisoformat(valor)
+    return tipo(valor)
+
+
+def paginar(
+    query: Query,
+    columnas: Sequence[Any],
+    limit: int,
+    cursor: Optional[str] = None,
+    descendente: bool = False
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Página de una consulta ordenada por las columnas indicadas (la última
+    debe ser única, p. ej. el id). Devuelve (filas, cursor de la página
+    siguiente o None). ValueError si el cursor no es válido.
+    """
+    if cursor:
+        valores = decodificar_cursor(cursor)
+        if len(valores) != len(columnas):
+            raise ValueError("Cursor no válido")
+        try:
+            valores = [
+                _valor_columna(col, v) for col, v in zip(columnas, valores)
+            ]
+        except (TypeError, ValueError) as e:
+            raise ValueError("Cursor no válido") from e
+        clave = tuple_(*columnas)
+        valores_cursor = tuple_(*[literal(v, col.type) for col, v in zip(columnas, valores)])
+        query = query.filter(clave < valores_cursor if descendente else clave > valores_cursor)
+
+    orden = [c.desc() for c in columnas] if descendente else list(columnas)
+    filas = query.order_by(*orden).limit(limit + 1).all()
+    if len(filas) <= limit:
+        return filas, None
+    filas = filas[:limit]
+    ultima = filas[-1]
+    return filas, codificar_cursor(*[getattr(ultima, col.key) for col in columnas])
+
+
+def paginar_por_fecha(
+    query: Query,
+    col_fecha,
+    col_id,
+    limit: int,
+    cursor: Optional[str] = None
+) -> Tuple[List[Any], Optional[str]]:
+    """Página de una consulta ordenada por (fecha, id) descendente (más reciente primero)"""
+    return paginar(query, [col_fecha, col_id], limit, cursor, descendente=True)
@@ -1,10 +1,13 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime, timedelta
-from typing import Optional, Union, Any
+from typing import Optional, Union, Any, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
 from jose import jwt
 from passlib.context import CryptContext
 from passlib.exc import UnknownHashError
+import multiprocessing
 import os
+import threading
 from pydantic import ValidationError
 
 # Configuración
@@ -12,6 +15,9 @@ SECRET_KEY = os.getenv("SECRET_KEY", "clave_temporal_desarrollo")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 10080  # 7 días
 
+# A partir de cuántas contraseñas merece la pena repartir el hash entre procesos
+HASH_PARALELO_MINIMO = 4
+
 # Contexto de encriptación de contraseñas (SHA256 por compatibilidad)
 pwd_context = CryptContext(schemes=["sha256_crypt"], deprecated="auto")
 
@@ -32,6 +38,51 @@ def get_password_hash(password: str) -> str:
     """Genera hash de contraseña"""
     return pwd_context.hash(password)
 
+_pool_hash: Optional[ProcessPoolExecutor] = None
+_pool_hash_lock = threading.Lock()
+
+def _get_pool_hash() -> ProcessPoolExecutor:
+    """
+    Pool de procesos compartido, creado la primera vez que se necesita.
+    Usa "spawn": las sincronizaciones corren en hilos (threadpool o
+    trabajador de jobs) y hacer fork de un proceso con hilos puede dejar
+    locks tomados en el hijo.
+    """
+    global _pool_hash
+    with _pool_hash_lock:
+        if _pool_hash is None:
+            _pool_hash = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool_hash
+
+def _en_paralelo(funcion, elementos: List[Any]) -> List[Any]:
+    """
+    Aplica una función de hash a cada elemento. sha256_crypt es costoso en
+    CPU, así que con lotes grandes se reparte el trabajo en un pool de
+    procesos (el GIL impide paralelizarlo con hilos).
+    """
+    if len(elementos) < HASH_PARALELO_MINIMO:
+        return [funcion(e) for e in elementos]
+
+    workers = os.cpu_count() or 1
+    return list(_get_pool_hash().map(funcion, elementos, chunksize=max(1, len(elementos) // (workers * 4))))
+
+def _hash_si_cambia(par: Tuple[str, Optional[str]]) -> Optional[str]:
+    password, hash_actual = par
+    if hash_actual and verify_password(password, hash_actual):
+        return None
+    return get_password_hash(password)
+
+def actualizar_password_hashes(pares: List[Tuple[str, Optional[str]]]) -> List[Optional[str]]:
+    """
+    Para cada (contraseña en claro, hash guardado) devuelve None si el hash
+    ya corresponde a esa contraseña, o un hash nuevo si no. Se comprueba
+    contra el propio hash con sal (nunca con una huella rápida de la
+    contraseña, que se podría atacar por fuerza bruta).
+    """
+    return _en_paralelo(_hash_si_cambia, pares)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Crea token JWT"""
     to_encode = data.copy()